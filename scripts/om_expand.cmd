@@ -1 +1 @@
-python -m vecnet.openmalaria.bin.expand %1 %2
\ No newline at end of file
+python -m vecnet.openmalaria.bin.expand %*
\ No newline at end of file
@@ -25,6 +25,10 @@
 # else:
 #     __version__ = _dist.version
 
+import fnmatch
+import os
+from collections import OrderedDict
+
 import six
 from xml.etree import ElementTree
 if six.PY3:
@@ -38,15 +42,36 @@ from xml.etree.ElementTree import ParseError
 def get_schema_version_from_xml(xml):
     """ Get schemaVersion attribute from OpenMalaria scenario file
     xml - open file or content of xml document to be processed
+
+    Only the beginning of the document, up to the start tag of the root element, is parsed. Returns None if it is
+    not xml or if the root element has no schemaVersion attribute
     """
     if isinstance(xml, six.string_types):
         xml = StringIO(xml)
     try:
-        tree = ElementTree.parse(xml)
+        for event, root in ElementTree.iterparse(xml, events=("start",)):
+            return root.attrib.get('schemaVersion', None)
     except ParseError:
         # Not an XML file
         return None
-    root = tree.getroot()
-    return root.attrib.get('schemaVersion', None)
+    return None
+
+
+def get_schema_versions(directory, pattern="*.xml", recursive=False):
+    """ Get schemaVersion attribute of every OpenMalaria scenario file in a directory
+    pattern - shell-style pattern of file names, e.g. "scenario*.xml"
+    recursive - include files in subdirectories
+    :returns: OrderedDict {filename: schema version or None}, sorted by filename
+    """
+    filenames = []
+    for path, dirnames, files in os.walk(directory):
+        filenames.extend(os.path.join(path, name) for name in fnmatch.filter(files, pattern))
+        if not recursive:
+            break
+    versions = OrderedDict()
+    for filename in sorted(filenames):
+        with open(filename, "rb") as fp:
+            versions[filename] = get_schema_version_from_xml(fp)
+    return versions
 
 from .experiment import ExperimentSpecification
\ No newline at end of file
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Aggregation of survey output across replicate runs (e.g. different seeds) of each experiment arm.
+
+Runs are grouped by arm, i.e. by Scenario.parameters of the scenario they were generated from, except sweeps of
+replicates (e.g. a seed sweep, see aggregate(ignore=...)), and statistics are computed for every (measure, third
+dimension, survey) record with numpy, one block of records at a time.
+"""
+import math
+import warnings
+from collections import OrderedDict
+
+import numpy
+
+from .experiment import arm_key
+from .output_parser import SurveyOutputStore, SURVEY_RECORD_DTYPE
+
+DEFAULT_QUANTILES = (0.025, 0.25, 0.5, 0.75, 0.975)
+
+# Upper limit of number of values (runs x records) processed at once
+BLOCK_VALUES = 1 << 23
+
+STATISTICS = ("count", "mean", "variance", "std", "ci_low", "ci_high")
+
+try:
+    from scipy.stats import t as _student_t
+except ImportError:
+    _student_t = None
+
+
+def _normal_quantile(p):
+    """
+    Inverse of the standard normal CDF (P. J. Acklam's rational approximation, relative error < 1.2e-9)
+    """
+    a = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+    b = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01)
+    c = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+    d = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+    if p < 0.02425:
+        q = math.sqrt(-2 * math.log(p))
+        return (((((c[0]*q + c[1])*q + c[2])*q + c[3])*q + c[4])*q + c[5]) / \
+               ((((d[0]*q + d[1])*q + d[2])*q + d[3])*q + 1)
+    if p > 1 - 0.02425:
+        return -_normal_quantile(1 - p)
+    q = p - 0.5
+    r = q * q
+    return (((((a[0]*r + a[1])*r + a[2])*r + a[3])*r + a[4])*r + a[5])*q / \
+           (((((b[0]*r + b[1])*r + b[2])*r + b[3])*r + b[4])*r + 1)
+
+
+def t_critical_value(confidence, df):
+    """
+    Two-sided critical value of Student's t distribution with df degrees of freedom.
+    Uses scipy if it is installed. Otherwise exact formulas are used for df 1 and 2, and Cornish-Fisher
+    expansion around the normal quantile for df >= 3 (accurate to about 1e-2 for df = 3, 1e-4 for df >= 10)
+    """
+    p = 0.5 + confidence / 2.0
+    if _student_t is not None:
+        return float(_student_t.ppf(p, df))
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) * math.sqrt(2 / (4 * p * (1 - p)))
+    z = _normal_quantile(p)
+    return (z + (z**3 + z) / (4.0 * df) +
+            (5 * z**5 + 16 * z**3 + 3 * z) / (96.0 * df**2) +
+            (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384.0 * df**3) +
+            (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160.0 * df**4))
+
+
+def _pack_keys(measure, third_dimension, survey):
+    """ Single int64 key per record, ordered by (measure, third dimension, survey) """
+    return (measure.astype(numpy.int64) << 42) | \
+           ((third_dimension.astype(numpy.int64) + (1 << 20)) << 21) | \
+           survey.astype(numpy.int64)
+
+
+def _unpack_keys(keys):
+    measure = (keys >> 42).astype(numpy.int32)
+    third_dimension = (((keys >> 21) & ((1 << 21) - 1)) - (1 << 20)).astype(numpy.int32)
+    survey = (keys & ((1 << 21) - 1)).astype(numpy.int32)
+    return measure, third_dimension, survey
+
+
+class SurveyAggregate(object):
+    """
+    Statistics of survey output of one experiment arm.
+
+    Records are laid out like SurveyOutputStore.records: columns survey, third_dimension and measure identify
+    the record, and every statistic is a numpy array with one value per record:
+      count - number of runs that have the record
+      mean, variance (unbiased), std - sample statistics across runs
+      ci_low, ci_high - Student's t confidence interval of the mean
+      quantiles - 2D array, one row per level in quantile_levels
+    Statistics that need more runs than available (e.g. variance of a single run) are NaN.
+    """
+    def __init__(self, parameters, records, survey_times, third_dimension_labels, statistics,
+                 quantile_levels, confidence, runs):
+        self.parameters = parameters
+        self.runs = runs
+        self.confidence = confidence
+        self.quantile_levels = tuple(quantile_levels)
+        self.count = statistics["count"]
+        self.mean = statistics["mean"]
+        self.variance = statistics["variance"]
+        self.std = statistics["std"]
+        self.ci_low = statistics["ci_low"]
+        self.ci_high = statistics["ci_high"]
+        self.quantiles = statistics["quantiles"]
+        # Record layout and (measure, third dimension) index are shared with a SurveyOutputStore of means
+        records = records.copy()
+        records["value"] = self.mean
+        self._store = SurveyOutputStore(records, survey_times, third_dimension_labels, presorted=True)
+
+    @property
+    def survey(self):
+        return self._store.survey
+
+    @property
+    def third_dimension(self):
+        return self._store.third_dimension
+
+    @property
+    def measure(self):
+        return self._store.measure
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __len__(self):
+        return len(self._store)
+
+    def keys(self):
+        return self._store.keys()
+
+    def get_times(self, key):
+        """ Survey timesteps of the measure """
+        return self._store.get_times(key)
+
+    def _statistic(self, statistic):
+        if statistic in STATISTICS:
+            return getattr(self, statistic)
+        try:
+            return self.quantiles[self.quantile_levels.index(statistic)]
+        except ValueError:
+            raise KeyError("Unknown statistic %s" % statistic)
+
+    def get_values(self, key, statistic="mean"):
+        """
+        Values of a statistic for the measure, in order of survey numbers.
+        statistic - one of STATISTICS or a level from quantile_levels
+        """
+        start, stop = self._store._index[key]
+        return self._statistic(statistic)[start:stop]
+
+    def to_store(self, statistic="mean"):
+        """ SurveyOutputStore with values of the statistic """
+        records = self._store.records.copy()
+        records["value"] = self._statistic(statistic)
+        return SurveyOutputStore(records, self._store.survey_times.tolist(), self._store.third_dimension_labels,
+                                 presorted=True)
+
+
+def _align(stores):
+    """
+    Align records of stores (runs of the same arm).
+    :returns: (layout records, third dimension labels, list of record positions in layout for every store)
+    Positions are None for stores with exactly the same layout as the first one (the usual case for replicates).
+    """
+    first = stores[0]
+    same_layout = [store is first or
+                   (store.third_dimension_labels == first.third_dimension_labels and
+                    len(store.records) == len(first.records) and
+                    numpy.array_equal(store.measure, first.measure) and
+                    numpy.array_equal(store.third_dimension, first.third_dimension) and
+                    numpy.array_equal(store.survey, first.survey))
+                   for store in stores]
+    if all(same_layout):
+        return first.records, first.third_dimension_labels, [None] * len(stores)
+
+    # Layouts differ: use union of records of all runs, species names are re-coded with a common list of labels
+    labels = []
+    run_keys = []
+    for store in stores:
+        codes = numpy.zeros(len(store.third_dimension_labels) + 1, dtype=numpy.int32)
+        for i, label in enumerate(store.third_dimension_labels):
+            if label not in labels:
+                labels.append(label)
+            codes[-1 - i] = -1 - labels.index(label)
+        third_dimension = store.third_dimension
+        third_dimension = numpy.where(third_dimension < 0, codes[numpy.minimum(third_dimension, 0)],
+                                      third_dimension)
+        run_keys.append(_pack_keys(store.measure, third_dimension, store.survey))
+    keys = numpy.unique(numpy.concatenate(run_keys))
+    records = numpy.zeros(len(keys), dtype=SURVEY_RECORD_DTYPE)
+    records["measure"], records["third_dimension"], records["survey"] = _unpack_keys(keys)
+    positions = [numpy.searchsorted(keys, key) for key in run_keys]
+    return records, labels, positions
+
+
+def _block_statistics(values, quantile_levels):
+    """ Statistics along the first axis of values (runs x records). Missing values are NaN """
+    missing = numpy.isnan(values)
+    with warnings.catch_warnings(), numpy.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if missing.any():
+            count = (~missing).sum(axis=0)
+            mean = numpy.nansum(values, axis=0) / count
+            squares = numpy.nansum((values - mean) ** 2, axis=0)
+            percentile = numpy.nanpercentile
+        else:
+            count = numpy.full(values.shape[1], values.shape[0])
+            mean = values.mean(axis=0)
+            squares = ((values - mean) ** 2).sum(axis=0)
+            percentile = numpy.percentile
+        variance = numpy.where(count > 1, squares / (count - 1), numpy.nan)
+        quantiles = percentile(values, [level * 100 for level in quantile_levels], axis=0) \
+            if quantile_levels else numpy.empty((0, values.shape[1]))
+    return count, mean, variance, quantiles
+
+
+def aggregate_runs(stores, quantiles=DEFAULT_QUANTILES, confidence=0.95, parameters=None):
+    """
+    Compute statistics of survey output across runs of the same arm.
+
+    :param stores: list of SurveyOutputStore (OutputParser(..., columnar=True).survey_output_data), one per run
+    :param quantiles: quantile levels, between 0 and 1
+    :param confidence: confidence level of ci_low and ci_high
+    :param parameters: Scenario.parameters of the arm, stored in SurveyAggregate.parameters
+    :rtype: SurveyAggregate
+    """
+    if not stores:
+        raise ValueError("At least one run is required")
+    records, labels, positions = _align(stores)
+    count = len(records)
+    runs = len(stores)
+    statistics = {"count": numpy.zeros(count, dtype=numpy.int64),
+                  "mean": numpy.empty(count),
+                  "variance": numpy.empty(count),
+                  "quantiles": numpy.empty((len(quantiles), count))}
+
+    # Only block_size records of every run are held in memory at once
+    block_size = max(1, BLOCK_VALUES // runs)
+    values = numpy.empty((runs, min(block_size, count)))
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        block = values[:, :stop - start]
+        for i, (store, position) in enumerate(zip(stores, positions)):
+            if position is None:
+                block[i] = store.value[start:stop]
+            else:
+                # Scatter this run's records into the block, records missing in this run stay NaN
+                block[i] = numpy.nan
+                selected = (position >= start) & (position < stop)
+                block[i, position[selected] - start] = store.value[selected]
+        (statistics["count"][start:stop], statistics["mean"][start:stop],
+         statistics["variance"][start:stop], statistics["quantiles"][:, start:stop]) = \
+            _block_statistics(block, quantiles)
+
+    statistics["std"] = numpy.sqrt(statistics["variance"])
+    margin = numpy.full(count, numpy.nan)
+    for n in numpy.unique(statistics["count"]).tolist():
+        if n > 1:
+            selected = statistics["count"] == n
+            margin[selected] = t_critical_value(confidence, n - 1) * statistics["std"][selected] / math.sqrt(n)
+    statistics["ci_low"] = statistics["mean"] - margin
+    statistics["ci_high"] = statistics["mean"] + margin
+    return SurveyAggregate(parameters, records, stores[0].survey_times.tolist(), labels, statistics,
+                           quantiles, confidence, runs)
+
+
+def aggregate(runs, quantiles=DEFAULT_QUANTILES, confidence=0.95, ignore=()):
+    """
+    Group runs by experiment arm and compute statistics of survey output for every arm.
+
+    :param runs: iterable of (parameters, survey output) pairs, where parameters is Scenario.parameters of the
+    scenario of the run (arm name for every sweep) and survey output is a SurveyOutputStore or a
+    batch.ParsedOutput. Failed ParsedOutputs are skipped
+    :param ignore: names of sweeps that are not part of arms, e.g. ["seed"] if replicates are arms of a seed sweep.
+    Runs that differ only in these sweeps are replicates of the same arm
+    :returns: OrderedDict {arm_key(parameters): SurveyAggregate}, in order of first appearance of arms.
+    Parameters don't include ignored sweeps
+    """
+    arms = OrderedDict()
+    ignore = frozenset(ignore)
+    for parameters, output in runs:
+        if not isinstance(output, SurveyOutputStore):
+            if not output.ok:
+                continue
+            output = output.survey
+        if ignore and parameters is not None:
+            parameters = dict((sweep, arm) for sweep, arm in parameters.items() if sweep not in ignore)
+        key = arm_key(parameters)
+        if key not in arms:
+            arms[key] = (parameters, [])
+        arms[key][1].append(output)
+    return OrderedDict((key, aggregate_runs(stores, quantiles, confidence, parameters))
+                       for key, (parameters, stores) in arms.items())
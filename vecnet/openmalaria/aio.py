@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+asyncio counterparts of scenario generation, simulation runs and output parsing (Python 3 only).
+
+Scenario generation and output parsing are done in an executor, simulations are run as asyncio subprocesses,
+so the event loop is never blocked for long. Concurrency is limited by asyncio.Semaphore objects shared by the
+caller. On Windows, subprocesses require ProactorEventLoop (the default event loop since Python 3.8).
+"""
+import asyncio
+import os
+
+from .batch import SCENARIO_FILENAME, parse_output
+from .runner import (DEFAULT_COMMAND, STDOUT_FILENAME, STDERR_FILENAME, SimulationResult, attempt_error,
+                     format_command, remove_outputs)
+
+_END = object()
+
+# Event loop of the running coroutine (get_event_loop() is deprecated there since Python 3.10)
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+class ScenarioIterator(object):
+    """
+    Asynchronous iterator over scenarios of an experiment:
+
+        async for scenario in ScenarioIterator(experiment, generate_seed=True):
+            ...
+
+    Scenarios are generated in an executor, batch_size at a time.
+    Keyword arguments are passed to ExperimentSpecification.scenarios()
+    """
+    def __init__(self, experiment, batch_size=16, executor=None, **kwargs):
+        self._scenarios = experiment.scenarios(**kwargs)
+        self._batch_size = batch_size
+        self._executor = executor
+        self._batch = []
+
+    def _next_batch(self):
+        batch = []
+        for scenario in self._scenarios:
+            batch.append(scenario)
+            if len(batch) == self._batch_size:
+                break
+        if not batch:
+            batch.append(_END)
+        # Scenarios are returned with pop()
+        batch.reverse()
+        return batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._batch:
+            self._batch = await _running_loop().run_in_executor(self._executor, self._next_batch)
+        if self._batch[-1] is _END:
+            raise StopAsyncIteration
+        return self._batch.pop()
+
+
+def _write_scenario(directory, data):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, SCENARIO_FILENAME), "wb") as fp:
+        fp.write(data)
+
+
+async def run_scenario(scenario, directory, command=DEFAULT_COMMAND, timeout=None, retries=0, semaphore=None,
+                       executor=None):
+    """
+    Run simulation of a scenario in working directory, see runner.run_simulation.
+    :param scenario: experiment.Scenario
+    :param semaphore: asyncio.Semaphore limiting the number of simulations running at the same time
+    :param executor: executor for file operations (default executor of the event loop by default)
+    :rtype: SimulationResult
+    """
+    loop = _running_loop()
+    directory = os.path.abspath(directory)
+    name = os.path.basename(directory)
+    result = SimulationResult(name, directory, dict(scenario.parameters or {}), scenario.seed)
+    arguments = format_command(command, scenario=os.path.join(directory, SCENARIO_FILENAME), directory=directory,
+                               name=name)
+    await loop.run_in_executor(executor, _write_scenario, directory, scenario.xml.encode("utf-8"))
+    if semaphore is None:
+        await _run_attempts(result, arguments, timeout, retries, executor)
+    else:
+        async with semaphore:
+            await _run_attempts(result, arguments, timeout, retries, executor)
+    result.status = "done" if result.error is None else "failed"
+    return result
+
+
+async def _run_attempts(result, arguments, timeout, retries, executor):
+    loop = _running_loop()
+    for attempt in range(1, retries + 2):
+        result.attempts = attempt
+        await loop.run_in_executor(executor, remove_outputs, result.directory)
+        with open(os.path.join(result.directory, STDOUT_FILENAME), "wb") as stdout, \
+                open(os.path.join(result.directory, STDERR_FILENAME), "wb") as stderr:
+            try:
+                process = await asyncio.create_subprocess_exec(*arguments, cwd=result.directory, stdout=stdout,
+                                                               stderr=stderr)
+            except OSError as e:
+                # Simulator not found or not executable, no point in trying again
+                result.error = "Can't start %s: %s" % (arguments[0], e)
+                return
+            try:
+                result.returncode = await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                result.returncode, result.error = None, "Timeout after %s seconds" % timeout
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+            else:
+                result.error = await loop.run_in_executor(executor, attempt_error, result.directory,
+                                                          result.returncode)
+        if result.error is None:
+            return
+
+
+async def parse(path, cache_dir=None, semaphore=None, executor=None):
+    """
+    Parse output of a simulation in an executor, see batch.parse_output.
+    Parsing is CPU bound, so use a concurrent.futures.ProcessPoolExecutor to parse outputs in parallel
+    :param path: simulation directory or (scenario, survey output, cts output) filename tuple
+    :param semaphore: asyncio.Semaphore limiting the number of outputs parsed (and kept in memory) at the same time
+    :rtype: ParsedOutput
+    """
+    loop = _running_loop()
+    if semaphore is None:
+        return await loop.run_in_executor(executor, parse_output, path, cache_dir)
+    async with semaphore:
+        return await loop.run_in_executor(executor, parse_output, path, cache_dir)
+
+
+async def run_experiment(experiment, directory, command=DEFAULT_COMMAND, concurrency=8, timeout=None, retries=0,
+                         generate_seed=False, parse_results=True, parse_concurrency=4, cache_dir=None,
+                         executor=None, parse_executor=None):
+    """
+    Run all simulations of an experiment, at most `concurrency` at a time, and parse their outputs.
+    Working directories are named as in runner.run_experiment. Unlike runner.run_experiment, there is no state file
+    :returns: list of SimulationResult, in order of scenarios
+    """
+    simulations = asyncio.Semaphore(concurrency)
+    parsers = asyncio.Semaphore(parse_concurrency)
+    # Scenarios waiting for a simulation slot are not generated ahead of time
+    pending = asyncio.Semaphore(concurrency * 2)
+
+    async def run(scenario):
+        try:
+            result = await run_scenario(scenario, os.path.join(directory, "scenario%s" % (scenario.index + 1)),
+                                        command, timeout, retries, simulations, executor)
+        finally:
+            pending.release()
+        if parse_results and result.ok:
+            result.output = await parse(result.directory, cache_dir, parsers, parse_executor)
+        return result
+
+    tasks = []
+    try:
+        async for scenario in ScenarioIterator(experiment, executor=executor, generate_seed=generate_seed):
+            await pending.acquire()
+            tasks.append(asyncio.ensure_future(run(scenario)))
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
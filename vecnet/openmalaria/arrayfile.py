@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Simple versioned container for named numpy arrays.
+
+File layout:
+  magic (8 bytes) | format version (uint32) | header length (uint32) | JSON header | aligned raw array data
+
+JSON header contains user's metadata and name, dtype, shape and offset of every array. Arrays are stored
+in C order and aligned to ALIGNMENT bytes, so they can be memory-mapped without copying.
+"""
+import json
+import os
+import struct
+import tempfile
+import numpy
+
+MAGIC = b"OMARRAY\0"
+VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+
+try:
+    _replace = os.replace
+except AttributeError:
+    # Python 2
+    _replace = os.rename
+
+
+class ArrayFileError(Exception):
+    pass
+
+
+def _descr_to_dtype(descr):
+    if isinstance(descr, list):
+        # Structured dtype: JSON turns [(name, type), ...] into [[name, type], ...]
+        return numpy.dtype([tuple(_descr_to_dtype(item) if isinstance(item, list) else item for item in field)
+                            for field in descr])
+    return numpy.dtype(descr)
+
+
+def _dtype_to_descr(dtype):
+    if dtype.names is not None:
+        return dtype.descr
+    return dtype.str
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_arrays(filename, arrays, metadata=None):
+    """
+    Save arrays to filename.
+    arrays - list of (name, array) pairs or a dict
+    metadata - json-serializable object stored in the header
+
+    The file is written under a temporary name and renamed, so readers never see a partially written file.
+    """
+    if isinstance(arrays, dict):
+        arrays = list(arrays.items())
+    arrays = [(name, numpy.ascontiguousarray(array)) for name, array in arrays]
+    entries = []
+    offset = 0
+    for name, array in arrays:
+        offset = _align(offset)
+        entries.append({"name": name,
+                        "dtype": _dtype_to_descr(array.dtype),
+                        "shape": list(array.shape),
+                        "offset": offset})
+        offset += array.nbytes
+    header = json.dumps({"metadata": metadata, "arrays": entries}).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_filename = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+            fp.write(header)
+            for entry, (name, array) in zip(entries, arrays):
+                fp.seek(data_start + entry["offset"])
+                fp.write(array.tobytes())
+            fp.truncate(data_start + offset)
+        os.chmod(temp_filename, 0o644)
+        _replace(temp_filename, filename)
+    except Exception:
+        os.remove(temp_filename)
+        raise
+
+
+def read_header(filename):
+    """
+    :returns: (metadata, list of array entries, offset of array data)
+    """
+    with open(filename, "rb") as fp:
+        preamble = fp.read(_PREAMBLE.size)
+        if len(preamble) != _PREAMBLE.size:
+            raise ArrayFileError("%s is not an array file" % filename)
+        magic, version, header_length = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ArrayFileError("%s is not an array file" % filename)
+        if version != VERSION:
+            raise ArrayFileError("Unsupported array file version %s" % version)
+        header = json.loads(fp.read(header_length).decode("utf-8"))
+    return header["metadata"], header["arrays"], _align(_PREAMBLE.size + header_length)
+
+
+def read_arrays(filename, names=None, mmap_mode="r"):
+    """
+    Load arrays from filename.
+    names - load only these arrays (column projection); all arrays by default
+    mmap_mode - mode for numpy.memmap ("r", "c"), or None to read arrays into memory
+
+    :returns: (metadata, dict {name: array})
+    """
+    metadata, entries, data_start = read_header(filename)
+    arrays = {}
+    for entry in entries:
+        if names is not None and entry["name"] not in names:
+            continue
+        dtype = _descr_to_dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        offset = data_start + entry["offset"]
+        if mmap_mode is None or numpy.prod(shape) == 0:
+            # Empty arrays can't be memory-mapped
+            with open(filename, "rb") as fp:
+                fp.seek(offset)
+                count = int(numpy.prod(shape))
+                array = numpy.fromfile(fp, dtype=dtype, count=count).reshape(shape)
+        else:
+            array = numpy.memmap(filename, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+        arrays[entry["name"]] = array
+    if names is not None:
+        missing = set(names) - set(arrays)
+        if missing:
+            raise KeyError(", ".join(sorted(missing)))
+    return metadata, arrays
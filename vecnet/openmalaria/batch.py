@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Parsing outputs of many simulations in parallel.
+"""
+import multiprocessing
+import os
+import traceback
+
+import six
+
+from .export import export_cts, export_survey
+from .output_parser import OutputParser
+
+SCENARIO_FILENAME = "scenario.xml"
+SURVEY_OUTPUT_FILENAME = "output.txt"
+CTS_OUTPUT_FILENAME = "ctsout.txt"
+
+
+class ParsedOutput(object):
+    """
+    Columnar output of a single simulation, as returned by parse_many.
+
+    survey - SurveyOutputStore, or None if there is no survey output file
+    cts - OrderedDict {measure: numpy array}, or None if there is no continuous output file
+    error - traceback of the exception raised while parsing this simulation, None on success
+    """
+    def __init__(self, path, survey=None, cts=None, survey_time_list=None, error=None):
+        self.path = path
+        self.survey = survey
+        self.cts = cts
+        self.survey_time_list = survey_time_list
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "<ParsedOutput %s%s>" % (self.path, "" if self.ok else " (failed)")
+
+
+def _input_files(path):
+    """
+    Resolve (scenario, survey output, cts output) filenames for path.
+    path is either a simulation directory or a tuple of filenames (survey and cts output may be None)
+    """
+    if isinstance(path, six.string_types):
+        survey_output_file = os.path.join(path, SURVEY_OUTPUT_FILENAME)
+        cts_output_file = os.path.join(path, CTS_OUTPUT_FILENAME)
+        return (os.path.join(path, SCENARIO_FILENAME),
+                survey_output_file if os.path.exists(survey_output_file) else None,
+                cts_output_file if os.path.exists(cts_output_file) else None)
+    scenario_file, survey_output_file, cts_output_file = path
+    return scenario_file, survey_output_file, cts_output_file
+
+
+def parse_output(path, cache_dir=None):
+    """
+    Parse output of one simulation into a ParsedOutput. Never raises; errors are reported in ParsedOutput.error
+    """
+    try:
+        scenario_file, survey_output_file, cts_output_file = _input_files(path)
+        files = [open(filename) if filename is not None else None
+                 for filename in (scenario_file, survey_output_file, cts_output_file)]
+        try:
+            output_parser = OutputParser(files[0], survey_output_file=files[1], cts_output_file=files[2],
+                                         columnar=True, lazy=True, cache_dir=cache_dir)
+            return ParsedOutput(path,
+                                survey=output_parser.survey_output_data if files[1] is not None else None,
+                                cts=output_parser.cts_output_data if files[2] is not None else None,
+                                survey_time_list=output_parser.survey_time_list)
+        finally:
+            for fp in files:
+                if fp is not None:
+                    fp.close()
+    except Exception:
+        return ParsedOutput(path, error=traceback.format_exc())
+
+
+def _parse_indexed(args):
+    index, path, cache_dir = args
+    return index, parse_output(path, cache_dir)
+
+
+def parse_many(paths, workers=None, cache_dir=None, progress=None, chunksize=1):
+    """
+    Parse outputs of many simulations using a pool of worker processes.
+
+    :param paths: list of simulation directories (with scenario.xml, output.txt and ctsout.txt files) or
+    (scenario, survey output, cts output) filename tuples
+    :param workers: number of worker processes (number of CPUs by default). 1 parses in the current process
+    :param cache_dir: OutputParser binary cache directory, see OutputParser
+    :param progress: function called as progress(done, total, parsed_output) every time a simulation is parsed
+    :param chunksize: number of simulations sent to a worker at once
+    :returns: list of ParsedOutput, in order of paths. Failed simulations have ParsedOutput.error set
+    """
+    paths = list(paths)
+    total = len(paths)
+    results = [None] * total
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    tasks = [(index, path, cache_dir) for index, path in enumerate(paths)]
+
+    def collect(parsed_results):
+        done = 0
+        for index, parsed_output in parsed_results:
+            results[index] = parsed_output
+            done += 1
+            if progress is not None:
+                progress(done, total, parsed_output)
+
+    if workers <= 1 or total <= 1:
+        collect(six.moves.map(_parse_indexed, tasks))
+        return results
+
+    pool = multiprocessing.Pool(min(workers, total))
+    try:
+        # Survey and continuous output are numpy arrays, so results are cheap to pickle
+        collect(pool.imap_unordered(_parse_indexed, tasks, chunksize=chunksize))
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def export_many(results, survey_filename=None, cts_filename=None, format=None):
+    """
+    Save outputs of many simulations to columnar files, see export module.
+    The run column of a row is the index of its simulation in results. Failed simulations and simulations without
+    such output are skipped. Paths of simulations are saved in table metadata ({"paths": [path, ...]})
+    :param results: list of ParsedOutput, as returned by parse_many
+    :param format: "arrow", "parquet" or "numpy", see export.write_table
+    """
+    metadata = {"paths": [result.path if isinstance(result.path, six.string_types) else list(result.path)
+                          for result in results]}
+    for filename, function, attribute in ((survey_filename, export_survey, "survey"),
+                                          (cts_filename, export_cts, "cts")):
+        if filename is None:
+            continue
+        runs = [index for index, result in enumerate(results)
+                if result.ok and getattr(result, attribute) is not None]
+        function(filename, [results[index] for index in runs], format, metadata, runs)
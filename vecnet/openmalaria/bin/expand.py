@@ -10,37 +10,216 @@
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import hashlib
+import os
+import re
 import sys
 import argparse
+from collections import OrderedDict
 
-from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.experiment import ExperimentSpecification, arm_key
+from vecnet.openmalaria.helpers import SEED_START_WITH, prime_numbers
+from vecnet.openmalaria.writer import open_writer, read_manifest, write_manifest
 
 
-def main(filename, generate_seed=False):
+def parse_shard(value):
+    """
+    Parse K/N shard specification
+    :returns: (K, N) tuple
+    """
+    try:
+        shard, shards = [int(item) for item in value.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("shard should be K/N, for example 1/10")
+    if not 1 <= shard <= shards:
+        raise argparse.ArgumentTypeError("shard number K should be between 1 and N")
+    return shard, shards
+
+
+# Manifest columns of scenario metadata, by metadata name. Other columns are arms of sweeps; the prefix keeps
+# metadata apart from sweeps with the same name (e.g. a "seed" sweep)
+METADATA_COLUMNS = OrderedDict((name, "_" + name) for name in ("filename", "sha256", "size", "seed", "status"))
+
+
+def _manifest_row(metadata, parameters):
+    """ Manifest row of a scenario: metadata columns and an arm of every sweep """
+    row = dict(parameters)
+    row.update((METADATA_COLUMNS[name], value) for name, value in metadata.items())
+    return row
+
+
+def _read_previous_manifest(filename, keys):
+    """
+    Manifest of an earlier expansion, by combination of arms
+    :param keys: sweep names
+    :returns: dict {arm_key(parameters): metadata of the scenario (filename, sha256, ...)}
+    """
+    previous = {}
+    if os.path.exists(filename):
+        for row in read_manifest(filename):
+            parameters = dict((key, row[key]) for key in keys if key in row)
+            previous[arm_key(parameters)] = dict((name, row[column]) for name, column in METADATA_COLUMNS.items()
+                                                 if column in row)
+    return previous
+
+
+def _scenario_number(filename):
+    """ Number of a scenario file of the previous expansion (scenarioN.xml) """
+    match = re.match(r"scenario(\d+)\.xml$", filename or "")
+    if match is None:
+        raise RuntimeError("Unexpected scenario file name %r in previous manifest, scenarioN.xml expected" %
+                           filename)
+    return int(match.group(1))
 
+
+def _incremental_seeds(exp, previous):
+    """
+    Seeds of all combinations of arms in incremental mode. Combinations of the previous expansion keep their seeds,
+    new combinations get next prime numbers after the largest seed in the previous manifest (in order of scenarios),
+    so a new scenario never shares a seed with an existing one
+    :returns: dict {arm_key(parameters): seed}
+    """
+    seeds = dict((key, int(row["seed"])) for key, row in previous.items() if row.get("seed"))
+    new_seeds = prime_numbers(max(seeds.values()) + 1 if seeds else SEED_START_WITH)
+    space = exp.combination_space()
+    for combination in space:
+        key = arm_key(dict(zip(space.sweep_names, combination)))
+        if key not in seeds:
+            seeds[key] = next(new_seeds)
+    return seeds
+
+
+def main(filename, generate_seed=False, shard=None, index=None, output_dir=".", archive=None, manifest=None,
+         workers=8, dedup=False, incremental=False):
+    """
+    :param shard: (K, N) tuple - generate only K-th of N shards of the experiment
+    :param index: generate only scenario number index (numbered from 1, as scenario files)
+    Scenario file names, parameters and seeds are the same as in a full run
+    :param output_dir: directory for scenarios, scenarios.csv, archive and manifest
+    :param archive: save scenarios to a single archive (.tar, .tar.gz, .tar.zst, .zip, ...) instead of separate files
+    :param manifest: save filename, sha256 hash, size and parameters of every scenario to a .csv or .json file.
+    Columns of metadata are prefixed with "_" (see METADATA_COLUMNS), other columns are arms of sweeps
+    :param workers: number of threads writing scenario files
+    :param dedup: don't write scenarios identical to an earlier one. Such combinations of parameters refer to
+    the file of the earlier scenario in scenarios.csv
+    :param incremental: compare scenarios with the manifest of the previous expansion and write only new and
+    changed scenarios. Existing combinations of arms keep their file names and seeds, new ones get new file names
+    and seeds not used by the previous expansion. Can't be combined with archive output.
+    Status of every scenario (new, changed or unchanged) is saved in the manifest
+    """
     with open(filename) as fp:
         exp = ExperimentSpecification(fp)
 
-    i = 1
-    keys = exp.experiment["sweeps"].keys()
-    csvfile = open("scenarios.csv", "w")
+    start, stop = 0, None
+    csv_filename = "scenarios.csv"
+    if shard is not None:
+        start, stop = exp.shard(*shard)
+        csv_filename = "scenarios_%s-%s.csv" % (start + 1, stop)
+    elif index is not None:
+        if not 1 <= index <= len(exp):
+            raise RuntimeError("Scenario index should be between 1 and %s" % len(exp))
+        start, stop = index - 1, index
+        csv_filename = "scenarios_%s.csv" % index
+
+    keys = list(exp.experiment["sweeps"].keys())
+    if manifest is not None:
+        for key in keys:
+            if key in METADATA_COLUMNS.values():
+                raise RuntimeError("Sweep name %s is reserved for manifest metadata" % key)
+    previous = {}
+    seeds = None
+    last_number = 0
+    if incremental:
+        if manifest is None:
+            raise RuntimeError("Incremental expansion requires a manifest")
+        if dedup or shard is not None or index is not None:
+            raise RuntimeError("Incremental expansion can't be combined with dedup, shard or index modes")
+        if archive is not None:
+            # Only new and changed scenarios are written, the archive would lack unchanged ones
+            raise RuntimeError("Incremental expansion can't be combined with archive output")
+        previous = _read_previous_manifest(os.path.join(output_dir, manifest), keys)
+        if generate_seed:
+            seeds = _incremental_seeds(exp, previous)
+        last_number = max([_scenario_number(row.get("filename")) for row in previous.values()] or [0])
+
+    writer = open_writer(output_dir, archive, workers)
+    csvfile = open(os.path.join(output_dir, csv_filename), "w")
     # Write "header" of csv file
     csvfile.write("filename")
     for key in keys:
         csvfile.write("," + key)
     csvfile.write("\n")
 
-    for scenario in exp.scenarios(generate_seed=generate_seed):
-        with open("scenario%s.xml" % i, "w") as fp:
-            fp.write(scenario.xml)
-        # Write parameters values used to generate this scenario
-        csvfile.write("scenario%s.xml" % i)
-        for key in keys:
-            csvfile.write("," + scenario.parameters.pop(key))
-        csvfile.write("\n")
-        i += 1
-    csvfile.close()
-    print("%s scenarios generated" % (i-1))
+    rows = []
+    # Scenario filename for every content hash (dedup mode)
+    filenames = {}
+    count = 0
+    with writer:
+        for scenario in exp.scenarios(generate_seed=generate_seed, start=start, stop=stop, dedup=dedup,
+                                      seeds=seeds):
+            # Metadata of the scenario, saved in the manifest
+            row = {}
+            if generate_seed:
+                row["seed"] = scenario.seed
+            if incremental:
+                old = previous.pop(arm_key(scenario.parameters), None)
+                if old is None:
+                    last_number += 1
+                    scenario_filename = "scenario%s.xml" % last_number
+                else:
+                    scenario_filename = old["filename"]
+                data = scenario.xml.encode("utf-8")
+                row["sha256"], row["size"] = hashlib.sha256(data).hexdigest(), len(data)
+                if old is None:
+                    row["status"] = "new"
+                elif old["sha256"] != row["sha256"]:
+                    row["status"] = "changed"
+                else:
+                    row["status"] = "unchanged"
+            else:
+                scenario_filename = "scenario%s.xml" % (scenario.index + 1)
+            row["filename"] = scenario_filename
+            if row.get("status") != "unchanged":
+                writer.write(scenario_filename, scenario.xml)
+                count += 1
+            if manifest is not None:
+                rows.append((row, dict(scenario.parameters)))
+            if dedup:
+                filenames[scenario.content_hash] = scenario_filename
+                continue
+            # Write parameters values used to generate this scenario
+            csvfile.write(scenario_filename)
+            for key in keys:
+                csvfile.write("," + scenario.parameters.pop(key))
+            csvfile.write("\n")
+        if dedup:
+            # Every combination of parameters refers to the file of its (first) identical scenario
+            for parameters, content_hash in exp.scenario_hashes.items():
+                parameters = dict(parameters)
+                csvfile.write(filenames[content_hash])
+                for key in keys:
+                    csvfile.write("," + parameters[key])
+                csvfile.write("\n")
+        csvfile.close()
+    if manifest is not None:
+        fieldnames = ["filename", "sha256", "size"]
+        if generate_seed:
+            fieldnames.append("seed")
+        if incremental:
+            fieldnames.append("status")
+        for row, parameters in rows:
+            if "sha256" not in row:
+                row["sha256"], row["size"] = writer.files[row["filename"]]
+        write_manifest(os.path.join(output_dir, manifest), [_manifest_row(row, parameters) for row, parameters in rows],
+                       [METADATA_COLUMNS[name] for name in fieldnames] + keys)
+    print("%s scenarios generated" % count)
+    if incremental:
+        statuses = [row["status"] for row, _ in rows]
+        print("%s new, %s changed, %s unchanged" %
+              (statuses.count("new"), statuses.count("changed"), statuses.count("unchanged")))
+        # Combinations of arms that are not in the experiment anymore. Their files are not deleted
+        for row in sorted(previous.values(), key=lambda row: row["filename"]):
+            print("Removed: %s" % row["filename"])
     return 0
 
 if __name__ == "__main__":
@@ -49,12 +228,42 @@ if __name__ == "__main__":
     parser.add_argument("--seed",
                         help="Automatically replace @seed@ placeholder with a seed number",
                         action="store_true")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--shard",
+                       help="Generate only K-th of N equal parts of the experiment, for example 2/10",
+                       type=parse_shard)
+    group.add_argument("--index",
+                       help="Generate only scenario number INDEX (scenarioINDEX.xml of a full run)",
+                       type=int)
+    parser.add_argument("--output", help="Output directory (current directory by default)", default=".")
+    parser.add_argument("--archive",
+                        help="Save scenarios to a single archive in the output directory. Format is chosen by "
+                             "extension: .tar, .tar.gz, .tar.bz2, .tar.xz, .tar.zst or .zip")
+    parser.add_argument("--manifest",
+                        help="Save filename, sha256 hash and parameters of every scenario to a .csv or .json file")
+    parser.add_argument("--workers", help="Number of threads writing scenario files (default: 8)",
+                        type=int, default=8)
+    parser.add_argument("--dedup",
+                        help="Skip scenarios identical to an earlier scenario (apart from the seed)",
+                        action="store_true")
+    parser.add_argument("--incremental",
+                        help="Write only scenarios that are new or changed since the previous expansion, "
+                             "according to the manifest (can't be combined with --archive)",
+                        action="store_true")
     args = parser.parse_args()
 
     try:
         status = main(filename=args.exp_spec_name,
-                      generate_seed=args.seed)
-    except (RuntimeError, IOError) as e:
+                      generate_seed=args.seed,
+                      shard=args.shard,
+                      index=args.index,
+                      output_dir=args.output,
+                      archive=args.archive,
+                      manifest=args.manifest,
+                      workers=args.workers,
+                      dedup=args.dedup,
+                      incremental=args.incremental)
+    except (RuntimeError, IOError, ValueError) as e:
         print("Error: %s" % e)
         status = 1
     sys.exit(status)
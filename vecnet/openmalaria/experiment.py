@@ -9,18 +9,37 @@
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import hashlib
 import json
 import re
 import os
 import io
 import six
-from .helpers import prime_numbers
+from collections import OrderedDict
+from .helpers import FileCache, seed_table
+from .template import Template
+
+
+def arm_key(parameters):
+    """
+    Hashable identifier of a combination of arms (Scenario.parameters dict): tuple of (sweep name, arm name) pairs
+    sorted by sweep name
+    """
+    if parameters is None:
+        return ()
+    return tuple(sorted(parameters.items()))
 
 
 class Scenario:
-    def __init__(self, xml, parameters=None):
+    def __init__(self, xml, parameters=None, index=None, content_hash=None, seed=None):
         self.xml = xml
         self.parameters = parameters
+        # Number of the scenario in the experiment (from 0)
+        self.index = index
+        # Seed that replaced @seed@ placeholder, if any
+        self.seed = seed
+        # sha256 of the document before seed replacement, set by ExperimentSpecification.scenarios(dedup=True)
+        self.content_hash = content_hash
 
     def __str__(self):
         return self.xml
@@ -29,6 +48,91 @@ class Scenario:
         return self.xml
 
 
+class CombinationSpace(object):
+    """
+    Lazy product of blocks of arm combinations.
+
+    Every block is a (list of sweeps, list of combinations) pair, where a combination is a list of arm names, one
+    per sweep. A fully factorial sweep is a block with one sweep and one combination per arm. Combinations of the
+    space are concatenations of one combination from every block. They are numbered as mixed-radix numbers with
+    the first block as the most significant digit, so no more than one combination is kept in memory at a time.
+    """
+    def __init__(self, blocks):
+        self.blocks = [(list(sweeps), combinations) for sweeps, combinations in blocks]
+        self.sweep_names = [sweep for sweeps, combinations in self.blocks for sweep in sweeps]
+        self._radixes = [len(combinations) for sweeps, combinations in self.blocks]
+
+    def __len__(self):
+        length = 1
+        for radix in self._radixes:
+            length *= radix
+        return length
+
+    def _combination(self, digits):
+        combination = []
+        for (sweeps, combinations), digit in zip(self.blocks, digits):
+            combination.extend(combinations[digit])
+        return combination
+
+    def _digits(self, index):
+        digits = []
+        for radix in reversed(self._radixes):
+            index, digit = divmod(index, radix)
+            digits.append(digit)
+        digits.reverse()
+        return digits
+
+    def __getitem__(self, index):
+        """
+        Combination number index, or list of combinations if index is a slice
+        """
+        length = len(self)
+        if isinstance(index, slice):
+            return [self[i] for i in six.moves.range(*index.indices(length))]
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("combination index out of range")
+        return self._combination(self._digits(index))
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, start=0, stop=None):
+        """
+        Generator function. Combinations number start to stop - 1, in order
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        digits = self._digits(start)
+        for i in six.moves.range(start, stop):
+            yield self._combination(digits)
+            # Increment mixed-radix counter, last block changes fastest
+            position = len(digits) - 1
+            while position >= 0:
+                digits[position] += 1
+                if digits[position] < self._radixes[position]:
+                    break
+                digits[position] = 0
+                position -= 1
+
+    def index(self, combination):
+        """
+        Number of the combination (list of arm names, one per sweep in sweep_names) in this space
+        """
+        index = 0
+        offset = 0
+        for (sweeps, combinations), radix in zip(self.blocks, self._radixes):
+            try:
+                digit = combinations.index(list(combination[offset:offset + len(sweeps)]))
+            except ValueError:
+                raise ValueError("%s is not in this experiment" % list(combination))
+            index = index * radix + digit
+            offset += len(sweeps)
+        return index
+
+
 class ExperimentSpecification:
     """
     OpenMalaria experiment specification is a json file. This class is an SDK for working with that file format.
@@ -51,6 +155,10 @@ class ExperimentSpecification:
             raise TypeError("experiment should be either string or dict")
 
         self.experiment = experiment
+        self._compiled = None
+        self.scenario_hashes = OrderedDict()
+        # Contents of file:// arm values, see FileCache.stats() for memory usage
+        self.file_cache = FileCache()
         if "name" in self.experiment:
             self.name = self.experiment["name"]
         else:
@@ -70,8 +178,12 @@ class ExperimentSpecification:
     def __str__(self):
         return self.name
 
-    def _apply_changes(self, scenario, sweep_name, arm_name):
+    def _changes(self, sweep_name, arm_name):
+        """
+        List of (placeholder, value) substitutions of the arm
+        """
         arm = self.experiment["sweeps"][sweep_name][arm_name]
+        changes = []
         for param_change in arm:
             # arm substitution string should start and end with an @
             if re.match("^@.*@$", param_change) is None:
@@ -82,26 +194,39 @@ class ExperimentSpecification:
             if isinstance(param_value, (int, float)):
                 param_value = str(param_value)
             if param_value[0:7] == "file://":
-                with open(param_value[7:], "r") as fp:
-                    param_value = fp.read()
+                # The same file is usually used by many scenarios, read it once
+                param_value = self.file_cache.read(param_value[7:])
+            changes.append((param_change, param_value))
+        return changes
 
-            scenario = scenario.replace(param_change, param_value)
-        return scenario
+    def _template(self, scenario):
+        """
+        scenario compiled for placeholders of all arms of this experiment. The last template is reused as long
+        as the document and the set of placeholders don't change
+        """
+        placeholders = frozenset(param_change
+                                 for arms in self.experiment["sweeps"].values()
+                                 for arm in arms.values()
+                                 for param_change in arm)
+        if self._compiled is None or self._compiled[0] is not scenario or self._compiled[1] != placeholders:
+            self._compiled = (scenario, placeholders, Template(scenario, placeholders))
+        return self._compiled[2]
 
     def _apply_combination(self, scenario, sweeps_applied, combination):
+        changes = []
         for i in range(0, len(sweeps_applied)):
             # Apply sweeps in order defined by user
             sweep = sweeps_applied[i]
             arm = combination[i]
-            scenario = self._apply_changes(scenario, sweep, arm)
-        return scenario
+            changes.extend(self._changes(sweep, arm))
+        # Single pass over the compiled document, same result as scenario.replace() for every change in order
+        return self._template(scenario).render(changes)
 
-    def scenarios(self, generate_seed=False):
+    def combination_space(self):
         """
-        Generator function. Spits out scenarios for this experiment
+        Lazy space of all arm combinations of this experiment, see CombinationSpace
         """
-        seed = prime_numbers(1000)
-        sweeps_all = self.experiment["sweeps"].keys()
+        sweeps_all = list(self.experiment["sweeps"].keys())
         if "combinations" in self.experiment:
             if isinstance(self.experiment["combinations"], list):
                 # For backward compatibility with experiments1-4s
@@ -114,7 +239,7 @@ class ExperimentSpecification:
                 combinations_in_experiment = self.experiment["combinations"]
         else:
             # Support no combinations element:
-            combinations_in_experiment = dict()    # empty dict 
+            combinations_in_experiment = dict()    # empty dict
 
         # 1) calculate combinations_sweeps (depends on ALL combinations_ items)
         # Get the list of fully factorial sweeps
@@ -135,47 +260,99 @@ class ExperimentSpecification:
                 # TODO: error if sweep is already in this list?
                 all_combinations_sweeps.append(item)
             all_combinations.append((combinations_sweeps, combinations))
-        
-        sweeps_fully_factorial = list(set(sweeps_all) - set(all_combinations_sweeps))
-        # print "fully fact: %s" % sweeps_fully_factorial
-        
+
+        # Sweeps that are not in any combination are fully factorial. Keep them in order of definition, so
+        # numbering of scenarios doesn't change between runs
+        sweeps_fully_factorial = [sweep for sweep in sweeps_all if sweep not in all_combinations_sweeps]
+
         # 2) produce a list of all combinations of fully factorial sweeps
         # First sets of "combinations": the fully-factorial sweeps
         for sweep in sweeps_fully_factorial:
             all_combinations.append(([sweep], [[x] for x in self.experiment["sweeps"][sweep].keys()]))
-        
-        # 3) take the dot (inner) product of the list above (fully factorial arm combinations)
-        #   with the first combinations list, that with the second combination list, ...
-        # step-by-step reduce the list of combinations to a single item
-        # (dot-product of each list of combinations)
-        # this could use a lot of memory...
-        red_iter = 0
-        # print "all combinations:", red_iter, all_combinations
-        while len(all_combinations) > 1:
-            comb1 = all_combinations[0]
-            comb2 = all_combinations[1]
-            new_sweeps = comb1[0] + comb2[0]
-            new_combinations = [x+y for x in comb1[1] for y in comb2[1]]
-            all_combinations = [(new_sweeps, new_combinations)] + all_combinations[2:]
-            red_iter += 1
-            # print "all combinations:", red_iter, all_combinations
-        
-        # 4) write out the document for each in (3), which should specify one arm for each
-        #   sweep with no repetition of combinations
-        sweep_names = all_combinations[0][0]
-        combinations = all_combinations[0][1]
-        for combination in combinations:
-            scenario = Scenario(self._apply_combination(self.experiment["base"], sweep_names, combination))
-            scenario.parameters = dict(zip(sweep_names, combination))
+
+        # 3) the product of all these blocks is every combination to run, one arm for each sweep with no
+        #   repetition of combinations. It is computed lazily, so large experiments don't use a lot of memory
+        return CombinationSpace(all_combinations)
+
+    def scenario(self, sweep_names, combination):
+        """
+        Scenario for the combination of arms
+        :param sweep_names: list of sweeps (CombinationSpace.sweep_names)
+        :param combination: list of arm names, one per sweep
+        :rtype: Scenario
+        """
+        scenario = Scenario(self._apply_combination(self.experiment["base"], sweep_names, combination))
+        scenario.parameters = dict(zip(sweep_names, combination))
+        return scenario
+
+    def __len__(self):
+        """ Number of scenarios in this experiment """
+        return len(self.combination_space())
+
+    def __getitem__(self, index):
+        """
+        Scenario number index (or list of scenarios if index is a slice), in order of scenarios() generator.
+        Seeds are not replaced.
+        """
+        space = self.combination_space()
+        if isinstance(index, slice):
+            return [self.scenario(space.sweep_names, combination) for combination in space[index]]
+        return self.scenario(space.sweep_names, space[index])
+
+    def shard(self, shard, shards):
+        """
+        Range of scenario numbers in a shard of this experiment. Scenarios are split into shards contiguous blocks
+        of (almost) equal size
+        :param shard: shard number, from 1 to shards
+        :param shards: total number of shards
+        :returns: (start, stop) - shard consists of scenarios number start to stop - 1 (numbered from 0)
+        """
+        if not 1 <= shard <= shards:
+            raise ValueError("Shard number should be between 1 and %s" % shards)
+        length = len(self)
+        return (shard - 1) * length // shards, shard * length // shards
+
+    def scenarios(self, generate_seed=False, start=0, stop=None, dedup=False, seeds=None):
+        """
+        Generator function. Spits out scenarios for this experiment
+        :param start, stop: generate only scenarios number start to stop - 1 (numbered from 0), see shard().
+        Scenarios and seeds are the same as in a full run
+        :param dedup: skip scenarios identical to a scenario generated earlier (before seed replacement).
+        scenario_hashes maps arm_key(parameters) of every combination to the content hash of its scenario,
+        including skipped ones
+        :param seeds: dict {arm_key(parameters): seed} - seeds to use instead of nth_seed(index) for these
+        combinations, e.g. to keep seeds of an earlier expansion of the experiment
+        """
+        # Seeds are assigned in order of scenarios (seed of scenario i is nth_seed(i))
+        seed = seed_table().iterate(start)
+        space = self.combination_space()
+        self.scenario_hashes = OrderedDict()
+        seen = set()
+        for index, combination in enumerate(space.iterate(start, stop), start):
+            scenario = self.scenario(space.sweep_names, combination)
+            scenario.index = index
+            scenario_seed = next(seed) if generate_seed else None
+            if seeds:
+                scenario_seed = seeds.get(arm_key(scenario.parameters), scenario_seed)
+
+            if dedup:
+                xml = scenario.xml
+                scenario.content_hash = hashlib.sha256(xml.encode("utf-8") if isinstance(xml, six.text_type)
+                                                       else xml).hexdigest()
+                self.scenario_hashes[arm_key(scenario.parameters)] = scenario.content_hash
+                if scenario.content_hash in seen:
+                    continue
+                seen.add(scenario.content_hash)
 
             if generate_seed:
                 # Replace seed if requested by the user
                 if "@seed@" in scenario.xml:
-                    scenario.xml = scenario.xml.replace("@seed@", str(next(seed)))
+                    scenario.xml = scenario.xml.replace("@seed@", str(scenario_seed))
+                    scenario.seed = scenario_seed
                 else:
                     raise(RuntimeError("@seed@ placeholder is not found"))
             yield scenario
-    
+
     def add_sweep(self, sweep_name):
         self.experiment["sweeps"][sweep_name] = {}
 
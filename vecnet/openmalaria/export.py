@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Columnar export of parsed output, for dataframe tools.
+
+Survey output is exported as a table with one row per record:
+  run - number of the simulation (only if several simulations are exported to the same file)
+  survey, time - survey number and its timestep
+  measure, measure_name - measure id and its name in surveyFileMap (dictionary-encoded)
+  third_dimension - age group or cohort; -species for vector measures
+  species - vector species (dictionary-encoded, "" for other measures)
+  value
+Continuous output is exported as a table with columns run, line (line of ctsout.txt, from 0), measure_name (column
+of ctsout.txt, e.g. "N_v0(gambiae)", dictionary-encoded) and value.
+
+Tables are saved as Arrow IPC or Parquet files if pyarrow is installed. Otherwise they are saved in the arrayfile
+format (one numpy array per column, dictionaries in the header). Files of every format are read with read_table(),
+which memory-maps them and loads only requested columns.
+"""
+import json
+from collections import OrderedDict
+
+import numpy
+import six
+
+from . import arrayfile
+from .output_parser import OutputParser, SurveyOutputStore, SURVEY_RECORD_DTYPE, surveyFileMap
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ("arrow", "parquet", "numpy")
+# Key of table metadata in Arrow schema and in arrayfile header
+METADATA_KEY = "vecnet.openmalaria"
+_MAGIC = [(b"ARROW1", "arrow"), (b"PAR1", "parquet"), (arrayfile.MAGIC, "numpy")]
+
+
+class ColumnarTable(object):
+    """
+    Columns of an exported table, as returned by read_table.
+
+    table[name] is a numpy array (memory-mapped if possible). Values of dictionary-encoded columns are codes,
+    table.dictionaries[name][code] is the value; table.decode(name) returns decoded values.
+    """
+    def __init__(self, columns, dictionaries=None, metadata=None):
+        self.columns = columns
+        self.dictionaries = dictionaries or {}
+        self.metadata = metadata
+
+    @property
+    def names(self):
+        return list(self.columns.keys())
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def decode(self, name):
+        """ Values of a dictionary-encoded column, as a numpy array of objects """
+        dictionary = numpy.empty(len(self.dictionaries[name]), dtype=object)
+        dictionary[:] = self.dictionaries[name]
+        return dictionary[self.columns[name]]
+
+
+def _measure_name(measure_id):
+    """ Name of a survey measure in surveyFileMap, measure id as a string for unknown measures """
+    if 0 <= measure_id < len(surveyFileMap) and surveyFileMap[measure_id] is not None:
+        return surveyFileMap[measure_id][0]
+    return str(measure_id)
+
+
+def _survey_store(output):
+    """ SurveyOutputStore of OutputParser, batch.ParsedOutput, survey_output_data dict or SurveyOutputStore """
+    if isinstance(output, OutputParser):
+        survey, survey_times = output.survey_output_data, output.survey_time_list
+    elif hasattr(output, "survey_time_list"):
+        # batch.ParsedOutput
+        survey, survey_times = output.survey, output.survey_time_list
+    else:
+        survey, survey_times = output, None
+    if isinstance(survey, SurveyOutputStore):
+        return survey
+    if survey is None:
+        raise ValueError("No survey output")
+    # survey_output_data of OutputParser without columnar mode: {(measure, third dimension): [[time, value], ...]}
+    if survey_times is None:
+        # A dict on its own: surveys are numbered in order of their timesteps
+        survey_times = sorted(set(time for values in survey.values() for time, _ in values))
+    survey_numbers = dict((time, number) for number, time in enumerate(survey_times, 1))
+    labels = []
+    records = []
+    for (measure, third_dimension), values in survey.items():
+        if isinstance(third_dimension, six.string_types):
+            if third_dimension not in labels:
+                labels.append(third_dimension)
+            third_dimension = -1 - labels.index(third_dimension)
+        records.extend((survey_numbers[time], third_dimension, measure, value) for time, value in values)
+    return SurveyOutputStore(numpy.array(records, dtype=SURVEY_RECORD_DTYPE), survey_times, labels)
+
+
+def _cts_data(output):
+    """ OrderedDict {measure: values} of OutputParser, batch.ParsedOutput or cts_output_data """
+    if isinstance(output, OutputParser):
+        return output.cts_output_data
+    if hasattr(output, "survey_time_list"):
+        if output.cts is None:
+            raise ValueError("No continuous output")
+        return output.cts
+    return output
+
+
+def _runs(outputs, runs):
+    """ (list of outputs, their run numbers, True if the table has a run column) """
+    if isinstance(outputs, (list, tuple)):
+        outputs = list(outputs)
+        return outputs, list(runs) if runs is not None else list(range(len(outputs))), True
+    return [outputs], [0], False
+
+
+def survey_columns(outputs, runs=None):
+    """
+    Columns of survey output table
+    :param outputs: OutputParser, batch.ParsedOutput, SurveyOutputStore or survey_output_data dict, or a list of
+    them (the table has a run column then). Surveys of a dict are numbered in order of timesteps in the dict
+    :param runs: run numbers of outputs in the list, their indexes by default
+    :returns: (OrderedDict {column: numpy array}, dict {column: dictionary})
+    """
+    outputs, runs, several = _runs(outputs, runs)
+    stores = [_survey_store(output) for output in outputs]
+    species = [""]
+    parts = []
+    for run, store in zip(runs, stores):
+        records = store.records
+        # Species codes of this store: -1 - i in the store refers to species[codes[i]]
+        codes = []
+        for label in store.third_dimension_labels:
+            if label not in species:
+                species.append(label)
+            codes.append(species.index(label))
+        codes = numpy.array(codes or [0], dtype=numpy.int32)
+        third_dimension = records["third_dimension"].astype(numpy.int32)
+        negative = third_dimension < 0
+        species_code = numpy.zeros(len(records), dtype=numpy.int32)
+        species_code[negative] = codes[-1 - third_dimension[negative]]
+        third_dimension[negative] = -species_code[negative]
+        surveys = records["survey"]
+        times = store.survey_times[surveys - 1] if len(surveys) else numpy.zeros(0, dtype=numpy.int64)
+        parts.append((numpy.full(len(records), run, dtype=numpy.int32), surveys, times, records["measure"],
+                      third_dimension, species_code, records["value"]))
+
+    if parts:
+        columns = [numpy.concatenate([part[i] for part in parts]) for i in range(7)]
+    else:
+        dtypes = [numpy.int32, numpy.int32, numpy.int64, numpy.int32, numpy.int32, numpy.int32, numpy.float64]
+        columns = [numpy.zeros(0, dtype=dtype) for dtype in dtypes]
+    run, surveys, times, measures, third_dimension, species_code, values = columns
+    measure_ids = numpy.unique(measures)
+    measure_names = [_measure_name(int(measure_id)) for measure_id in measure_ids]
+    table = OrderedDict()
+    if several:
+        table["run"] = run
+    table["survey"] = surveys.astype(numpy.int32)
+    table["time"] = times.astype(numpy.int64)
+    table["measure"] = measures.astype(numpy.int32)
+    table["measure_name"] = numpy.searchsorted(measure_ids, measures).astype(numpy.int32)
+    table["third_dimension"] = third_dimension
+    table["species"] = species_code
+    table["value"] = values.astype(numpy.float64)
+    return table, {"measure_name": measure_names, "species": species}
+
+
+def cts_columns(outputs, runs=None):
+    """
+    Columns of continuous output table
+    :param outputs: OutputParser, batch.ParsedOutput or cts_output_data, or a list of them (the table has a run
+    column then)
+    :param runs: run numbers of outputs in the list, their indexes by default
+    :returns: (OrderedDict {column: numpy array}, dict {column: dictionary})
+    """
+    outputs, runs, several = _runs(outputs, runs)
+    names = []
+    run_columns, lines, codes, values = [], [], [], []
+    for run, output in zip(runs, outputs):
+        for measure, column in _cts_data(output).items():
+            column = numpy.asarray(column, dtype=numpy.float64)
+            if measure not in names:
+                names.append(measure)
+            run_columns.append(numpy.full(len(column), run, dtype=numpy.int32))
+            lines.append(numpy.arange(len(column), dtype=numpy.int32))
+            codes.append(numpy.full(len(column), names.index(measure), dtype=numpy.int32))
+            values.append(column)
+
+    def concatenate(arrays, dtype):
+        return numpy.concatenate(arrays) if arrays else numpy.zeros(0, dtype=dtype)
+
+    table = OrderedDict()
+    if several:
+        table["run"] = concatenate(run_columns, numpy.int32)
+    table["line"] = concatenate(lines, numpy.int32)
+    table["measure_name"] = concatenate(codes, numpy.int32)
+    table["value"] = concatenate(values, numpy.float64)
+    return table, {"measure_name": names}
+
+
+def write_table(filename, columns, dictionaries=None, metadata=None, format=None):
+    """
+    Save columns to filename.
+    :param columns: OrderedDict {name: numpy array}. Arrays of dictionary-encoded columns hold codes
+    :param dictionaries: dict {name: list of values} of dictionary-encoded columns
+    :param metadata: json-serializable object saved with the table
+    :param format: "arrow" (Arrow IPC file), "parquet" or "numpy" (arrayfile). Arrow if pyarrow is installed,
+    numpy otherwise, by default
+    """
+    dictionaries = dictionaries or {}
+    if format is None:
+        format = "arrow" if pyarrow is not None else "numpy"
+    if format not in FORMATS:
+        raise ValueError("Unknown format %s, supported formats are %s" % (format, ", ".join(FORMATS)))
+    if format == "numpy":
+        arrayfile.write_arrays(filename, list(columns.items()),
+                               {METADATA_KEY: {"dictionaries": dictionaries, "metadata": metadata}})
+        return
+    if pyarrow is None:
+        raise RuntimeError("pyarrow package is required for %s format" % format)
+    arrays = []
+    for name, column in columns.items():
+        if name in dictionaries:
+            arrays.append(pyarrow.DictionaryArray.from_arrays(pyarrow.array(column, pyarrow.int32()),
+                                                              pyarrow.array(dictionaries[name], pyarrow.string())))
+        else:
+            arrays.append(pyarrow.array(column))
+    table = pyarrow.Table.from_arrays(arrays, names=list(columns.keys()))
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata)})
+    if format == "parquet":
+        pyarrow.parquet.write_table(table, filename)
+    else:
+        with pyarrow.OSFile(filename, "wb") as sink:
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def file_format(filename):
+    """ Format of a file saved by write_table: "arrow", "parquet" or "numpy" """
+    with open(filename, "rb") as fp:
+        magic = fp.read(8)
+    for prefix, format in _MAGIC:
+        if magic.startswith(prefix):
+            return format
+    raise ValueError("%s is not an exported table" % filename)
+
+
+def read_table(filename, columns=None, memory_map=True):
+    """
+    Load a table saved by write_table, export_survey or export_cts.
+    :param columns: load only these columns (column projection); all columns by default
+    :param memory_map: memory-map the file instead of reading it into memory (arrow and numpy formats)
+    :rtype: ColumnarTable
+    """
+    format = file_format(filename)
+    if format == "numpy":
+        header, entries, _ = arrayfile.read_header(filename)
+        names = [entry["name"] for entry in entries]
+        _, arrays = arrayfile.read_arrays(filename, names=columns, mmap_mode="r" if memory_map else None)
+        header = header[METADATA_KEY]
+        selected = [name for name in names if columns is None or name in columns]
+        return ColumnarTable(OrderedDict((name, arrays[name]) for name in selected),
+                             dict((name, values) for name, values in header["dictionaries"].items()
+                                  if name in selected),
+                             header["metadata"])
+    if pyarrow is None:
+        raise RuntimeError("pyarrow package is required to read %s" % filename)
+    if format == "parquet":
+        table = pyarrow.parquet.read_table(filename, columns=columns, memory_map=memory_map)
+    else:
+        source = pyarrow.memory_map(filename) if memory_map else pyarrow.OSFile(filename)
+        table = pyarrow.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(list(columns))
+    metadata = (table.schema.metadata or {}).get(METADATA_KEY.encode("utf-8"))
+    result = OrderedDict()
+    dictionaries = {}
+    for name, column in zip(table.column_names, table.columns):
+        chunk = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+        if pyarrow.types.is_dictionary(chunk.type):
+            dictionaries[name] = chunk.dictionary.to_pylist()
+            chunk = chunk.indices
+        result[name] = chunk.to_numpy(zero_copy_only=False)
+    return ColumnarTable(result, dictionaries, json.loads(metadata.decode("utf-8")) if metadata else None)
+
+
+def export_survey(filename, outputs, format=None, metadata=None, runs=None):
+    """
+    Save survey output to filename, see survey_columns and write_table
+    """
+    columns, dictionaries = survey_columns(outputs, runs)
+    write_table(filename, columns, dictionaries, metadata, format)
+
+
+def export_cts(filename, outputs, format=None, metadata=None, runs=None):
+    """
+    Save continuous output to filename, see cts_columns and write_table
+    """
+    columns, dictionaries = cts_columns(outputs, runs)
+    write_table(filename, columns, dictionaries, metadata, format)
@@ -12,6 +12,7 @@
 Helper functions for OpenMalaria Health System
 Please refer to https://docs.google.com/document/d/1-R-0s0vELuUJ-xuQabjwe1BhKCLYqC4-DBxvC0Z0oeI/edit for design notes
 """
+import numpy
 
 # Using dictionary instead of list to simplify debugging.
 probability_list = {
@@ -121,6 +122,45 @@ probability_list = {
 }
 
 
+# probability_list as sorted arrays, used by the vectorized conversions
+_percentages = numpy.array(sorted(probability_list), dtype=numpy.float64)
+_probabilities = numpy.array([probability_list[percentage] for percentage in sorted(probability_list)],
+                             dtype=numpy.float64)
+
+
+def probabilities_from_percentages(perc, interpolate=False):
+    """
+    Converted percentages of people treated to probabilities of being treated on a timestep
+    :param perc: percentage or array-like of percentages, 0 to 100
+    :param interpolate: linear interpolation between integer percentages. Otherwise, percentages must be integers
+    :rtype: numpy.ndarray of the same shape as perc
+    """
+    perc = numpy.asarray(perc, dtype=numpy.float64)
+    if numpy.any((perc < 0) | (perc > 100)) or numpy.any(numpy.isnan(perc)):
+        raise ValueError("Percentage should be between 0 and 100")
+    if interpolate:
+        return numpy.interp(perc, _percentages, _probabilities)
+    if numpy.any(perc != numpy.floor(perc)):
+        raise ValueError("Percentage should be an integer, use interpolate=True for fractional percentages")
+    return _probabilities[numpy.searchsorted(_percentages, perc)]
+
+
+def percentages_from_probabilities(prob, interpolate=False):
+    """
+    Converted probabilities of being treated to total percentages of clinical cases treated
+    :param prob: probability or array-like of probabilities, 0 to 1
+    :param interpolate: linear interpolation between integer percentages. Otherwise, the largest percentage with
+    probability not greater than prob is returned
+    :rtype: numpy.ndarray of the same shape as prob (integer, unless interpolate is True)
+    """
+    prob = numpy.asarray(prob, dtype=numpy.float64)
+    if numpy.any((prob < 0) | (prob > 1)) or numpy.any(numpy.isnan(prob)):
+        raise ValueError("Probability should be between 0 and 1")
+    if interpolate:
+        return numpy.interp(prob, _probabilities, _percentages)
+    return _percentages[numpy.searchsorted(_probabilities, prob, side="right") - 1].astype(int)
+
+
 def get_prob_from_percentage(perc):
     """
     Converted percentage of people treated to probability of being treated on a timestep
@@ -129,7 +169,7 @@ def get_prob_from_percentage(perc):
     assert perc < 101
     assert perc >= 0
 
-    return probability_list[perc]
+    return float(probabilities_from_percentages(perc))
 
 
 def get_percentage_from_prob(prob):
@@ -141,9 +181,4 @@ def get_percentage_from_prob(prob):
     assert prob >= 0
     assert prob <= 1
 
-    percentages = list(probability_list.keys())
-    percentages.sort()
-    for percentage in percentages:
-        if prob < probability_list[percentage]:
-            return percentage - 1
-    return 100
+    return int(percentages_from_probabilities(prob))
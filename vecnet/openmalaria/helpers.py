@@ -10,6 +10,15 @@
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import math
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy
+
+# Seeds of generated scenarios are prime numbers starting with this number
+SEED_START_WITH = 1000
 
 
 def is_prime(n):
@@ -21,14 +30,160 @@ def is_prime(n):
     return all(n % i for i in range(3, int(math.sqrt(n)) + 1, 2))
 
 
+class PrimeTable(object):
+    """
+    Table of prime numbers >= start_with, extended on demand with a segmented sieve of Eratosthenes.
+    table[i] is the i-th prime number (numbered from 0) starting with start_with.
+    """
+    def __init__(self, start_with=2, segment_size=1 << 16):
+        self.start_with = max(start_with, 2)
+        self.segment_size = segment_size
+        self._primes = numpy.empty(0, dtype=numpy.int64)
+        self._sieved_to = self.start_with
+        self._base_primes = numpy.empty(0, dtype=numpy.int64)
+        self._base_limit = 1
+
+    def _sieve_base(self, limit):
+        """ Primes up to limit (inclusive) to cross out multiples with """
+        if limit <= self._base_limit:
+            return
+        limit = max(limit, 2 * self._base_limit)
+        is_prime_number = numpy.ones(limit + 1, dtype=bool)
+        is_prime_number[:2] = False
+        for i in range(2, int(math.sqrt(limit)) + 1):
+            if is_prime_number[i]:
+                is_prime_number[i * i::i] = False
+        self._base_primes = numpy.flatnonzero(is_prime_number).astype(numpy.int64)
+        self._base_limit = limit
+
+    def _extend(self):
+        low = self._sieved_to
+        # Segments grow with the table, so the number of segments is logarithmic in its size
+        high = low + max(self.segment_size, low - self.start_with)
+        self._sieve_base(int(math.sqrt(high)) + 1)
+        is_prime_number = numpy.ones(high - low, dtype=bool)
+        for p in self._base_primes[self._base_primes * self._base_primes < high].tolist():
+            first = max(p * p, (low + p - 1) // p * p)
+            is_prime_number[first - low::p] = False
+        self._primes = numpy.concatenate((self._primes, numpy.flatnonzero(is_prime_number) + low))
+        self._sieved_to = high
+
+    def __len__(self):
+        """ Number of prime numbers computed so far """
+        return len(self._primes)
+
+    def __getitem__(self, index):
+        if index < 0:
+            raise IndexError("prime number index should be positive")
+        while index >= len(self._primes):
+            self._extend()
+        return int(self._primes[index])
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, start=0):
+        """
+        Generator function. Prime numbers starting with index start
+        """
+        index = start
+        while True:
+            while index >= len(self._primes):
+                self._extend()
+            # Yield computed primes in batches, the table may be extended in the meantime
+            stop = len(self._primes)
+            for prime in self._primes[index:stop].tolist():
+                yield prime
+            index = stop
+
+
+_seed_table = None
+
+
+def nth_seed(index):
+    """
+    Seed of scenario number index (numbered from 0): index-th prime number starting with SEED_START_WITH.
+    That's it, seeds of scenarios 0, 1, 2 are 1009, 1013, 1019
+    """
+    return int(seed_table()[index])
+
+
+def seed_table():
+    """
+    Shared PrimeTable of seeds (see nth_seed). Cached, so seeds are computed once per process
+    """
+    global _seed_table
+    if _seed_table is None:
+        _seed_table = PrimeTable(SEED_START_WITH)
+    return _seed_table
+
+
 def prime_numbers(start_with=2):
     """
     Sequence (generator) of prime numbers starting with start_with number.
     That's it, if start_with is 1000, first number generated will be 1009
-    Not the fastest algorithm, but doesn't require a lot of memory
     """
-    i = start_with
-    while True:
-        if is_prime(i):
-            yield i
-        i += 1
+    if start_with == SEED_START_WITH:
+        return seed_table().iterate()
+    return PrimeTable(start_with).iterate()
+
+
+class FileCache(object):
+    """
+    Bounded LRU cache of text file contents, keyed by resolved path and modification time of the file.
+    A file is read again if it has changed since it was cached.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """
+        :param max_bytes: limit of memory used by cached contents. Least recently used files are evicted first
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, filename):
+        """
+        Content of the file, from the cache if the file hasn't changed
+        """
+        path = os.path.realpath(filename)
+        stat = os.stat(path)
+        key = (path, getattr(stat, "st_mtime_ns", stat.st_mtime), stat.st_size)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                content, size = self._entries.pop(key)
+                self._entries[key] = (content, size)
+                return content
+            self.misses += 1
+        with open(path, "r") as fp:
+            content = fp.read()
+        # Memory used by the string object, not just length of the content
+        size = sys.getsizeof(content)
+        if size <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = (content, size)
+                    self.nbytes += size
+                    while self.nbytes > self.max_bytes:
+                        evicted_key, (evicted, evicted_size) = self._entries.popitem(last=False)
+                        self.nbytes -= evicted_size
+        return content
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Cache statistics: number of cached files, their total size in bytes (memory used by the cache), hits and
+        misses
+        """
+        return {"files": len(self._entries), "bytes": self.nbytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
@@ -8,152 +8,695 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import hashlib
+import itertools
+import mmap
+import os
+import re
 import six
-from collections import OrderedDict
+import numpy
+from collections import OrderedDict, namedtuple
 if six.PY3:
     from io import StringIO
 else:
     from StringIO import StringIO
 from .scenario.scenario import Scenario
+from . import arrayfile
+
+# Vector measures (Vector_Nv0, Vector_Nv, Vector_Ov and Vector_Sv) use a species' name as a third dimension
+VECTOR_MEASURES = frozenset([31, 32, 33, 34])
+
+# Version of OutputParser cache files. Change it whenever cached data changes, so old cache files are ignored
+CACHE_VERSION = 1
+CACHE_EXTENSION = ".omcache"
+
+# One survey record: survey number, third dimension, measure id and value (20 bytes, no padding)
+SURVEY_RECORD_DTYPE = numpy.dtype([("survey", "<i4"),
+                                   ("third_dimension", "<i4"),
+                                   ("measure", "<i4"),
+                                   ("value", "<f8")])
+
+
+class SurveyOutputStore(object):
+    """
+    Columnar storage for survey output (output.txt).
+
+    Records are kept in a single structured numpy array (see SURVEY_RECORD_DTYPE) sorted by
+    (measure, third dimension), so store[(measure_id, third_dimension)] returns a zero-copy view of the records
+    for that measure. Species' names of vector measures are stored as negative codes: -1 - i refers to
+    third_dimension_labels[i].
+    """
+    def __init__(self, records, survey_time_list, third_dimension_labels=(), presorted=False):
+        """
+        :param presorted: records are already sorted by (measure, third dimension), e.g. loaded from
+        SurveyOutputStore.records saved earlier. Records are used as is (memory-mapped arrays are not copied)
+        """
+        records = numpy.asarray(records, dtype=SURVEY_RECORD_DTYPE)
+        if not presorted:
+            # Stable sort keeps the order of survey numbers within a (measure, third dimension) pair
+            key = (records["measure"].astype(numpy.int64) << 32) | \
+                  (records["third_dimension"].astype(numpy.int64) & 0xFFFFFFFF)
+            order = numpy.argsort(key, kind="stable")
+            del key
+            records = records.take(order)
+        self.records = records
+        self.survey_times = numpy.asarray(survey_time_list or [], dtype=numpy.int64)
+        self.third_dimension_labels = list(third_dimension_labels)
+        self._index = self._build_index()
+
+    def _build_index(self):
+        index = OrderedDict()
+        count = len(self.records)
+        if count == 0:
+            return index
+        measure = self.records["measure"]
+        third_dimension = self.records["third_dimension"]
+        boundaries = numpy.flatnonzero((measure[1:] != measure[:-1]) |
+                                       (third_dimension[1:] != third_dimension[:-1])) + 1
+        starts = numpy.concatenate(([0], boundaries))
+        stops = numpy.concatenate((boundaries, [count]))
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            key = self._decode_key(int(measure[start]), int(third_dimension[start]))
+            index[key] = (start, stop)
+        return index
+
+    def _decode_key(self, measure_id, third_dimension):
+        if third_dimension < 0:
+            return measure_id, self.third_dimension_labels[-1 - third_dimension]
+        return measure_id, third_dimension
+
+    # Columns of the store. Each one is a view of the underlying records array
+    @property
+    def survey(self):
+        return self.records["survey"]
+
+    @property
+    def third_dimension(self):
+        return self.records["third_dimension"]
+
+    @property
+    def measure(self):
+        return self.records["measure"]
+
+    @property
+    def value(self):
+        return self.records["value"]
+
+    @property
+    def nbytes(self):
+        return self.records.nbytes
+
+    def __getitem__(self, key):
+        """
+        Records for (measure_id, third_dimension) pair
+        :rtype: numpy.ndarray
+        """
+        start, stop = self._index[key]
+        return self.records[start:stop]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        return list(self._index.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self._index]
+
+    def get(self, key, default=None):
+        if key in self._index:
+            return self[key]
+        return default
+
+    def get_values(self, key):
+        """ Values of the measure, in order of survey numbers (a view, not a copy) """
+        start, stop = self._index[key]
+        return self.records["value"][start:stop]
+
+    def get_times(self, key):
+        """ Survey timesteps of the measure """
+        start, stop = self._index[key]
+        return self.survey_times[self.records["survey"][start:stop] - 1]
+
+    def to_dict(self):
+        """
+        Convert to the format used by OutputParser.survey_output_data by default:
+        {(measure_id, third_dimension): [[timestep, value], ...]}
+        """
+        survey_output_data = dict()
+        for key in self._index:
+            survey_output_data[key] = [[time, value] for time, value in
+                                       zip(self.get_times(key).tolist(), self.get_values(key).tolist())]
+        return survey_output_data
+
+
+SurveyRecord = namedtuple("SurveyRecord", ["survey", "third_dimension", "measure", "value"])
+CtsRow = namedtuple("CtsRow", ["timestep", "values"])
+
+
+def iter_survey_records(survey_output_file, measures=None):
+    """
+    Generator function. Yields SurveyRecord for every line of survey output file (output.txt), one at a time.
+    survey_output_file - open file or content of output.txt
+    measures - optional collection of measure ids; records of other measures are skipped without being converted
+    """
+    # File format documented on
+    # https://code.google.com/p/openmalaria/wiki/OutputFiles
+    #
+    # survey number <tab> third dimension <tab> measure <tab> value
+    #
+    # Example:
+    # 1	1	0	1000
+    #  1	1	3	382
+    #  1	1	14	13816
+    #  1	1	56	0
+    #  1	0	36	0.348776
+    #  2	1	0	1000
+    #  2	1	3	371
+    #  2	1	14	103
+    #  2	1	56	585
+    #  2	0	36	0.170824
+    #  ...
+    if isinstance(survey_output_file, six.string_types):
+        survey_output_file = StringIO(survey_output_file)
+    if measures is None:
+        for line in survey_output_file:
+            yield SurveyRecord(*_parse_survey_line(line))
+        return
+    for line in survey_output_file:
+        # Measures are filtered before the line is converted
+        if int(line.split("\t", 3)[2]) in measures:
+            yield SurveyRecord(*_parse_survey_line(line))
+
+
+def _third_dimension(third_dimension, measure_id):
+    """ Third dimension of survey output that is not a plain non-negative number """
+    # For vector measures (Vector_Nv0, Vector_Nv, Vector_Ov and Vector_Sv) third dimension is
+    # a species' name, not a number
+    if measure_id in VECTOR_MEASURES and not third_dimension.strip().lstrip("+-").isdigit():
+        return str(third_dimension)
+    # Raises ValueError if not a number and not a vector measure
+    return int(third_dimension)
+
+
+def _parse_survey_line(line):
+    """
+    Fields of a line of survey output file: (survey number, third dimension, measure id, value)
+    """
+    # Split string line into four numbers
+    data = line.strip("\r\n").split("\t")
+    # Check if we have exactly 4 columns
+    assert len(data) == 4
+    # Output can be associated with several different measures; the code under the label "id" in the first
+    # column of the survey measures table appears in the third column of output.
+    measure_id = int(data[2])
+    # The "third dimension" (in the second column for historical reasons) specifies another dimension of the
+    # output. For many measures it identifies the human age group, for a few measures it is unused, and
+    # for some it holds a mosquito species, a drug identifier or a cohort number.
+    # Species' names are common (vector measures), so they are not handled by catching int()'s ValueError
+    third_dimension = int(data[1]) if data[1].isdigit() else _third_dimension(data[1], measure_id)
+    # The survey number starts from one and corresponds to the survey time point.
+    # (Exception: measure 21 has one record from the end of the simulation and does not use the survey number
+    # or third dimension columns.)
+    return int(data[0]), third_dimension, measure_id, float(data[3])
+
+
+def read_cts_header(cts_output_file):
+    """
+    Read the header of continuous output file (ctsout.txt) and return the list of measures in it,
+    excluding the timestep column. File position is left at the first line of data.
+    """
+    # File format documented on
+    # https://code.google.com/p/openmalaria/wiki/OutputFiles
+    # Example:
+    # ##	##
+    #  timestep	simulated EIR	GVI coverage
+    #  0	0.476359	0
+    #  1	0.425191	0
+    #  2	0.430878	0
+    #  ...
+    # skip first line in cts output file
+    # (##  ##)
+    cts_output_file.readline()
+    # read and parse header
+    # timestep <tab> simulated EIR <tab> GVI coverage
+    header = cts_output_file.readline().strip("\r\n")
+    measures = header.split("\t")
+    # Sanity check
+    if measures[0] != "timestep":
+        raise TypeError("Invalid ctsoutput file, first column is not timestep")
+    return measures[1:]
+
+
+def iter_cts_rows(cts_output_file, measures=None):
+    """
+    Generator function. Yields CtsRow(timestep, values) for every line of continuous output file (ctsout.txt),
+    values being a tuple of floats in the order of measures in the header.
+    cts_output_file - open file or content of ctsout.txt
+    measures - list of measures returned by read_cts_header, if the header has already been read
+    """
+    if isinstance(cts_output_file, six.string_types):
+        cts_output_file = StringIO(cts_output_file)
+    if measures is None:
+        measures = read_cts_header(cts_output_file)
+    columns = len(measures) + 1
+    for line in cts_output_file:
+        data = line.split("\t")
+        if len(data) < columns:
+            raise TypeError("Invalid ctsoutput file, expected %s columns, got %s" % (columns, len(data)))
+        yield CtsRow(int(data[0]), tuple(float(value) for value in data[1:columns]))
+
+
+# Marks OutputParser attributes that have not been parsed yet
+_NOT_PARSED = object()
+
+
+# Size of blocks fed to numpy.loadtxt by bulk parsers
+BLOCK_SIZE = 1 << 18
+
+# Third dimension that is not a number (i.e. a species' name); value is the last column, so "nan" doesn't match
+_LABEL = re.compile(br"\t([^\t\n0-9+\-.][^\t\n]*)\t")
+# Characters of blocks with numbers only. Blocks with anything else may contain species' names
+_NUMERIC = b"0123456789\t\r\n.-+eE"
+
+
+def _blocks(fp, block_size=BLOCK_SIZE):
+    """
+    Generator function. Splits the rest of fp (starting from the current position) into blocks of bytes of about
+    block_size that end on a line boundary. Regular files are memory-mapped, so the file is never copied as a whole.
+    """
+    try:
+        offset = fp.tell()
+        memory_map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, IOError, OSError, ValueError):
+        # Not a regular file (e.g. StringIO), or an empty one
+        memory_map = None
+    if memory_map is not None:
+        size = len(memory_map)
+        start = offset
+        while start < size:
+            end = memory_map.find(b"\n", min(start + block_size, size) - 1)
+            end = size if end == -1 else end + 1
+            yield memory_map[start:end]
+            start = end
+        memory_map.close()
+        return
+    leftover = b""
+    while True:
+        block = fp.read(block_size)
+        if not block:
+            break
+        if not isinstance(block, bytes):
+            block = block.encode("utf-8")
+        end = block.rfind(b"\n") + 1
+        if end == 0:
+            leftover += block
+            continue
+        yield leftover + block[:end]
+        leftover = block[end:]
+    if leftover:
+        yield leftover
+
+
+def _substitute_labels(blocks, labels):
+    """
+    Replace species' names in the third dimension column with negative codes (-1 for the first name).
+    New names are added to labels dict.
+    """
+    for block in blocks:
+        if block.translate(None, _NUMERIC):
+            match = _LABEL.search(block)
+            while match is not None:
+                name = match.group(1)
+                code = labels.setdefault(name.decode("utf-8"), -1 - len(labels))
+                position = match.start()
+                block = block.replace(b"\t" + name + b"\t", ("\t%d\t" % code).encode("ascii"))
+                match = _LABEL.search(block, position)
+        yield block
+
+
+def _lines(blocks):
+    """ Split blocks into lines for numpy.loadtxt """
+    return itertools.chain.from_iterable(block.decode("utf-8").splitlines() for block in blocks)
+
+
+def load_survey_records(survey_output_file):
+    """
+    Parse survey output file (output.txt) in bulk.
+    The file is memory-mapped (if possible) and decoded by numpy.loadtxt, block by block, straight into
+    the final record array, so peak memory stays close to the size of that array.
+
+    :returns: (records, third_dimension_labels) - an array of SURVEY_RECORD_DTYPE and the list of species' names
+    used by vector measures (referenced by negative third dimension codes, see SurveyOutputStore)
+    """
+    if isinstance(survey_output_file, six.string_types):
+        survey_output_file = StringIO(survey_output_file)
+    labels = OrderedDict()
+    records = numpy.loadtxt(_lines(_substitute_labels(_blocks(survey_output_file), labels)),
+                            dtype=SURVEY_RECORD_DTYPE, delimiter="\t", comments=None, ndmin=1)
+    if labels:
+        measures = records["measure"][records["third_dimension"] < 0]
+        if not numpy.isin(measures, list(VECTOR_MEASURES)).all():
+            # Only vector measures use species' names as third dimension
+            raise ValueError("Invalid survey output file, third dimension is not a number")
+    return records, list(labels.keys())
+
+
+def load_cts_columns(cts_output_file):
+    """
+    Parse continuous output file (ctsout.txt) in bulk.
+    :returns: OrderedDict {measure: numpy array of values}, in order of columns in the file
+    """
+    if isinstance(cts_output_file, six.string_types):
+        cts_output_file = StringIO(cts_output_file)
+    measures = read_cts_header(cts_output_file)
+    data = numpy.loadtxt(_lines(_blocks(cts_output_file)), dtype=numpy.float64,
+                         delimiter="\t", comments=None, ndmin=2, usecols=range(1, len(measures) + 1))
+    # One contiguous row per measure, so every column below is a contiguous view
+    data = numpy.ascontiguousarray(data.T)
+    return OrderedDict(zip(measures, data))
+
+
+def _file_position(fp):
+    """ Wrap strings into StringIO and remember current position in the file, so it can be parsed later """
+    if fp is None:
+        return None
+    if isinstance(fp, six.string_types):
+        fp = StringIO(fp)
+    try:
+        offset = fp.tell()
+    except (AttributeError, IOError, OSError):
+        # Not seekable (e.g. a pipe). Can be read once only
+        offset = None
+    return fp, offset
+
+
+def _rewind(position):
+    fp, offset = position
+    if offset is not None:
+        fp.seek(offset)
+    return fp
+
+
+# Resolved metadata of a measure. measure_id is the index in surveyFileMap or continuousFileMap (None if the
+# continuous measure is unknown), name is the label of the measure, e.g. "nPatent(0.0 - 5)" or "N_v0(gambiae)",
+# measure is its base name in the map, kind is the kind of its third dimension ("age group", "vector species", ...)
+MeasureInfo = namedtuple("MeasureInfo", ["measure_id", "third_dimension", "name", "measure", "unit", "kind",
+                                         "description"])
+_UNIT_PATTERN = re.compile(r"\bunits?: ([^.,]+)", re.IGNORECASE)
+
+
+def _unit(description):
+    """ Unit of a measure given in its description ("Units: ..."), None if there is none """
+    match = _UNIT_PATTERN.search(description or "")
+    return match.group(1).strip() if match else None
+
+
+def split_cts_measure(name):
+    """
+    Split a column name of ctsout.txt into its base name and vector species:
+    "N_v0(gambiae)" -> ("N_v0", "gambiae"), "simulated EIR" -> ("simulated EIR", None)
+    """
+    if name.endswith(")") and "(" in name:
+        measure, species = name[:-1].rsplit("(", 1)
+        if measure in continuous_measure_index:
+            return measure, species
+    return name, None
+
+
+class MeasureCatalog(object):
+    """
+    Resolved names, units and third dimension kinds of survey and continuous measures of a scenario.
+    Age groups are resolved once, and every measure is resolved on first lookup only, so labelling many records
+    takes constant time per record.
+    """
+    def __init__(self, age_groups=()):
+        """
+        :param age_groups: age groups of the scenario, as returned by AgeGroup.group
+        """
+        self.age_groups = ["%s - %s" % (age_group["lowerbound"], age_group["upperbound"])
+                           for age_group in age_groups]
+        self._survey = {}
+        self._cts = {}
+
+    def survey(self, measure_id, third_dimension):
+        """
+        :param third_dimension: age group (from 1), vector species, cohort or drug id, as in output.txt
+        :rtype: MeasureInfo
+        """
+        key = (measure_id, third_dimension)
+        info = self._survey.get(key)
+        if info is None:
+            if not 0 <= measure_id < len(surveyFileMap) or surveyFileMap[measure_id] is None:
+                raise KeyError("Unknown survey measure %s" % measure_id)
+            measure, kind, description = surveyFileMap[measure_id]
+            name = measure
+            if kind == "age group":
+                if not 1 <= third_dimension <= len(self.age_groups):
+                    raise IndexError("Age group %s is not defined in monitoring section" % third_dimension)
+                name += "(%s)" % self.age_groups[third_dimension - 1]
+            elif kind == "vector species":
+                name += "(%s)" % third_dimension
+            info = MeasureInfo(measure_id, third_dimension, name, measure, _unit(description), kind, description)
+            self._survey[key] = info
+        return info
+
+    def survey_name(self, measure_id, third_dimension):
+        return self.survey(measure_id, third_dimension).name
+
+    def cts(self, name):
+        """
+        :param name: column of ctsout.txt, e.g. "N_v0(gambiae)"
+        :rtype: MeasureInfo
+        """
+        info = self._cts.get(name)
+        if info is None:
+            measure, species = split_cts_measure(name)
+            measure_id = continuous_measure_index.get(measure)
+            description = continuousFileMap[measure_id][2] if measure_id is not None else None
+            info = MeasureInfo(measure_id, species, name, measure, _unit(description),
+                               "vector species" if species is not None else None, description)
+            self._cts[name] = info
+        return info
+
 
 class OutputParser:
     def __init__(self, input_file,
                  survey_output_file=None,
-                 cts_output_file=None):
-        if isinstance(input_file, six.string_types):
-            input_file = StringIO(input_file)
-        self.xml = input_file.read()
-        self.scenario = Scenario(self.xml)
+                 cts_output_file=None,
+                 columnar=False,
+                 lazy=False,
+                 cache_dir=None):
+        """
+        :param columnar: parse output files in bulk into numpy arrays. Survey output is stored in
+        a SurveyOutputStore instead of a dict of lists and continuous output values are numpy arrays
+        :param lazy: don't parse anything in constructor. Scenario, continuous and survey output files are parsed
+        on first access to the related attribute (scenario, cts_output_data, survey_output_data). Files must stay
+        open until then.
+        :param cache_dir: directory for binary cache of parsed output (implies columnar mode). Cache files are
+        named after a content hash of the scenario and both output files, so a cache file is never used once any
+        of the inputs changes. Cached arrays are memory-mapped, the scenario is only parsed if requested.
+        """
+        self.columnar = columnar or cache_dir is not None
+        self.cache_dir = cache_dir
+        self._input_file = _file_position(input_file)
+        self._cts_output_file = _file_position(cts_output_file)
+        self._survey_output_file = _file_position(survey_output_file)
+        self._xml = _NOT_PARSED
+        self._scenario = _NOT_PARSED
+        self._survey_time_list = _NOT_PARSED
+        self._cts_output_data = _NOT_PARSED
+        self._survey_output_data = _NOT_PARSED
+        self._survey_measures = None
+        self._measure_catalog = None
+        self._cache_checked = cache_dir is None
+        if cache_dir is not None:
+            for position in (self._input_file, self._cts_output_file, self._survey_output_file):
+                if position is not None and position[1] is None:
+                    raise ValueError("Files must be seekable to use cache")
+
+        if not lazy:
+            if cache_dir is not None:
+                self._load_cache()
+            # Survey timesteps from input file are required to parse Survey output
+            self.survey_time_list
+            if cts_output_file is not None:
+                self.cts_output_data
+            if survey_output_file is not None:
+                self.survey_output_data
 
-        # Survey timesteps from input file are required to parse Survey output
-        self.survey_time_list = self.scenario.monitoring.surveys
+    @property
+    def xml(self):
+        if self._xml is _NOT_PARSED:
+            self._xml = _rewind(self._input_file).read()
+        return self._xml
 
-        # Parse continuous output file
-        self._parse_continuous_output_file(cts_output_file)
+    @property
+    def scenario(self):
+        """
+        :rtype: Scenario
+        """
+        if self._scenario is _NOT_PARSED:
+            self._scenario = Scenario(self.xml)
+        return self._scenario
 
-        # Parse survey output file
-        self._parse_survey_output_file(survey_output_file)
+    @property
+    def survey_time_list(self):
+        if self._survey_time_list is _NOT_PARSED:
+            self._survey_time_list = self.scenario.monitoring.surveys
+        return self._survey_time_list
+
+    @property
+    def cts_output_data(self):
+        if not self._cache_checked:
+            self._load_cache()
+        if self._cts_output_data is _NOT_PARSED:
+            if self._cts_output_file is None:
+                raise AttributeError("cts_output_data")
+            self._cts_output_data = self._parse_continuous_output_file(_rewind(self._cts_output_file))
+        return self._cts_output_data
+
+    @property
+    def survey_output_data(self):
+        if not self._cache_checked:
+            self._load_cache()
+        if self._survey_output_data is _NOT_PARSED:
+            if self._survey_output_file is None:
+                raise AttributeError("survey_output_data")
+            self._survey_output_data = self._parse_survey_output_file(_rewind(self._survey_output_file))
+        return self._survey_output_data
+
+    def _cache_key(self):
+        """ Content hash of scenario and output files """
+        digest = hashlib.sha1(("vecnet.openmalaria.OutputParser %s" % CACHE_VERSION).encode("ascii"))
+        for position in (self._input_file, self._survey_output_file, self._cts_output_file):
+            file_digest = hashlib.sha1()
+            if position is not None:
+                for block in _blocks(_rewind(position)):
+                    file_digest.update(block)
+            digest.update(file_digest.digest() if position is not None else b"\0" * file_digest.digest_size)
+        return digest.hexdigest()
+
+    def _load_cache(self):
+        self._cache_checked = True
+        filename = os.path.join(self.cache_dir, self._cache_key() + CACHE_EXTENSION)
+        try:
+            metadata, arrays = arrayfile.read_arrays(filename)
+        except (IOError, OSError, ValueError, arrayfile.ArrayFileError):
+            # No cache file yet (or a broken one)
+            self._write_cache(filename)
+            return
+        self._survey_time_list = metadata["survey_time_list"]
+        if metadata["cts_measures"] is not None:
+            self._cts_output_data = OrderedDict(zip(metadata["cts_measures"], arrays["cts"]))
+        if metadata["third_dimension_labels"] is not None:
+            self._survey_output_data = SurveyOutputStore(arrays["survey"], self._survey_time_list,
+                                                         metadata["third_dimension_labels"], presorted=True)
+
+    def _write_cache(self, filename):
+        metadata = {"survey_time_list": self.survey_time_list, "cts_measures": None, "third_dimension_labels": None}
+        arrays = []
+        if self._cts_output_file is not None:
+            metadata["cts_measures"] = list(self.cts_output_data.keys())
+            arrays.append(("cts", numpy.array(list(self.cts_output_data.values()), dtype=numpy.float64)))
+        if self._survey_output_file is not None:
+            metadata["third_dimension_labels"] = self.survey_output_data.third_dimension_labels
+            arrays.append(("survey", self.survey_output_data.records))
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            arrayfile.write_arrays(filename, arrays, metadata)
+        except (IOError, OSError):
+            # Cache is an optimization only - parsed data is still valid if it can't be saved
+            pass
 
     def _parse_continuous_output_file(self, cts_output_file):
-        # File format documented on
-        # https://code.google.com/p/openmalaria/wiki/OutputFiles
-        # Example:
-        # ##	##
-        #  timestep	simulated EIR	GVI coverage
-        #  0	0.476359	0
-        #  1	0.425191	0
-        #  2	0.430878	0
-        #  3	0.434576	0
-        #  4	0.436511	0
-        #  5	0.434047	0
-        #  ...
         if cts_output_file is not None:
             if isinstance(cts_output_file, six.string_types):
                 cts_output_file = StringIO(cts_output_file)
-            # skip first line in cts output file
-            # (##  ##)
-            cts_output_file.readline()
-            # read and parse header
-            # timestep <tab> simulated EIR <tab> GVI coverage
-            header = cts_output_file.readline().strip("\r\n")
-            measures = header.split("\t")
-            # Sanity check
-            if measures[0] != "timestep":
-                raise TypeError("Invalid ctsoutput file, first column is not timestep")
-
-            # Parse data in continuous output
-            cts_output_data = OrderedDict()
-            for measure in measures:
-                cts_output_data[measure] = []
-            # cts_output_data = {measure: [] for measure in measures}
-
-            for line in cts_output_file:  # readline()
-                data = line.split("\t")
-                for i in range(0, len(measures)):
-                    cts_output_data[measures[i]].append(float(data[i]))
+            if self.columnar:
+                return load_cts_columns(cts_output_file)
+            measures = read_cts_header(cts_output_file)
+            columns = [[] for _ in measures]
+            for row in iter_cts_rows(cts_output_file, measures):
+                for column, value in zip(columns, row.values):
+                    column.append(value)
             # Can also check if timesteps are in order
-            cts_output_data.pop("timestep")
-            self.cts_output_data = cts_output_data
+            return OrderedDict(zip(measures, columns))
 
     def _parse_survey_output_file(self, survey_output_file):
-        # File format documented on
-        # https://code.google.com/p/openmalaria/wiki/OutputFiles
-        #
-        # survey number <tab> third dimension <tab> measure <tab> value
-        #
-        # Example:
-        # 1	1	0	1000
-        #  1	1	3	382
-        #  1	1	14	13816
-        #  1	1	56	0
-        #  1	0	36	0.348776
-        #  2	1	0	1000
-        #  2	1	3	371
-        #  2	1	14	103
-        #  2	1	56	585
-        #  2	0	36	0.170824
-        #  ...
         if survey_output_file is not None:
             if isinstance(survey_output_file, six.string_types):
                 survey_output_file = StringIO(survey_output_file)
+            if self.columnar:
+                records, labels = load_survey_records(survey_output_file)
+                return SurveyOutputStore(records, self.survey_time_list, labels)
             survey_output_data = dict()
-            for line in survey_output_file:
-                # Split string line into four numbers
-                line = line.strip("\r\n")
-                data = line.split("\t")
-                # Check if we have exactly 4 columns
-                assert len(data) == 4
-                # The survey number starts from one and corresponds to the survey time point.
-                # (Exception: measure 21
-                # has one record from the end of the simulation and does not use the survey number or third dimension
-                # columns.)
-                survey_number = int(data[0])
-                # Output can be associated with several different measures; the code under the label "id" in the first
-                # column of the survey measures table appears in the third column of output.
-                measure_id = int(data[2])
-                # The "third dimension" (in the second column for historical reasons) specifies another dimension of the
-                # output. For many measures it identifies the human age group, for a few measures it is unused, and
-                # for some it holds a mosquito species, a drug identifier or a cohort number.
-                try:
-                    third_dimension = int(data[1])
-                except ValueError as e:
-                    # For vector measures (Vector_Nv0, Vector_Nv, Vector_Ov and Vector_Sv) third dimension is
-                    # a species' name, not a number
-                    if measure_id in ({31, 32, 33, 34}):
-                        third_dimension = str(data[1])
-                    else:
-                        # If not a vector measure, pass re-raise the exception
-                        raise e
+            survey_time_list = self.survey_time_list
+            # map() instead of iter_survey_records: no generator frame or SurveyRecord per line of output.txt
+            for survey_number, third_dimension, measure_id, value in six.moves.map(_parse_survey_line,
+                                                                                   survey_output_file):
                 # Value of measure for specified survey number (can be translated to timestep number)
-                value = float(data[3])
-                if (measure_id, third_dimension) in survey_output_data:
-                    survey_output_data[(measure_id, third_dimension)].append(
-                        [self.survey_time_list[survey_number - 1], value])
+                item = [survey_time_list[survey_number - 1], value]
+                key = (measure_id, third_dimension)
+                if key in survey_output_data:
+                    survey_output_data[key].append(item)
                 else:
-                    survey_output_data[(measure_id, third_dimension)] = \
-                        [[self.survey_time_list[survey_number - 1], value]]
-            self.survey_output_data = survey_output_data
+                    survey_output_data[key] = [item]
             return survey_output_data
 
     def get_cts_measures(self):
+        if self._cts_output_data is _NOT_PARSED and self._cts_output_file is not None:
+            # Only the header is required to list measures
+            return read_cts_header(_rewind(self._cts_output_file))
         return list(self.cts_output_data.keys())
 
     def get_survey_measures(self):
+        if self._survey_output_data is _NOT_PARSED and self._survey_output_file is not None:
+            # Survey times (and the scenario) are not required to list measures
+            if self._survey_measures is None:
+                survey_measures = OrderedDict()
+                for record in iter_survey_records(_rewind(self._survey_output_file)):
+                    survey_measures[(record.measure, record.third_dimension)] = None
+                self._survey_measures = list(survey_measures.keys())
+            return list(self._survey_measures)
         return list(self.survey_output_data.keys())
 
+    def export_survey(self, filename, format=None):
+        """
+        Save survey output to filename in a columnar format, see export.export_survey
+        """
+        from .export import export_survey
+        export_survey(filename, self, format)
+
+    def export_cts(self, filename, format=None):
+        """
+        Save continuous output to filename in a columnar format, see export.export_cts
+        """
+        from .export import export_cts
+        export_cts(filename, self, format)
+
+    @property
+    def measure_catalog(self):
+        """
+        Measure metadata of this scenario, built once
+        :rtype: MeasureCatalog
+        """
+        if self._measure_catalog is None:
+            self._measure_catalog = MeasureCatalog(self.scenario.monitoring.ageGroup.group)
+        return self._measure_catalog
+
     def get_monitoring_age_group(self, third_dimension):
         return self.scenario.monitoring.ageGroup.group[third_dimension]
 
     def get_survey_measure_name(self, measure_id, third_dimension):
-        measure_name = ""
-        if surveyFileMap[measure_id][1] == "age group":
-            age_group = self.get_monitoring_age_group(third_dimension - 1)
-            age_group_name = "%s - %s" % (age_group["lowerbound"], age_group["upperbound"])
-            measure_name = "(%s)" % age_group_name
-        elif surveyFileMap[measure_id][1] == "vector species":
-            measure_name = "(%s)" % third_dimension
-        measure_name = surveyFileMap[measure_id][0] + measure_name
-        return measure_name
+        return self.measure_catalog.survey_name(measure_id, third_dimension)
 
 
 continuousFileMap = \
@@ -340,3 +883,8 @@ surveyFileMap = \
         # 72 : 'nHostDrugConcNonZero',
         # 73 : 'sumLogDrugConcNonZero'
     ]
+
+# Reverse indexes of the maps: {measure name: measure id}
+survey_measure_index = dict((entry[0], measure_id) for measure_id, entry in enumerate(surveyFileMap)
+                            if entry is not None)
+continuous_measure_index = dict((entry[0], measure_id) for measure_id, entry in enumerate(continuousFileMap))
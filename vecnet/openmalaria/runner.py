@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Running simulations of an experiment on the local machine.
+
+Every scenario is saved to its own working directory (scenario1, scenario2, ... - the same numbering as om_expand)
+and the simulator is started there by a pool of threads, so no more than `workers` simulations run at a time.
+Progress is appended to a state file, so an interrupted run can be resumed without running finished simulations
+again.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shlex
+import subprocess
+import threading
+import traceback
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from .batch import SCENARIO_FILENAME, SURVEY_OUTPUT_FILENAME, CTS_OUTPUT_FILENAME, parse_many
+
+# Default simulator command. {scenario}, {directory} and {name} are replaced with the absolute path to the
+# scenario file, the absolute path to the working directory and the name of the simulation (e.g. scenario1)
+DEFAULT_COMMAND = ("openmalaria", "--scenario", "{scenario}")
+STATE_FILENAME = "state.jsonl"
+STDOUT_FILENAME = "stdout.txt"
+STDERR_FILENAME = "stderr.txt"
+
+# Other braces in the command (e.g. ${HOME} or awk programs) are passed to the simulator unchanged
+_PLACEHOLDER = re.compile(r"\{(scenario|directory|name)\}")
+
+
+class SimulationResult(object):
+    """
+    Result of a single simulation, as returned by run_experiment.
+
+    status - "done" or "failed"
+    returncode - exit code of the last attempt, None if the simulator could not be started or was killed on timeout
+    attempts - number of times the simulator was started (in the run that finished the simulation)
+    resumed - the simulation was finished in an earlier run and was not started again
+    error - description of the failure of the last attempt, None on success
+    output - ParsedOutput, if outputs were parsed
+    """
+    def __init__(self, name, directory, parameters=None, seed=None, status=None, returncode=None, attempts=0,
+                 error=None, resumed=False):
+        self.name = name
+        self.directory = directory
+        self.parameters = parameters
+        self.seed = seed
+        self.status = status
+        self.returncode = returncode
+        self.attempts = attempts
+        self.error = error
+        self.resumed = resumed
+        self.output = None
+
+    @property
+    def ok(self):
+        return self.status == "done"
+
+    def __repr__(self):
+        return "<SimulationResult %s %s>" % (self.name, self.status)
+
+
+class RunState(object):
+    """
+    State of simulations of an experiment, saved in a json lines file: one record per finished simulation, later
+    records of the same simulation replace earlier ones. Records are appended, so saving doesn't depend on the
+    size of the experiment, and a record truncated by a crash is ignored.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.records = OrderedDict()
+        self._lock = threading.Lock()
+        if os.path.exists(filename):
+            with open(filename) as fp:
+                for line in fp:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Incomplete record
+                        continue
+                    self.records[record["name"]] = record
+
+    def get(self, name):
+        """
+        :returns: the latest record of simulation name, or None
+        """
+        return self.records.get(name)
+
+    def update(self, record):
+        """
+        Save record of a simulation. Record is a dict with "name" key
+        """
+        with self._lock:
+            self.records[record["name"]] = record
+            with open(self.filename, "a") as fp:
+                fp.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def format_command(command, **values):
+    """
+    Simulator arguments of command (list of arguments or command line) with {scenario}, {directory} and {name}
+    replaced with values
+    """
+    if isinstance(command, six.string_types):
+        command = shlex.split(command)
+    return [_PLACEHOLDER.sub(lambda match: values[match.group(1)], argument) for argument in command]
+
+
+def remove_outputs(directory):
+    """
+    Remove output files of a previous attempt from a simulation directory, so they aren't mistaken for outputs of
+    the next one
+    """
+    for filename in (SURVEY_OUTPUT_FILENAME, CTS_OUTPUT_FILENAME):
+        if os.path.exists(os.path.join(directory, filename)):
+            os.remove(os.path.join(directory, filename))
+
+
+def attempt_error(directory, returncode):
+    """
+    :returns: description of the failure of a finished simulator process, None if the simulation was successful
+    """
+    if returncode != 0:
+        return "Exit code %s" % returncode
+    if not os.path.exists(os.path.join(directory, SURVEY_OUTPUT_FILENAME)):
+        return "No %s" % SURVEY_OUTPUT_FILENAME
+    return None
+
+
+def run_simulation(directory, command=DEFAULT_COMMAND, timeout=None, retries=0, name=None):
+    """
+    Run simulator in directory (with scenario.xml in it).
+    A simulation is successful if the simulator exits with code 0 and output.txt is created. Failed simulation is
+    started again up to `retries` times.
+    stdout and stderr of the simulator are saved to stdout.txt and stderr.txt in directory
+    :param command: list of arguments or command line, see DEFAULT_COMMAND
+    :param timeout: maximum duration of a single attempt, in seconds. Simulator is killed after timeout
+    :returns: (returncode, attempts, error) tuple. error is None on success
+    """
+    directory = os.path.abspath(directory)
+    arguments = format_command(command, scenario=os.path.join(directory, SCENARIO_FILENAME), directory=directory,
+                               name=name or os.path.basename(directory))
+    returncode, error = None, None
+    for attempt in range(1, retries + 2):
+        remove_outputs(directory)
+        timed_out = []
+        with open(os.path.join(directory, STDOUT_FILENAME), "wb") as stdout, \
+                open(os.path.join(directory, STDERR_FILENAME), "wb") as stderr:
+            try:
+                process = subprocess.Popen(arguments, cwd=directory, stdout=stdout, stderr=stderr)
+            except OSError as e:
+                # Simulator not found or not executable, no point in trying again
+                return None, attempt, "Can't start %s: %s" % (arguments[0], e)
+            timer = None
+            if timeout is not None:
+                def kill():
+                    timed_out.append(True)
+                    process.kill()
+                timer = threading.Timer(timeout, kill)
+                timer.start()
+            try:
+                returncode = process.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+        if timed_out:
+            returncode, error = None, "Timeout after %s seconds" % timeout
+        else:
+            error = attempt_error(directory, returncode)
+        if error is None:
+            return returncode, attempt, None
+    return returncode, retries + 1, error
+
+
+def run_experiment(experiment, directory, command=DEFAULT_COMMAND, workers=None, timeout=None, retries=0,
+                   generate_seed=False, resume=True, parse=True, parse_workers=None, cache_dir=None, progress=None):
+    """
+    Run all simulations of an experiment.
+
+    :param experiment: ExperimentSpecification
+    :param directory: directory for working directories of simulations and the state file
+    :param command: simulator command, see DEFAULT_COMMAND and run_simulation
+    :param workers: number of simulations running at the same time (number of CPUs by default)
+    :param timeout: maximum duration of a simulation attempt, in seconds
+    :param retries: number of times a failed simulation is started again
+    :param generate_seed: replace @seed@ placeholder, see ExperimentSpecification.scenarios
+    :param resume: skip simulations that were finished in an earlier run with the same scenario, according to the
+    state file. Otherwise all simulations are run and the state file is started anew
+    :param parse: parse outputs of successful simulations with OutputParser (see batch.parse_many), they are
+    saved to SimulationResult.output
+    :param parse_workers: number of processes parsing outputs, see batch.parse_many
+    :param cache_dir: OutputParser binary cache directory
+    :param progress: function called as progress(done, total, result) every time a simulation is finished
+    :returns: list of SimulationResult, in order of scenarios
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    state_filename = os.path.join(directory, STATE_FILENAME)
+    if not resume and os.path.exists(state_filename):
+        os.remove(state_filename)
+    state = RunState(state_filename)
+    total = len(experiment)
+    results = []
+    lock = threading.Lock()
+    done = [0]
+
+    def finish(result):
+        with lock:
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], total, result)
+
+    def run(result, sha256):
+        try:
+            result.returncode, result.attempts, result.error = run_simulation(
+                result.directory, command, timeout, retries, result.name)
+        except Exception:
+            result.attempts, result.error = max(result.attempts, 1), traceback.format_exc()
+        result.status = "done" if result.error is None else "failed"
+        state.update({"name": result.name, "sha256": sha256, "status": result.status,
+                      "returncode": result.returncode, "attempts": result.attempts, "error": result.error,
+                      "parameters": result.parameters, "seed": result.seed})
+        finish(result)
+
+    pool = ThreadPool(workers)
+    # Limit the number of scenarios waiting for a worker, so they are not all kept in memory
+    pending = threading.BoundedSemaphore(workers * 2)
+
+    def run_and_release(result, sha256):
+        try:
+            run(result, sha256)
+        finally:
+            pending.release()
+
+    tasks = []
+    try:
+        for scenario in experiment.scenarios(generate_seed=generate_seed):
+            name = "scenario%s" % (scenario.index + 1)
+            data = scenario.xml.encode("utf-8")
+            sha256 = hashlib.sha256(data).hexdigest()
+            result = SimulationResult(name, os.path.join(directory, name), dict(scenario.parameters),
+                                      scenario.seed)
+            results.append(result)
+            record = state.get(name)
+            if record is not None and record["status"] == "done" and record["sha256"] == sha256 and \
+                    os.path.exists(os.path.join(result.directory, SURVEY_OUTPUT_FILENAME)):
+                result.status, result.returncode, result.attempts = "done", record["returncode"], record["attempts"]
+                result.resumed = True
+                finish(result)
+                continue
+            if not os.path.isdir(result.directory):
+                os.makedirs(result.directory)
+            with open(os.path.join(result.directory, SCENARIO_FILENAME), "wb") as fp:
+                fp.write(data)
+            pending.acquire()
+            tasks.append(pool.apply_async(run_and_release, (result, sha256)))
+        pool.close()
+        pool.join()
+    except BaseException:
+        pool.terminate()
+        raise
+    for task in tasks:
+        # Raise unexpected errors of workers, if any
+        task.get()
+
+    if parse:
+        succeeded = [result for result in results if result.ok]
+        for result, output in zip(succeeded, parse_many([result.directory for result in succeeded],
+                                                        workers=parse_workers, cache_dir=cache_dir)):
+            result.output = output
+    return results
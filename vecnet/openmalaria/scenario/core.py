@@ -8,9 +8,46 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import weakref
 from xml.etree import ElementTree
 import six
 
+# Cached child element lookups: {element: {tag: (child element or None, number of children of element)}}
+_children = weakref.WeakKeyDictionary()
+# Cached Section wrappers of child elements: {element: {property name: (child element, Section)}}
+_sections = weakref.WeakKeyDictionary()
+
+
+def find(et, tag):
+    """
+    Cached et.find(tag).
+    Cache of an element is dropped by invalidate(). As a safety net, a cached lookup is also repeated if the number
+    of children of the element has changed
+    """
+    try:
+        cache = _children[et]
+    except KeyError:
+        cache = _children[et] = {}
+    except TypeError:
+        # Not an element (e.g. None), nothing to cache
+        return et.find(tag)
+    entry = cache.get(tag)
+    if entry is not None and entry[1] == len(et):
+        return entry[0]
+    child = et.find(tag)
+    cache[tag] = (child, len(et))
+    return child
+
+
+def invalidate(et):
+    """
+    Drop cached lookups of child elements of et. Call it after children of et are added, removed or replaced
+    """
+    if et is not None:
+        _children.pop(et, None)
+        _sections.pop(et, None)
+
+
 def attribute(func):
     """
     Decorator used to declare that property is a tag attribute
@@ -42,7 +79,21 @@ def section(func):
     Decorator used to declare that the property is xml section
     """
     def inner(self):
-        return func(self)(self.et.find(func.__name__))
+        section_class = func(self)
+        et = find(self.et, func.__name__)
+        # Return the same Section object while the element doesn't change
+        try:
+            cache = _sections[self.et]
+        except KeyError:
+            cache = _sections[self.et] = {}
+        except TypeError:
+            return section_class(et)
+        entry = cache.get(func.__name__)
+        if entry is not None and entry[0] is et and type(entry[1]) is section_class:
+            return entry[1]
+        section_object = section_class(et)
+        cache[func.__name__] = (et, section_object)
+        return section_object
     return inner
 
 
@@ -52,11 +103,11 @@ def tag_value(func):
     """
     def inner(self):
         tag, attrib, attrib_type = func(self)
-        tag_obj = self.et.find(tag)
+        tag_obj = find(self.et, tag)
 
         if tag_obj is not None:
             try:
-                return attrib_type(self.et.find(tag).attrib[attrib])
+                return attrib_type(tag_obj.attrib[attrib])
             except KeyError:
                 raise AttributeError
 
@@ -69,12 +120,13 @@ def tag_value_setter(tag, attrib):
     """
     def outer(func):
         def inner(self, value):
-            tag_elem = self.et.find(tag)
+            tag_elem = find(self.et, tag)
 
             if tag_elem is None:
                 et = ElementTree.fromstring("<{}></{}>".format(tag, tag))
                 self.et.append(et)
-                tag_elem = self.et.find(tag)
+                invalidate(self.et)
+                tag_elem = find(self.et, tag)
 
             tag_elem.attrib[attrib] = str(value)
         return inner
@@ -8,9 +8,12 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import weakref
+from collections import OrderedDict
 from xml.etree.ElementTree import Element
 from xml.etree import ElementTree
-from vecnet.openmalaria.scenario.core import Section, attribute, tag_value, section, attribute_setter, tag_value_setter
+from vecnet.openmalaria.scenario.core import (Section, attribute, tag_value, section, attribute_setter,
+                                              tag_value_setter, find, invalidate)
 import six
 
 class Seasonality(Section):
@@ -71,7 +74,7 @@ class Seasonality(Section):
         https://github.com/SwissTPH/openmalaria/wiki/GeneratedSchema32Doc#list-of-monthly-values
         """
         monthly_values = []
-        for value in self.et.find("monthlyValues").findall("value"):
+        for value in find(self.et, "monthlyValues").findall("value"):
             monthly_values.append(float(value.text))
         return monthly_values
     @monthlyValues.setter
@@ -189,7 +192,16 @@ class Vector(Section):
         return Mosq
 
 
+# Index of vectors: {<vector> element: (OrderedDict {mosquito: Vector}, number of children of the element)}
+_vectors = weakref.WeakKeyDictionary()
+
+
 class Vectors():
+    """
+    List of mosquito species. Vectors are kept in an index {mosquito: Vector} shared by all Vectors objects of the
+    same element and updated by add() and del. The index is rebuilt if the number of children of <vector> is
+    changed by other means, or if a looked up vector has been renamed
+    """
     def __init__(self, et):
         # assert isinstance(et, ElementTree)
         self.et = et
@@ -218,44 +230,70 @@ class Vectors():
         assert isinstance(mosquito.mosquito, str)
         assert isinstance(mosquito.propInfected, float)
         assert len(mosquito.seasonality.monthlyValues) == 12
+        vectors = self._index()
         index = len(self.et.findall("anopheles"))
         self.et.insert(index, et)
+        invalidate(self.et)
+        vectors[mosquito.mosquito] = mosquito
+        _vectors[self.et] = (vectors, len(self.et))
+
+    def _index(self, mosquito=None):
+        """
+        :param mosquito: name of a vector that will be looked up. Index is rebuilt if it's not in the index under
+        its current name, as vectors may be renamed (vector.mosquito = ...)
+        :returns: OrderedDict {mosquito: Vector}, in document order
+        """
+        if self.et is None:
+            # Non-vector transmission model
+            return OrderedDict()
+        entry = _vectors.get(self.et)
+        wrappers = {}
+        if entry is not None:
+            vectors = entry[0]
+            if entry[1] == len(self.et) and (mosquito is None or (
+                    mosquito in vectors and vectors[mosquito].et.attrib["mosquito"] == mosquito)):
+                return vectors
+            # Keep Vector objects of elements that are still there
+            wrappers = dict((vector.et, vector) for vector in vectors.values())
+        vectors = OrderedDict()
+        for anopheles in self.et.findall("anopheles"):
+            vectors[anopheles.attrib["mosquito"]] = wrappers.get(anopheles) or Vector(anopheles)
+        _vectors[self.et] = (vectors, len(self.et))
+        return vectors
 
     @property
     def vectors(self):
         """
         :rtype: dict
         """
-        vectors = {}
-        for anopheles in self.et.findall("anopheles"):
-            vectors[anopheles.attrib["mosquito"]] = Vector(anopheles)
-        return vectors
+        return OrderedDict((vector.et.attrib["mosquito"], vector) for vector in self._index().values())
 
     def __getitem__(self, item):
         """
         :rtype: Vector
         """
-        return self.vectors[item]
+        return self._index(item)[item]
 
     def __getattr__(self, item):
         """
         :rtype: Vector
         """
-        return self.vectors[item]
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return self._index(item)[item]
 
     def __len__(self):
-        return len(self.vectors)
+        return len(self._index())
 
     def __delitem__(self, key):
         # TODO:
         #  1. For every GVI intervention, remove respective anophelesParams section
         #  2. For every ITN intervention, remove respective anophelesParams section
         #  3. For every IRS intervention, remove respective anophelesParams section
-        for anopheles in self.et.findall("anopheles"):
-            if anopheles.attrib['mosquito'] == key:
-                self.et.remove(anopheles)
-                return
-        raise KeyError(key)
+        vectors = self._index(key)
+        self.et.remove(vectors.pop(key).et)
+        invalidate(self.et)
+        _vectors[self.et] = (vectors, len(self.et))
 
     def __iter__(self):
         """
@@ -266,8 +304,8 @@ class Vectors():
 
         :rtype: Vector
         """
-        for vector in self.vectors:
-            yield self.vectors[vector]
+        for vector in list(self._index().values()):
+            yield vector
 
     def __str__(self):
         return self.mosquito
@@ -304,7 +342,7 @@ class Entomology(Section):
 
     @property
     def vectors(self):
-        return Vectors(self.et.find("vector"))
+        return Vectors(find(self.et, "vector"))
 
     def __str__(self):
         return self.name
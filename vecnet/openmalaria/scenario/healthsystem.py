@@ -11,7 +11,7 @@
 from xml.etree import ElementTree
 import six
 
-from vecnet.openmalaria.scenario.core import Section, tag_value, tag_value_setter, attribute, section
+from vecnet.openmalaria.scenario.core import Section, tag_value, tag_value_setter, attribute, section, invalidate
 
 __author__ = 'Alexander'
 
@@ -139,6 +139,7 @@ class TreatmentAction(object):
 
         if clear_infections is None:
             self.et.append(ElementTree.Element("clearInfections"))
+            invalidate(self.et)
             clear_infections = self.et.find("clearInfections")
 
         clear_infections.attrib["timesteps"] = str(value)
@@ -153,6 +154,7 @@ class TreatmentAction(object):
 
         if clear_infections is None:
             self.et.append(ElementTree.Element("clearInfections"))
+            invalidate(self.et)
             clear_infections = self.et.find("clearInfections")
 
         clear_infections.attrib["stage"] = value
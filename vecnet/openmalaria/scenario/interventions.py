@@ -9,11 +9,13 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from collections import OrderedDict
 from xml.etree.ElementTree import Element
 from xml.etree import ElementTree
 import six
 
-from vecnet.openmalaria.scenario.core import Section, attribute, attribute_setter, section, tag_value, tag_value_setter
+from vecnet.openmalaria.scenario.core import (Section, attribute, attribute_setter, section, tag_value,
+                                              tag_value_setter, invalidate)
 from vecnet.openmalaria.scenario.healthsystem import HealthSystem
 
 
@@ -75,6 +77,7 @@ class Deployment(Section):
             component = Element("component")
             component.attrib["id"] = component_id
             self.et.insert(index, component)
+        invalidate(self.et)
 
     @property
     def timesteps(self):
@@ -95,6 +98,7 @@ class Deployment(Section):
         else:
             timed = Element("timed")
             self.et.append(timed)
+            invalidate(self.et)
             timed = self.et.find("timed")
 
         for deploy in value:
@@ -127,6 +131,7 @@ class Deployment(Section):
             continuous = Element("continuous")
             index = len(self.et.findall("component"))
             self.et.insert(index, continuous)
+            invalidate(self.et)
             continuous = self.et.find("continuous")
 
         for deploy in value:
@@ -143,6 +148,7 @@ class Deployment(Section):
         for component in self.et.findall("component"):
             if component.attrib["id"] == id:
                 self.et.remove(component)
+                invalidate(self.et)
 
         return len(self.components)
 
@@ -204,15 +210,17 @@ class Interventions(Section):
         return eir_daily
 
     @property  # human
+    @section
     def human(self):
-        return HumanInterventions(self.et.find("human"))
+        return HumanInterventions
 
     @property  # vectorPop
+    @section
     def vectorPop(self):
         """
         rtype: VectorPop
         """
-        return VectorPop(self.et.find("vectorPop"))
+        return VectorPop
 
     @property
     def importedInfections(self):
@@ -229,12 +237,14 @@ class Interventions(Section):
     def add_section(self, name):
         elem = Element(name)
         self.et.append(elem)
+        invalidate(self.et)
 
     def remove_section(self, name):
         element = self.et.find(name)
 
         if element is not None:
             self.et.remove(element)
+            invalidate(self.et)
 
 
 class Component(Section):
@@ -683,10 +693,51 @@ class Vaccine(Component):
             self.vaccine.append(initial_efficacy)
 
 
+def _component(et):
+    """
+    Wrap <component> element in ITN, GVI, MDA or Vaccine class
+    :returns: None if the component is not supported
+    """
+    if et.find("TBV") is not None or et.find("PEV") is not None or et.find("BSV") is not None:
+        return Vaccine(et)
+    if et.find("MDA") is not None:
+        return MDA(et)
+    if et.find("GVI") is not None:
+        return GVI(et)
+    if et.find("ITN") is not None:
+        return ITN(et)
+    return None
+
+
 class HumanInterventions(Section):
     """
     List of human interventions
+
+    Components are kept in an index {id: component}, updated by add() and del. As with cached lookups in
+    scenario.core, the index is rebuilt if the number of children of <human> is changed by other means
     """
+    def __init__(self, et):
+        super(HumanInterventions, self).__init__(et)
+        self._index = None
+        self._index_size = None
+
+    @property
+    def _components(self):
+        """
+        :returns: OrderedDict {id: component}, in document order
+        """
+        if self.et is None:
+            # No /scenario/interventions/human section
+            return OrderedDict()
+        if self._index is None or self._index_size != len(self.et):
+            self._index = OrderedDict()
+            for et in self.et.findall("component"):
+                component = _component(et)
+                if component is not None:
+                    self._index[et.attrib["id"]] = component
+            self._index_size = len(self.et)
+        return self._index
+
     def add(self, intervention, id=None):
         """
         Add an intervention to intervention/human section.
@@ -697,44 +748,32 @@ class HumanInterventions(Section):
 
         assert isinstance(intervention, six.string_types)
         et = ElementTree.fromstring(intervention)
-        component = None
-
-        if et.find("ITN") is not None:
-            component = ITN(et)
-        elif et.find("GVI") is not None:
-            component = GVI(et)
-        elif et.find("MDA") is not None:
-            component = MDA(et)
-        elif et.find("TBV") is not None or et.find("PEV") is not None or et.find("BSV") is not None:
-            component = Vaccine(et)
-        else:
+        if id is not None:
+            assert isinstance(id, six.string_types)
+        component = _component(et)
+        if component is None:
             return
 
         assert isinstance(component.name, six.string_types)
 
         if id is not None:
-            assert isinstance(id, six.string_types)
             et.attrib["id"] = id
+            # Components keep id of the element they were created for
+            component.id = id
 
+        components = self._components
         index = len(self.et.findall("component"))
         self.et.insert(index, et)
+        invalidate(self.et)
+        components[component.id] = component
+        self._index_size = len(self.et)
 
     @property
     def components(self):
-        human_interventions = {}
-        if self.et is None:
-            # No /scenario/interventions/human section
-            return {}
-        for component in self.et.findall("component"):
-            if component.find("ITN") is not None:
-                human_interventions[component.attrib["id"]] = ITN(component)
-            if component.find("GVI") is not None:
-                human_interventions[component.attrib["id"]] = GVI(component)
-            if component.find("MDA") is not None:
-                human_interventions[component.attrib["id"]] = MDA(component)
-            if component.find("TBV") is not None or component.find("PEV") is not None or component.find("BSV") is not None:
-                human_interventions[component.attrib["id"]] = Vaccine(component)
-        return human_interventions
+        """
+        :returns: OrderedDict {id: component}
+        """
+        return OrderedDict(self._components)
 
     @property  # deployment
     def deployments(self):
@@ -744,8 +783,10 @@ class HumanInterventions(Section):
         if self.et is None or value is None:
             return
 
+        components = self._components
         for deployment in self.et.findall("deployment"):
             self.et.remove(deployment)
+        invalidate(self.et)
 
         for deploy in value:
             if "xml" in deploy:
@@ -758,7 +799,7 @@ class HumanInterventions(Section):
             if "components" not in deploy or len(deploy["components"]) == 0:
                 continue
 
-            component_ids = [id for id in deploy["components"] if id in self.components]
+            component_ids = [id for id in deploy["components"] if id in components]
 
             deployment_element = Element("deployment")
 
@@ -774,42 +815,46 @@ class HumanInterventions(Section):
                 deployment.timesteps = deploy["continuous"]
 
             self.et.append(deployment.et)
+        invalidate(self.et)
+        # Components are not affected by replacing deployments
+        self._index_size = len(self.et)
 
     def __getitem__(self, item):
         """
         :rtype: Intervention
         """
-        return self.components[item]
+        return self._components[item]
 
     def __getattr__(self, item):
         """
         :rtype: Intervention
         """
-        return self.components[item]
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return self._components[item]
 
     def __len__(self):
-        return len(self.components)
+        return len(self._components)
 
     def __delitem__(self, key):
-        for component in self.et.findall("component"):
-            component_id = component.attrib["id"]
-            if component_id == key:
-                deployments_to_delete = []
+        components = self._components
+        component = components[key]
+        deployments_to_delete = []
 
-                for deployment in self.deployments:
-                    if deployment.delete_component(component_id) == 0:
-                        # Prepare deployment for removal.
-                        deployments_to_delete.append(deployment.et)
+        for deployment in self.deployments:
+            if deployment.delete_component(key) == 0:
+                # Prepare deployment for removal.
+                deployments_to_delete.append(deployment.et)
 
-                for deployment_to_delete in deployments_to_delete:
-                    self.et.remove(deployment_to_delete)
+        for deployment_to_delete in deployments_to_delete:
+            self.et.remove(deployment_to_delete)
 
-                self.et.remove(component)
+        self.et.remove(component.et)
+        invalidate(self.et)
+        del components[key]
+        self._index_size = len(self.et)
 
-                # TODO: Remove entire <human> section if this is the only component.
-
-                return
-        raise KeyError(key)
+        # TODO: Remove entire <human> section if this is the only component.
 
     def __iter__(self):
         """
@@ -820,9 +865,7 @@ class HumanInterventions(Section):
 
         :rtype: Vector
         """
-        if not self.components:
-            return
-        for intervention_name, intervention in self.components.items():
+        for intervention in list(self._components.values()):
             yield intervention
 
 
@@ -957,6 +1000,7 @@ class VectorPopIntervention(Section):
             if desc is None:
                 new_description_element = ElementTree.Element("description")
                 self.et.insert(0, new_description_element)
+                invalidate(self.et)
                 desc = self.et.find("description")
 
             desc.append(anopheles.et)
@@ -1063,6 +1107,7 @@ class VectorPop(Section):
 
         index = len(self.et.findall("intervention"))
         self.et.insert(index, et)
+        invalidate(self.et)
 
     @property
     def interventions(self):
@@ -1081,6 +1126,7 @@ class VectorPop(Section):
         for intervention in self.et.findall("intervention"):
             if intervention.attrib["name"] == key:
                 self.et.remove(intervention)
+                invalidate(self.et)
                 # TODO: Remove entire <vectorPop> section if this is the only intervention.
                 return
 
@@ -1141,6 +1187,7 @@ class ImportedInfections(Section):
         if timed is None:
             timed_element = Element("timed")
             self.et.append(timed_element)
+            invalidate(self.et)
             timed = self.et.find("timed")
 
         timed.attrib["period"] = str(value)
@@ -1171,6 +1218,7 @@ class ImportedInfections(Section):
         if timed is None:
             timed_element = Element("timed")
             self.et.append(timed_element)
+            invalidate(self.et)
             timed = self.et.find("timed")
 
         for rate in timed.findall("rate"):
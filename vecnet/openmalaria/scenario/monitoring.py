@@ -9,7 +9,7 @@
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from xml.etree.ElementTree import Element
-from vecnet.openmalaria.scenario.core import attribute, Section, section
+from vecnet.openmalaria.scenario.core import attribute, Section, section, invalidate
 
 
 class AgeGroup(Section):
@@ -71,6 +71,7 @@ class Monitoring(Section):
         if self.et.find("continuous") is None:
             # Add continuous section
             self.et.append(Element("continuous"))
+            invalidate(self.et)
         self._replace_measures(self.et.find("continuous"), list_of_measures)
 
     @property  # SurveyOptions
@@ -89,6 +90,7 @@ class Monitoring(Section):
         if self.et.find("SurveyOptions") is None:
             # Add SurveyOptions section
             self.et.append(Element("SurveyOptions"))
+            invalidate(self.et)
         self._replace_measures(self.et.find("SurveyOptions"), list_of_measures)
 
     @property  # detectionLimit
@@ -112,6 +114,7 @@ class Monitoring(Section):
         surveys_elem = self.et.find("surveys")
         if surveys_elem is None:
             self.et.append(Element("surveys"))
+            invalidate(self.et)
             surveys_elem = self.et.find("surveys")
 
         surveys_elem.attrib["detectionLimit"] = value
@@ -141,6 +144,7 @@ class Monitoring(Section):
         if surveys_elem is None:
             # Add surveys section
             self.et.append(Element("surveys"))
+            invalidate(self.et)
             surveys_elem = self.et.find("surveys")
 
         for time in surveys_elem.findall("surveyTime"):
@@ -11,7 +11,7 @@
 from xml.etree import ElementTree
 import six
 
-from vecnet.openmalaria.scenario.core import attribute, Section, section, attribute_setter
+from vecnet.openmalaria.scenario.core import attribute, Section, section, attribute_setter, invalidate
 from vecnet.openmalaria.scenario.demography import Demography
 from vecnet.openmalaria.scenario.entomology import Entomology
 from vecnet.openmalaria.scenario.healthsystem import HealthSystem
@@ -133,6 +133,8 @@ class Scenario(Section):
         return self.name
 
     def load_xml(self, xml):
+        # Cached lookups and Section objects of the old document are not valid anymore
+        invalidate(self.et)
         # self.xml = xml
         # Parsed xml file (as ElementTree)
         self.root = ElementTree.fromstring(xml)
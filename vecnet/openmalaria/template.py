@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compiled templates for scenario generation.
+
+A document is split once into literal chunks and @placeholder@ slots, so every scenario is rendered with a single
+join instead of copying the whole document for every placeholder.
+"""
+import re
+
+
+class Template(object):
+    """
+    Document compiled for a set of placeholders.
+
+    render() gives the same result as applying str.replace(placeholder, value) for every substitution in order,
+    including values that contain placeholders replaced later. Placeholders are matched leftmost first, so
+    occurrences of placeholders overlapping each other in the document (e.g. "@a@b@" with "@a@" and "@b@") are
+    not supported.
+    """
+    def __init__(self, text, placeholders):
+        """
+        :param text: document
+        :param placeholders: all placeholders that may be substituted in text
+        """
+        placeholders = sorted(set(placeholders), key=len, reverse=True)
+        if placeholders:
+            self._pattern = re.compile("(%s)" % "|".join(re.escape(placeholder) for placeholder in placeholders))
+        else:
+            self._pattern = None
+        self._values = {}
+        self.literals, self.slots = self._split(text)
+
+    def _split(self, text):
+        if self._pattern is None:
+            return [text], []
+        chunks = self._pattern.split(text)
+        # re.split with a group alternates literals and matched placeholders: literal, slot, literal, ...
+        return chunks[0::2], chunks[1::2]
+
+    def _render_into(self, parts, literals, slots, substitutions, after):
+        parts.append(literals[0])
+        for slot, literal in zip(slots, literals[1:]):
+            value = None
+            for step, candidate in substitutions.get(slot, ()):
+                # Text that is a result of substitution step `after` is only affected by later substitutions
+                if step > after:
+                    value = candidate
+                    break
+            if value is None:
+                parts.append(slot)
+            else:
+                if value not in self._values:
+                    self._values[value] = self._split(value)
+                value_literals, value_slots = self._values[value]
+                if value_slots:
+                    self._render_into(parts, value_literals, value_slots, substitutions, step)
+                else:
+                    parts.append(value)
+            parts.append(literal)
+
+    def render(self, substitutions):
+        """
+        :param substitutions: list of (placeholder, value) pairs, applied in order
+        :rtype: str
+        """
+        steps = {}
+        for step, (placeholder, value) in enumerate(substitutions):
+            steps.setdefault(placeholder, []).append((step, value))
+        parts = []
+        self._render_into(parts, self.literals, self.slots, steps, -1)
+        return "".join(parts)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Stand-in for the OpenMalaria executable, used by test_runner.
+Copies output.txt and ctsout.txt from the data directory to the current directory. Behaviour depends on a marker
+in the scenario file:
+mode:fail - exit with code 1
+mode:flaky - exit with code 1 on the first attempt, succeed on the second one
+mode:slow - sleep for a minute
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--scenario", required=True)
+parser.add_argument("--data", required=True)
+args = parser.parse_args()
+
+with open(args.scenario) as fp:
+    scenario = fp.read()
+with open("runs.txt", "a") as fp:
+    fp.write("run\n")
+print("Running %s" % args.scenario)
+if "mode:fail" in scenario:
+    sys.stderr.write("Failed\n")
+    sys.exit(1)
+if "mode:flaky" in scenario:
+    with open("runs.txt") as fp:
+        if len(fp.readlines()) == 1:
+            sys.exit(1)
+if "mode:slow" in scenario:
+    time.sleep(60)
+shutil.copy(os.path.join(args.data, "test1_output.txt"), "output.txt")
+shutil.copy(os.path.join(args.data, "test1_ctsout.txt"), "ctsout.txt")
@@ -55,6 +55,77 @@ class TestScenario(unittest.TestCase):
         self.assertEqual(hasattr(scenario, "monitoring"), True)
         self.assertIsInstance(scenario.monitoring, Monitoring)
 
+    def test_cached_lookups(self):
+        scenario = self.scenario
+        # The same Section object is returned while the document doesn't change
+        self.assertIs(scenario.entomology, scenario.entomology)
+        self.assertIs(scenario.interventions.human, scenario.interventions.human)
+        interventions = scenario.interventions
+        interventions.remove_section("human")
+        self.assertIsNone(scenario.interventions.human.et)
+        interventions.add_section("human")
+        self.assertIsNotNone(scenario.interventions.human.et)
+        self.assertEqual(len(scenario.interventions.human.components), 0)
+
+        # Setter of a missing tag adds it
+        gambiae = scenario.entomology.vectors["gambiae"]
+        gambiae.mosq.et.remove(gambiae.mosq.et.find("mosqHumanBloodIndex"))
+        self.assertIsNone(gambiae.mosq.mosqHumanBloodIndex)
+        gambiae.mosq.mosqHumanBloodIndex = 0.5
+        self.assertEqual(gambiae.mosq.mosqHumanBloodIndex, 0.5)
+
+        entomology = scenario.entomology
+        scenario.load_xml(scenario.xml)
+        self.assertIsNot(scenario.entomology, entomology)
+        self.assertEqual(scenario.entomology.vectors["gambiae"].mosq.mosqHumanBloodIndex, 0.5)
+
+    def test_human_interventions_index(self):
+        scenario = self.scenario
+        with open(os.path.join(base_dir, "files/test_scenario", "ddt_snippet.xml")) as snippet_file:
+            ddt_xml = snippet_file.read()
+        human = scenario.interventions.human
+        for i in range(100):
+            human.add(ddt_xml, "ddt%s" % i)
+        self.assertEqual(len(human), 101)
+        self.assertEqual(list(human.components)[-2:], ["ddt98", "ddt99"])
+        self.assertIs(human["ddt50"], human.ddt50)
+        self.assertIs(human["ddt50"].et, scenario.interventions.human["ddt50"].et)
+        human.deployments = [{"components": ["ddt%s" % i for i in range(0, 100, 2)] + ["missing"],
+                              "timesteps": [{"time": 1, "coverage": 0.5}]}]
+        self.assertEqual(len(human.deployments[0].components), 50)
+        self.assertEqual(len(human), 101)
+        for i in range(0, 100, 2):
+            del human["ddt%s" % i]
+        self.assertEqual(len(human), 51)
+        self.assertEqual(len(human.deployments), 0)
+        self.assertRaises(KeyError, lambda: human["ddt0"])
+        # Index is rebuilt when the document is changed directly
+        human.et.remove(human["ddt1"].et)
+        self.assertEqual(len(human), 50)
+        self.assertNotIn("ddt1", human.components)
+
+    def test_vectors_index(self):
+        vectors = self.scenario.entomology.vectors
+        gambiae = vectors["gambiae"]
+        snippet = gambiae.xml
+        for i in range(50):
+            vectors.add(snippet.replace('mosquito="gambiae"', 'mosquito="species%s"' % i))
+        self.assertEqual(len(vectors), 51)
+        self.assertEqual(list(vectors.vectors)[:2], ["gambiae", "species0"])
+        # Vectors are shared by Vectors objects of the same element
+        self.assertIs(self.scenario.entomology.vectors["species10"], vectors.species10)
+        self.assertEqual([vector.mosquito for vector in vectors][-1], "species49")
+        for i in range(0, 50, 2):
+            del vectors["species%s" % i]
+        self.assertEqual(len(self.scenario.entomology.vectors), 26)
+        self.assertRaises(KeyError, lambda: vectors["species0"])
+        # Renamed vector is found under its new name
+        gambiae.mosquito = "farauti"
+        self.assertIs(vectors["farauti"], gambiae)
+        self.assertRaises(KeyError, lambda: vectors["gambiae"])
+        self.assertIn("farauti", vectors.vectors)
+        self.assertEqual(len(Scenario(self.scenario.xml).entomology.vectors), 26)
+
     def test_section_xml(self):
         self.assertTrue(isinstance(self.scenario.monitoring.xml, str))
 
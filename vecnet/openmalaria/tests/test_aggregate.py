@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import json
+import os
+
+import numpy
+
+from vecnet.openmalaria.aggregate import aggregate, aggregate_runs, arm_key, t_critical_value
+from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.output_parser import OutputParser, SurveyOutputStore
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+base_dir = os.path.join(base_dir, "files", "test_output_parser")
+
+
+def scaled(store, factor):
+    records = store.records.copy()
+    records["value"] *= factor
+    return SurveyOutputStore(records, store.survey_times.tolist(), store.third_dimension_labels, presorted=True)
+
+
+class TestAggregate(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(base_dir, "test1.xml")) as input_file, \
+                open(os.path.join(base_dir, "test1_output.txt")) as survey_output_file:
+            cls.store = OutputParser(input_file, survey_output_file=survey_output_file,
+                                     columnar=True).survey_output_data
+
+    def test_aggregate(self):
+        runs = [({"arm": "a", "itn": "on"}, scaled(self.store, factor)) for factor in (1, 2, 3)]
+        runs.append(({"itn": "off", "arm": "b"}, self.store))
+        result = aggregate(runs, quantiles=(0.5,))
+        self.assertEqual(list(result.keys()), [(("arm", "a"), ("itn", "on")), (("arm", "b"), ("itn", "off"))])
+        self.assertEqual(arm_key({"itn": "on", "arm": "a"}), (("arm", "a"), ("itn", "on")))
+
+        arm = result[arm_key({"arm": "a", "itn": "on"})]
+        values = self.store.value
+        self.assertEqual(arm.runs, 3)
+        self.assertEqual(arm.parameters, {"arm": "a", "itn": "on"})
+        numpy.testing.assert_array_equal(arm.count, 3)
+        numpy.testing.assert_allclose(arm.mean, values * 2)
+        numpy.testing.assert_allclose(arm.variance, values ** 2)
+        numpy.testing.assert_allclose(arm.get_values((0, 1), 0.5), self.store.get_values((0, 1)) * 2)
+        margin = t_critical_value(0.95, 2) * values / numpy.sqrt(3)
+        numpy.testing.assert_allclose(arm.ci_low, values * 2 - margin)
+        numpy.testing.assert_allclose(arm.ci_high, values * 2 + margin)
+        self.assertEqual(arm.keys(), self.store.keys())
+        numpy.testing.assert_array_equal(arm.get_times((34, "funestus")), self.store.get_times((34, "funestus")))
+        numpy.testing.assert_allclose(arm.to_store("std").get_values((34, "funestus")),
+                                      self.store.get_values((34, "funestus")))
+        self.assertRaises(KeyError, arm.get_values, (0, 1), 0.9)
+
+        # A single run: no variance and confidence interval
+        single = result[arm_key({"arm": "b", "itn": "off"})]
+        numpy.testing.assert_allclose(single.mean, values)
+        self.assertTrue(numpy.isnan(single.variance).all())
+        self.assertTrue(numpy.isnan(single.ci_low).all())
+
+    def test_seed_sweep(self):
+        with open(os.path.join(os.path.dirname(base_dir), "test_experiment", "experiment15.json")) as fp:
+            experiment = json.load(fp)
+        # Every itn arm with every seed: 3 replicates of 3 arms
+        del experiment["combinations"]
+        factors = {"11": 1, "15": 2, "31": 3}
+        runs = [(scenario.parameters, scaled(self.store, factors[scenario.parameters["seed"]]))
+                for scenario in ExperimentSpecification(experiment).scenarios()]
+        self.assertEqual(len(runs), 9)
+        self.assertEqual(len(aggregate(runs)), 9)
+
+        result = aggregate(runs, quantiles=(0.5,), ignore=["seed"])
+        self.assertEqual(list(result), [arm_key({"itn": "Coverage 80%"}), arm_key({"itn": "Coverage 90%"}),
+                                        arm_key({"itn": "Coverage 100%"})])
+        arm = result[arm_key({"itn": "Coverage 90%"})]
+        self.assertEqual((arm.runs, arm.parameters), (3, {"itn": "Coverage 90%"}))
+        values = self.store.get_values((34, "gambiae"))
+        numpy.testing.assert_allclose(arm.get_values((34, "gambiae")), 2 * values)
+        numpy.testing.assert_allclose(arm.get_values((34, "gambiae"), "variance"), values ** 2)
+        self.assertTrue((arm.ci_high >= arm.ci_low).all())
+        self.assertTrue((arm.get_values((34, "gambiae"), "ci_high") > arm.get_values((34, "gambiae"))).any())
+
+    def test_different_layouts(self):
+        # Second run doesn't have measure 0 and has species in a different order
+        records = self.store.records[self.store.measure != 0].copy()
+        labels = list(reversed(self.store.third_dimension_labels))
+        negative = records["third_dimension"] < 0
+        records["third_dimension"][negative] = -len(labels) - 1 - records["third_dimension"][negative]
+        other = SurveyOutputStore(records, self.store.survey_times.tolist(), labels)
+        result = aggregate_runs([self.store, other], quantiles=(0, 1))
+        self.assertEqual(sorted(result.keys(), key=str), sorted(self.store.keys(), key=str))
+        numpy.testing.assert_array_equal(result.get_values((0, 1), "count"), 1)
+        numpy.testing.assert_array_equal(result.get_values((34, "gambiae"), "count"), 2)
+        numpy.testing.assert_allclose(result.get_values((34, "gambiae")), self.store.get_values((34, "gambiae")))
+        numpy.testing.assert_allclose(result.get_values((34, "gambiae"), 0), self.store.get_values((34, "gambiae")))
+        numpy.testing.assert_allclose(result.get_values((34, "gambiae"), "variance"), 0)
+
+    def test_t_critical_value(self):
+        self.assertAlmostEqual(t_critical_value(0.95, 1), 12.706, places=3)
+        self.assertAlmostEqual(t_critical_value(0.95, 2), 4.303, places=3)
+        self.assertAlmostEqual(t_critical_value(0.95, 9), 2.262, places=3)
+        self.assertAlmostEqual(t_critical_value(0.95, 100), 1.984, places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+import six
+
+from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.tests.test_runner import command, data_dir
+
+if six.PY3:
+    import asyncio
+    from vecnet.openmalaria import aio
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+@unittest.skipIf(six.PY2, "asyncio API requires Python 3")
+class TestAio(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        with open(os.path.join(data_dir, "test1.xml")) as fp:
+            base = fp.read() + "<!-- @mode@ -->\n"
+        self.experiment = ExperimentSpecification({
+            "base": base,
+            "sweeps": {
+                "mode": {
+                    "ok": {"@mode@": "mode:ok"},
+                    "fail": {"@mode@": "mode:fail"},
+                    "flaky": {"@mode@": "mode:flaky"},
+                    "slow": {"@mode@": "mode:slow"},
+                }
+            },
+            "combinations": [["mode"], ["ok"], ["fail"], ["flaky"], ["slow"]]
+        })
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        shutil.rmtree(self.directory)
+
+    def test_scenario_iterator(self):
+        with open(os.path.join(base_dir, "files", "test_experiment", "experiment14.json")) as fp:
+            experiment = ExperimentSpecification(fp)
+        iterator = aio.ScenarioIterator(experiment, batch_size=2, generate_seed=True)
+        scenarios = []
+        while True:
+            try:
+                scenarios.append(self.loop.run_until_complete(iterator.__anext__()))
+            except StopAsyncIteration:
+                break
+        expected = list(experiment.scenarios(generate_seed=True))
+        self.assertEqual(len(scenarios), 3)
+        self.assertEqual([scenario.xml for scenario in scenarios], [scenario.xml for scenario in expected])
+        self.assertEqual([scenario.seed for scenario in scenarios], [scenario.seed for scenario in expected])
+
+    def test_run_experiment(self):
+        ticks = []
+        # No async syntax here, so this module can be imported by Python 2
+        def tick():
+            ticks.append(self.loop.call_later(0.05, tick))
+        tick()
+        results = self.loop.run_until_complete(aio.run_experiment(self.experiment, self.directory, command,
+                                                                  concurrency=4, timeout=1, retries=1))
+        ticks[-1].cancel()
+        # Event loop was not blocked while simulations were running
+        self.assertGreater(len(ticks), 10)
+
+        self.assertEqual([result.name for result in results], ["scenario1", "scenario2", "scenario3", "scenario4"])
+        ok, fail, flaky, slow = results
+        self.assertEqual((ok.status, ok.returncode, ok.attempts), ("done", 0, 1))
+        self.assertEqual(len(ok.output.survey[(34, "funestus")]), 241)
+        self.assertEqual((fail.status, fail.attempts, fail.error), ("failed", 2, "Exit code 1"))
+        self.assertIsNone(fail.output)
+        self.assertEqual((flaky.status, flaky.attempts), ("done", 2))
+        self.assertTrue(flaky.output.ok)
+        self.assertEqual((slow.status, slow.returncode, slow.error), ("failed", None, "Timeout after 1 seconds"))
+
+        # Single scenario and parse
+        scenario = self.experiment[0]
+        semaphore = asyncio.Semaphore(1)
+        result = self.loop.run_until_complete(aio.run_scenario(scenario, os.path.join(self.directory, "single"),
+                                                               command, semaphore=semaphore))
+        self.assertTrue(result.ok)
+        self.assertEqual(result.name, "single")
+        output = self.loop.run_until_complete(aio.parse(result.directory, semaphore=semaphore))
+        self.assertEqual(len(output.cts["N_v0(arabiensis)"]), 1461)
+
+        result = self.loop.run_until_complete(aio.run_scenario(scenario, os.path.join(self.directory, "missing"),
+                                                               [sys.executable + "-missing"]))
+        self.assertEqual(result.status, "failed")
+        self.assertIn("Can't start", result.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from vecnet.openmalaria.batch import parse_many, ParsedOutput
+from vecnet.openmalaria.output_parser import OutputParser
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+base_dir = os.path.join(base_dir, "files", "test_output_parser")
+
+
+class TestParseMany(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Simulation directory with scenario.xml, output.txt and ctsout.txt
+        self.simulation = os.path.join(self.directory, "scenario1")
+        os.mkdir(self.simulation)
+        shutil.copy(os.path.join(base_dir, "test1.xml"), os.path.join(self.simulation, "scenario.xml"))
+        shutil.copy(os.path.join(base_dir, "test1_output.txt"), os.path.join(self.simulation, "output.txt"))
+        shutil.copy(os.path.join(base_dir, "test1_ctsout.txt"), os.path.join(self.simulation, "ctsout.txt"))
+        self.paths = [self.simulation,
+                      (os.path.join(base_dir, "scenario.xml"), os.path.join(base_dir, "output.txt"), None),
+                      os.path.join(self.directory, "missing")]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_results(self, results):
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(result, ParsedOutput) for result in results))
+        self.assertEqual([result.path for result in results], self.paths)
+        self.assertTrue(results[0].ok)
+        self.assertEqual(len(results[0].survey[(34, "funestus")]), 241)
+        self.assertEqual(len(results[0].cts["N_v0(arabiensis)"]), 1461)
+        self.assertEqual(len(results[0].survey_time_list), 241)
+        expected = OutputParser(open(os.path.join(base_dir, "scenario.xml")),
+                                survey_output_file=open(os.path.join(base_dir, "output.txt")))
+        self.assertEqual(results[1].survey.to_dict(), expected.survey_output_data)
+        self.assertIsNone(results[1].cts)
+        # Errors are captured for every simulation
+        self.assertFalse(results[2].ok)
+        self.assertIn("scenario.xml", results[2].error)
+        self.assertIsNone(results[2].survey)
+
+    def test_parse_many(self):
+        progress = []
+        results = parse_many(self.paths, workers=2, progress=lambda done, total, result: progress.append(done))
+        self.check_results(results)
+        self.assertEqual(progress, [1, 2, 3])
+
+    def test_parse_many_in_process(self):
+        self.check_results(parse_many(self.paths, workers=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
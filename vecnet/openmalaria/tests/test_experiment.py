@@ -11,11 +11,17 @@
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import unittest
+import csv
+import hashlib
 import json
 import os
+import shutil
+import tempfile
 import six
+from collections import OrderedDict
 
-from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.bin import expand
+from vecnet.openmalaria.experiment import ExperimentSpecification, arm_key
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -399,10 +405,15 @@ class TestExperimentDescription(unittest.TestCase):
         expected_result = ({u"<xml> 80\n66 <model> model1 </model> </xml>",
                             u"<xml> 80\n77 <model> model2 </model> </xml>",
                             u"<xml> 90\n66 <model> model2 </model> </xml>"})
-        result = self.do_test("experiment13.json")
+        with open("experiment13.json") as fp:
+            exp = ExperimentSpecification(fp)
+        result = self.do_test(exp)
         os.chdir(current_directory)
         self.assertEqual(len(result), 3)  # Test for duplicates
         self.assertEqual(set(result), expected_result)  # Test if content of scenarios is correct
+        # Each file is read once
+        self.assertEqual(exp.file_cache.stats()["misses"], 2)
+        self.assertEqual(exp.file_cache.stats()["hits"], 1)
 
     def test_14(self):
         """ Automatic seed replacement """
@@ -435,6 +446,253 @@ class TestExperimentDescription(unittest.TestCase):
         exp.add_sweep("test")
         self.assertIn("test", exp.experiment["sweeps"])
 
+    def test_random_access(self):
+        with open(os.path.join(base_dir, "files/test_experiment/experiment5.json")) as fp:
+            exp = ExperimentSpecification(fp)
+        scenarios = list(exp.scenarios())
+        self.assertEqual(len(exp), 12)
+        self.assertEqual([scenario.xml for scenario in scenarios], [exp[i].xml for i in range(len(exp))])
+        self.assertEqual(exp[-1].xml, scenarios[-1].xml)
+        self.assertEqual(exp[0].parameters, scenarios[0].parameters)
+        self.assertEqual([scenario.xml for scenario in exp[3:9:2]], [scenario.xml for scenario in scenarios[3:9:2]])
+        self.assertRaises(IndexError, exp.__getitem__, 12)
+        # First block is the most significant digit
+        self.assertEqual(exp[0].parameters, {"itn": "itn80", "irs": "irs66", "params": "1",
+                                             "seasonality": "Dry climate"})
+        self.assertEqual(exp[1].parameters, {"itn": "itn80", "irs": "irs66", "params": "2",
+                                             "seasonality": "Wet climate"})
+
+    def test_shard(self):
+        with open(os.path.join(base_dir, "files/test_experiment/experiment14.json")) as fp:
+            exp = ExperimentSpecification(fp)
+        self.assertEqual([exp.shard(k, 2) for k in (1, 2)], [(0, 1), (1, 3)])
+        self.assertRaises(ValueError, exp.shard, 3, 2)
+        full_run = [scenario.xml for scenario in exp.scenarios(generate_seed=True)]
+        shards = []
+        for k in (1, 2):
+            start, stop = exp.shard(k, 2)
+            shards += [scenario.xml for scenario in exp.scenarios(generate_seed=True, start=start, stop=stop)]
+        self.assertEqual(shards, full_run)
+        # Seed of a single scenario is the same as in the full run
+        self.assertEqual([scenario.xml for scenario in exp.scenarios(generate_seed=True, start=2, stop=3)],
+                         [u"<xml> 100 1019 </xml>"])
+
+    def test_expand(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        filename = os.path.join(base_dir, "files/test_experiment/experiment14.json")
+        try:
+            os.chdir(directory)
+            expand.main(filename, generate_seed=True, shard=(2, 2))
+            expand.main(filename, generate_seed=True, index=1)
+            self.assertRaises(RuntimeError, expand.main, filename, index=4)
+            self.assertEqual(sorted(os.listdir(directory)), ["scenario1.xml", "scenario2.xml", "scenario3.xml",
+                                                             "scenarios_1.csv", "scenarios_2-3.csv"])
+            with open("scenario2.xml") as fp:
+                self.assertEqual(fp.read(), "<xml> 90 1013 </xml>")
+            with open("scenarios_2-3.csv") as fp:
+                self.assertEqual(fp.read(), "filename,itn\nscenario2.xml,Coverage 90%\nscenario3.xml,Coverage 100%\n")
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    def test_expand_archive(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(base_dir, "files/test_experiment/experiment14.json")
+        try:
+            expand.main(filename, generate_seed=True, output_dir=directory, archive="scenarios.zip",
+                        manifest="manifest.json")
+            self.assertEqual(sorted(os.listdir(directory)), ["manifest.json", "scenarios.csv", "scenarios.zip"])
+            with open(os.path.join(directory, "manifest.json")) as fp:
+                manifest = json.load(fp)
+            self.assertEqual(manifest[1], {"_filename": "scenario2.xml",
+                                           "_sha256": hashlib.sha256(b"<xml> 90 1013 </xml>").hexdigest(),
+                                           "_size": 20,
+                                           "_seed": 1013,
+                                           "itn": "Coverage 90%"})
+        finally:
+            shutil.rmtree(directory)
+
+    def test_expand_manifest_without_seed(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(base_dir, "files/test_experiment/experiment14.json")
+        try:
+            self.assertEqual(expand.main(filename, output_dir=directory, manifest="manifest.csv"), 0)
+            with open(os.path.join(directory, "manifest.csv")) as fp:
+                rows = list(csv.DictReader(fp))
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows[1], {"_filename": "scenario2.xml",
+                                       "_sha256": hashlib.sha256(b"<xml> 90 @seed@ </xml>").hexdigest(),
+                                       "_size": "22",
+                                       "itn": "Coverage 90%"})
+        finally:
+            shutil.rmtree(directory)
+
+    def test_dedup(self):
+        experiment = {"base": "<xml> @a@ @seed@ </xml>",
+                      "sweeps": {"a": {"x": {"@a@": "1"}, "y": {"@a@": "1"}, "z": {"@a@": "2"}},
+                                 "b": {"no-op 1": {"@unused@": "1"}, "no-op 2": {"@unused@": "2"}}}}
+        exp = ExperimentSpecification(experiment)
+        self.assertEqual(len(list(exp.scenarios())), 6)
+        scenarios = list(exp.scenarios(generate_seed=True, dedup=True))
+        # Seeds are the same as without dedup
+        self.assertEqual([scenario.xml for scenario in scenarios], ["<xml> 1 1009 </xml>", "<xml> 2 1031 </xml>"])
+        self.assertEqual([scenario.index for scenario in scenarios], [0, 4])
+        self.assertEqual(len(exp.scenario_hashes), 6)
+        self.assertEqual(exp.scenario_hashes[arm_key({"a": "y", "b": "no-op 2"})], scenarios[0].content_hash)
+        self.assertEqual(exp.scenario_hashes[arm_key({"a": "z", "b": "no-op 1"})], scenarios[1].content_hash)
+
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "experiment.json")
+            with open(filename, "w") as fp:
+                json.dump(experiment, fp)
+            expand.main(filename, generate_seed=True, output_dir=directory, dedup=True)
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ["experiment.json", "scenario1.xml", "scenario5.xml", "scenarios.csv"])
+            with open(os.path.join(directory, "scenarios.csv")) as fp:
+                self.assertEqual(fp.read().splitlines(), ["filename,a,b",
+                                                          "scenario1.xml,x,no-op 1",
+                                                          "scenario1.xml,x,no-op 2",
+                                                          "scenario1.xml,y,no-op 1",
+                                                          "scenario1.xml,y,no-op 2",
+                                                          "scenario5.xml,z,no-op 1",
+                                                          "scenario5.xml,z,no-op 2"])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_expand_incremental(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "experiment.json")
+        experiment = {"base": "<xml> @a@ @b@ @seed@ </xml>",
+                      "sweeps": {"a": {"1": {"@a@": "1"}, "2": {"@a@": "2"}},
+                                 "b": {"1": {"@b@": "1"}, "2": {"@b@": "2"}}}}
+        try:
+            with open(filename, "w") as fp:
+                json.dump(experiment, fp)
+            expand.main(filename, generate_seed=True, output_dir=directory, manifest="manifest.csv",
+                        incremental=True)
+            os.remove(os.path.join(directory, "scenario1.xml"))
+            # New arm of the first sweep changes numbering of scenarios in a full run, one arm is changed
+            exp = ExperimentSpecification(experiment)
+            exp.add_arm("a", "0", {"@a@": "0"})
+            exp.experiment["sweeps"]["b"]["2"] = {"@b@": "two"}
+            del exp.experiment["sweeps"]["b"]["1"]
+            with open(filename, "w") as fp:
+                json.dump(exp.experiment, fp)
+            expand.main(filename, generate_seed=True, output_dir=directory, manifest="manifest.csv",
+                        incremental=True)
+            with open(os.path.join(directory, "manifest.csv")) as fp:
+                manifest = dict((row["_filename"], row) for row in csv.DictReader(fp))
+            self.assertEqual(sorted(manifest), ["scenario2.xml", "scenario4.xml", "scenario5.xml"])
+            self.assertEqual([manifest[name]["_status"] for name in sorted(manifest)], ["changed", "changed", "new"])
+            # Unchanged files are not written, removed files are not deleted
+            self.assertFalse(os.path.exists(os.path.join(directory, "scenario1.xml")))
+            with open(os.path.join(directory, "scenario4.xml")) as fp:
+                self.assertEqual(fp.read(), "<xml> 2 two 1021 </xml>")
+            with open(os.path.join(directory, "scenario5.xml")) as fp:
+                # Next seed after the largest seed of the previous expansion (1021)
+                self.assertEqual(fp.read(), "<xml> 0 two 1031 </xml>")
+
+            exp.add_arm("b", "3", {"@b@": "3"})
+            with open(filename, "w") as fp:
+                json.dump(exp.experiment, fp)
+            expand.main(filename, generate_seed=True, output_dir=directory, manifest="manifest.csv",
+                        incremental=True)
+            with open(os.path.join(directory, "manifest.csv")) as fp:
+                manifest = dict((row["_filename"], row["_status"]) for row in csv.DictReader(fp))
+            self.assertEqual(manifest, {"scenario2.xml": "unchanged", "scenario4.xml": "unchanged",
+                                        "scenario5.xml": "unchanged", "scenario6.xml": "new",
+                                        "scenario7.xml": "new", "scenario8.xml": "new"})
+        finally:
+            shutil.rmtree(directory)
+
+    def test_expand_incremental_seed_sweep(self):
+        # Experiment with a sweep named "seed", like the "seed" metadata column of the manifest
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "experiment15.json")
+        shutil.copy(os.path.join(base_dir, "files/test_experiment/experiment15.json"), filename)
+        try:
+            for _ in range(2):
+                expand.main(filename, output_dir=directory, manifest="manifest.csv", incremental=True)
+                with open(os.path.join(directory, "manifest.csv")) as fp:
+                    rows = list(csv.DictReader(fp))
+                self.assertEqual([(row["_filename"], row["seed"]) for row in rows],
+                                 [("scenario1.xml", "11"), ("scenario2.xml", "15"), ("scenario3.xml", "31")])
+            self.assertEqual([row["_status"] for row in rows], ["unchanged"] * 3)
+            self.assertFalse(os.path.exists(os.path.join(directory, "scenario4.xml")))
+
+            # Scenario file renamed by hand
+            rows[0]["_filename"] = "baseline.xml"
+            with open(os.path.join(directory, "manifest.csv"), "w") as fp:
+                writer = csv.DictWriter(fp, fieldnames=list(rows[0].keys()))
+                writer.writeheader()
+                writer.writerows(rows)
+            self.assertRaises(RuntimeError, expand.main, filename, output_dir=directory, manifest="manifest.csv",
+                              incremental=True)
+
+            with open(filename) as fp:
+                experiment = json.load(fp)
+            experiment["sweeps"]["_status"] = experiment["sweeps"].pop("seed")
+            experiment["combinations"][0] = ["itn", "_status"]
+            with open(filename, "w") as fp:
+                json.dump(experiment, fp)
+            self.assertRaises(RuntimeError, expand.main, filename, output_dir=directory, manifest="manifest.csv")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_expand_incremental_seeds(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "experiment.json")
+        experiment = {"base": "<xml> @a@ @b@ @seed@ </xml>",
+                      "sweeps": {"a": {"1": {"@a@": "1"}, "2": {"@a@": "2"}},
+                                 "b": {"1": {"@b@": "1"}, "2": {"@b@": "2"}}}}
+        try:
+            with open(filename, "w") as fp:
+                json.dump(experiment, fp)
+            expand.main(filename, generate_seed=True, output_dir=directory, manifest="manifest.csv",
+                        incremental=True)
+            with open(os.path.join(directory, "manifest.csv")) as fp:
+                seeds = dict((row["_filename"], row["_seed"]) for row in csv.DictReader(fp))
+            # New arm ahead of the others: new scenarios are first in a full run, so nth_seed() of their
+            # positions are seeds of existing scenarios
+            experiment["sweeps"]["a"] = OrderedDict([("0", {"@a@": "0"}), ("1", {"@a@": "1"}),
+                                                     ("2", {"@a@": "2"})])
+            with open(filename, "w") as fp:
+                json.dump(experiment, fp)
+            expand.main(filename, generate_seed=True, output_dir=directory, manifest="manifest.csv",
+                        incremental=True)
+            with open(os.path.join(directory, "manifest.csv")) as fp:
+                rows = list(csv.DictReader(fp))
+            self.assertEqual(len(rows), 6)
+            self.assertEqual(len(set(row["_seed"] for row in rows)), 6)
+            for row in rows:
+                if row["_status"] == "unchanged":
+                    self.assertEqual(row["_seed"], seeds[row["_filename"]])
+            self.assertEqual(sorted(row["_seed"] for row in rows if row["_status"] == "new"), ["1031", "1033"])
+
+            self.assertRaises(RuntimeError, expand.main, filename, generate_seed=True, output_dir=directory,
+                              manifest="manifest.csv", archive="scenarios.tar", incremental=True)
+            self.assertFalse(os.path.exists(os.path.join(directory, "scenarios.tar")))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_combination_space(self):
+        # 12 fully factorial sweeps with 10 arms each
+        experiment = {"base": "<xml>%s</xml>" % " ".join("@p%s@" % i for i in range(12)),
+                      "sweeps": dict(("p%s" % i, dict(("%s" % j, {"@p%s@" % i: j}) for j in range(10)))
+                                     for i in range(12))}
+        exp = ExperimentSpecification(experiment)
+        space = exp.combination_space()
+        self.assertEqual(len(space), 10 ** 12)
+        self.assertEqual(space.sweep_names, ["p%s" % i for i in range(12)])
+        self.assertEqual(space[123456789012], list("123456789012"))
+        self.assertEqual(space.index(list("123456789012")), 123456789012)
+        self.assertEqual(exp[10 ** 12 - 1].xml, "<xml>%s</xml>" % " ".join(["9"] * 12))
+        self.assertEqual(next(iter(space)), ["0"] * 12)
+        self.assertEqual(space[-2:], [["9"] * 11 + ["8"], ["9"] * 12])
+        self.assertRaises(ValueError, space.index, ["a"] * 12)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy
+
+from vecnet.openmalaria import export
+from vecnet.openmalaria.batch import export_many, parse_many
+from vecnet.openmalaria.output_parser import OutputParser, SurveyOutputStore, SURVEY_RECORD_DTYPE, surveyFileMap
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+base_dir = os.path.join(base_dir, "files", "test_output_parser")
+
+
+def _output_parser(columnar):
+    return OutputParser(open(os.path.join(base_dir, "test1.xml")),
+                        survey_output_file=open(os.path.join(base_dir, "test1_output.txt")),
+                        cts_output_file=open(os.path.join(base_dir, "test1_ctsout.txt")),
+                        columnar=columnar)
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.expected = _output_parser(False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _check_survey(self, table, run=None):
+        expected = self.expected.survey_output_data
+        if run is not None:
+            selected = table["run"] == run
+        else:
+            self.assertNotIn("run", table)
+            selected = numpy.ones(len(table), dtype=bool)
+        self.assertEqual(table.dictionaries["measure_name"][table["measure_name"][selected][0]],
+                         surveyFileMap[table["measure"][selected][0]][0])
+        species = table.decode("species")
+        for key, values in ((3, 1), expected[(3, 1)]), ((34, "funestus"), expected[(34, "funestus")]):
+            rows = selected & (table["measure"] == key[0])
+            if isinstance(key[1], int):
+                rows &= table["third_dimension"] == key[1]
+                self.assertTrue((species[rows] == "").all())
+            else:
+                rows &= species == key[1]
+                self.assertTrue((table["third_dimension"][rows] < 0).all())
+            self.assertEqual(list(zip(table["time"][rows].tolist(), table["value"][rows].tolist())),
+                             [tuple(item) for item in values])
+        self.assertEqual(numpy.count_nonzero(selected), sum(len(values) for values in expected.values()))
+
+    def _check_cts(self, table):
+        expected = self.expected.cts_output_data
+        self.assertEqual(table.dictionaries["measure_name"], list(expected.keys()))
+        rows = table.decode("measure_name") == "N_v0(arabiensis)"
+        self.assertEqual(table["value"][rows].tolist(), expected["N_v0(arabiensis)"])
+        self.assertEqual(table["line"][rows].tolist(), list(range(1461)))
+
+    def _formats(self):
+        return ["numpy"] + (["arrow", "parquet"] if export.pyarrow is not None else [])
+
+    def test_output_parser(self):
+        for format in self._formats():
+            for columnar in (True, False):
+                output_parser = _output_parser(columnar)
+                survey_filename = os.path.join(self.directory, "survey.%s" % format)
+                cts_filename = os.path.join(self.directory, "cts.%s" % format)
+                output_parser.export_survey(survey_filename, format)
+                output_parser.export_cts(cts_filename, format)
+                self.assertEqual(export.file_format(survey_filename), format)
+
+                table = export.read_table(survey_filename)
+                self.assertEqual(table.names, ["survey", "time", "measure", "measure_name", "third_dimension",
+                                               "species", "value"])
+                self._check_survey(table)
+                self._check_cts(export.read_table(cts_filename, memory_map=False))
+
+                # Column projection
+                table = export.read_table(survey_filename, columns=["measure_name", "value"])
+                self.assertEqual(table.names, ["measure_name", "value"])
+                self.assertEqual(list(table.dictionaries), ["measure_name"])
+
+    def test_numpy_format(self):
+        filename = os.path.join(self.directory, "survey")
+        self.expected.export_survey(filename, "numpy")
+        table = export.read_table(filename, columns=["value"])
+        self.assertIsInstance(table["value"], numpy.memmap)
+        self.assertRaises(ValueError, export.write_table, filename, {}, format="csv")
+        self.assertRaises(ValueError, export.file_format, os.path.join(base_dir, "test1.xml"))
+        if export.pyarrow is None:
+            self.assertRaises(RuntimeError, export.write_table, filename, {}, format="arrow")
+
+    def test_unknown_measures(self):
+        # surveyFileMap entries of measures 37 and 38 are None, 1000 is out of range
+        records = numpy.array([(1, 0, 37, 1.0), (1, 0, 38, 2.0), (1, 0, 1000, 3.0)], dtype=SURVEY_RECORD_DTYPE)
+        filename = os.path.join(self.directory, "survey")
+        export.export_survey(filename, SurveyOutputStore(records, [730]), format="numpy")
+        table = export.read_table(filename)
+        self.assertEqual(table.decode("measure_name").tolist(), ["37", "38", "1000"])
+        self.assertEqual(table["time"].tolist(), [730] * 3)
+
+    def test_survey_dict(self):
+        columns, dictionaries = export.survey_columns({(3, 1): [[5, 1.0], [10, 2.0]], (34, "gambiae"): [[10, 3.0]]})
+        self.assertEqual(columns["survey"].tolist(), [1, 2, 2])
+        self.assertEqual(columns["time"].tolist(), [5, 10, 10])
+        self.assertEqual(columns["third_dimension"].tolist(), [1, 1, -1])
+        self.assertEqual(dictionaries, {"measure_name": ["nPatent", "Vector_Sv"], "species": ["", "gambiae"]})
+        self.assertEqual(columns["value"].tolist(), [1.0, 2.0, 3.0])
+
+    def test_export_many(self):
+        simulations = []
+        for name in ("scenario1", "scenario2"):
+            simulation = os.path.join(self.directory, name)
+            os.mkdir(simulation)
+            shutil.copy(os.path.join(base_dir, "test1.xml"), os.path.join(simulation, "scenario.xml"))
+            shutil.copy(os.path.join(base_dir, "test1_output.txt"), os.path.join(simulation, "output.txt"))
+            simulations.append(simulation)
+        shutil.copy(os.path.join(base_dir, "test1_ctsout.txt"), os.path.join(simulations[1], "ctsout.txt"))
+        results = parse_many([os.path.join(self.directory, "missing")] + simulations, workers=1)
+
+        survey_filename = os.path.join(self.directory, "survey.out")
+        cts_filename = os.path.join(self.directory, "cts.out")
+        export_many(results, survey_filename, cts_filename)
+        table = export.read_table(survey_filename)
+        self.assertEqual(sorted(set(table["run"].tolist())), [1, 2])
+        self.assertEqual(table.metadata["paths"][1:], simulations)
+        self._check_survey(table, 1)
+        self._check_survey(table, 2)
+        table = export.read_table(cts_filename)
+        self.assertEqual(set(table["run"].tolist()), set([2]))
+        self._check_cts(table)
+
+        # No run has survey or continuous output
+        for format in self._formats():
+            export_many(results[:1], survey_filename, format=format)
+            export_many(results[:2], cts_filename=cts_filename, format=format)
+            table = export.read_table(survey_filename)
+            self.assertEqual(table.names, ["run", "survey", "time", "measure", "measure_name", "third_dimension",
+                                           "species", "value"])
+            self.assertEqual(len(table), 0)
+            self.assertEqual(table.dictionaries["measure_name"], [])
+            table = export.read_table(cts_filename)
+            self.assertEqual((len(table), table.dictionaries), (0, {"measure_name": []}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,8 +12,12 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 
-from vecnet.openmalaria import get_schema_version_from_xml
+from vecnet.openmalaria import get_schema_version_from_xml, get_schema_versions
+
+base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
 
 
 class TestGetSchemaVersion(unittest.TestCase):
@@ -21,8 +25,6 @@ class TestGetSchemaVersion(unittest.TestCase):
         pass
 
     def test_get_schema_version_from_xml(self):
-        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
-
         # use file handle as input to test_get_schema_version
         with open(os.path.join(base_dir, os.path.join("test_get_schema_version", "scenario30.xml"))) as fp:
             schema_version = get_schema_version_from_xml(fp)
@@ -46,6 +48,37 @@ class TestGetSchemaVersion(unittest.TestCase):
         schema_version = get_schema_version_from_xml("abcdef")
         self.assertIsNone(schema_version)
 
+        # Only the start tag of the root element is parsed
+        schema_version = get_schema_version_from_xml(
+            '<om:scenario xmlns:om="http://openmalaria.org/schema/scenario_32" '
+            'schemaVersion="32"><model><unclosed></model>')
+        self.assertEqual(schema_version, "32")
+        schema_version = get_schema_version_from_xml('<?xml version="1.0"?>\n<!-- comment --><scenario>')
+        self.assertIsNone(schema_version)
+
+    def test_get_schema_versions(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in ("scenario30.xml", "scenario32.xml", "non_om_xml.xml"):
+                shutil.copy(os.path.join(base_dir, "test_get_schema_version", name), directory)
+            os.mkdir(os.path.join(directory, "subdir"))
+            with open(os.path.join(directory, "subdir", "garbage.xml"), "w") as fp:
+                fp.write("abcdef")
+            with open(os.path.join(directory, "readme.txt"), "w") as fp:
+                fp.write("abcdef")
+
+            versions = get_schema_versions(directory)
+            self.assertEqual(list(versions.items()), [(os.path.join(directory, "non_om_xml.xml"), None),
+                                                      (os.path.join(directory, "scenario30.xml"), "30"),
+                                                      (os.path.join(directory, "scenario32.xml"), "32")])
+            versions = get_schema_versions(directory, pattern="scenario*.xml")
+            self.assertEqual(list(versions.values()), ["30", "32"])
+            versions = get_schema_versions(directory, recursive=True)
+            self.assertEqual(len(versions), 4)
+            self.assertIsNone(versions[os.path.join(directory, "subdir", "garbage.xml")])
+        finally:
+            shutil.rmtree(directory)
+
 
 if __name__ == "__main__":
     unittest.main()
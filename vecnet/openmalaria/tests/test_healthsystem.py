@@ -10,7 +10,11 @@
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import unittest
-from vecnet.openmalaria.healthsystem import get_prob_from_percentage, get_percentage_from_prob
+
+import numpy
+
+from vecnet.openmalaria.healthsystem import get_prob_from_percentage, get_percentage_from_prob, \
+    probabilities_from_percentages, percentages_from_probabilities
 
 
 class TestHealthSystem(unittest.TestCase):
@@ -39,4 +43,28 @@ class TestHealthSystem(unittest.TestCase):
         self.assertEqual(get_percentage_from_prob(0.5), 77)
         self.assertEqual(get_percentage_from_prob(0.9984183), 99)
         self.assertEqual(get_percentage_from_prob(0.9984185), 100)
-        self.assertEqual(get_percentage_from_prob(1.00), 100)
\ No newline at end of file
+        self.assertEqual(get_percentage_from_prob(1.00), 100)
+
+    def test_vectorized(self):
+        percentages = numpy.arange(101)
+        probabilities = probabilities_from_percentages(percentages)
+        self.assertEqual(probabilities.shape, (101,))
+        self.assertEqual(probabilities[50], 0.2411937)
+        self.assertEqual(percentages_from_probabilities(probabilities).tolist(), percentages.tolist())
+        self.assertEqual(percentages_from_probabilities([[0.0, 0.003655051], [0.5, 1.0]]).tolist(),
+                         [[0, 0], [77, 100]])
+        probabilities = numpy.random.RandomState(1).uniform(0, 1, 1000)
+        self.assertEqual(percentages_from_probabilities(probabilities).tolist(),
+                         [get_percentage_from_prob(float(prob)) for prob in probabilities])
+
+        # Linear interpolation
+        self.assertAlmostEqual(float(probabilities_from_percentages(0.5, interpolate=True)), 0.003655052 / 2)
+        self.assertEqual(probabilities_from_percentages([50.0], interpolate=True).tolist(), [0.2411937])
+        self.assertAlmostEqual(float(percentages_from_probabilities(0.003655052 / 2, interpolate=True)), 0.5)
+        self.assertEqual(float(percentages_from_probabilities(1.0, interpolate=True)), 100)
+
+        self.assertRaises(ValueError, probabilities_from_percentages, 0.5)
+        self.assertRaises(ValueError, probabilities_from_percentages, [50, 101])
+        self.assertRaises(ValueError, probabilities_from_percentages, -0.5, True)
+        self.assertRaises(ValueError, percentages_from_probabilities, [0.5, 1.1])
+        self.assertRaises(ValueError, percentages_from_probabilities, numpy.nan)
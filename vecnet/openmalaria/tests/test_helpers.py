@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import itertools
+import os
+import shutil
+import tempfile
+
+from vecnet.openmalaria.helpers import is_prime, prime_numbers, nth_seed, PrimeTable, FileCache
+
+
+class TestPrimeNumbers(unittest.TestCase):
+    def test_prime_table(self):
+        expected = [n for n in range(1000, 50000) if is_prime(n)]
+        table = PrimeTable(1000, segment_size=1000)
+        self.assertEqual([table[i] for i in range(len(expected))], expected)
+        self.assertEqual(list(itertools.islice(PrimeTable(1000).iterate(10), 3)), expected[10:13])
+        self.assertEqual(list(itertools.islice(PrimeTable(), 5)), [2, 3, 5, 7, 11])
+        self.assertRaises(IndexError, table.__getitem__, -1)
+
+    def test_prime_numbers(self):
+        self.assertEqual(list(itertools.islice(prime_numbers(1000), 3)), [1009, 1013, 1019])
+        self.assertEqual(list(itertools.islice(prime_numbers(14), 3)), [17, 19, 23])
+
+    def test_nth_seed(self):
+        self.assertEqual([nth_seed(i) for i in range(3)], [1009, 1013, 1019])
+        self.assertEqual(nth_seed(99999), 1302019)
+        self.assertTrue(is_prime(nth_seed(5000)))
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as fp:
+            fp.write(content)
+        return filename
+
+    def test_read(self):
+        cache = FileCache()
+        filename = self.write("model.xml", "<model/>")
+        self.assertEqual(cache.read(filename), "<model/>")
+        self.assertEqual(cache.read(os.path.join(self.directory, ".", "model.xml")), "<model/>")
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 1))
+        self.assertGreater(cache.stats()["bytes"], len("<model/>"))
+        # Changed file is read again
+        self.write("model.xml", "<model>changed</model>")
+        self.assertEqual(cache.read(filename), "<model>changed</model>")
+        self.assertEqual(cache.misses, 2)
+        cache.clear()
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_eviction(self):
+        filenames = [self.write("%s.xml" % i, "x" * 1000) for i in range(3)]
+        cache = FileCache(max_bytes=2500)
+        for filename in filenames + filenames[2:]:
+            cache.read(filename)
+        # The least recently used file is evicted
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.nbytes, 2500)
+        cache.read(filenames[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+        # Files larger than the cache are not cached
+        cache.read(self.write("large.xml", "x" * 3000))
+        self.assertEqual(len(cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,8 +13,13 @@
 import unittest
 import math
 import os
+import shutil
+import tempfile
+import numpy
 
-from vecnet.openmalaria.output_parser import OutputParser
+from vecnet.openmalaria.output_parser import OutputParser, SurveyOutputStore, SurveyRecord, CtsRow, \
+    iter_survey_records, iter_cts_rows, read_cts_header, load_survey_records, load_cts_columns, _NOT_PARSED, \
+    continuous_measure_index, survey_measure_index
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 base_dir = os.path.join(base_dir, "files", "test_output_parser")
@@ -96,6 +101,149 @@ class TestOutputParser(unittest.TestCase):
         self.assertEqual(len(allCauseIMR[0]), 2)
         self.assertTrue(math.isnan(allCauseIMR[0][1]))
 
+    def test_columnar(self):
+        output_parser = OutputParser(open(os.path.join(base_dir, "scenario.xml")),
+                                     survey_output_file=open(os.path.join(base_dir, "output.txt")),
+                                     cts_output_file=open(os.path.join(base_dir, "ctsout.txt")),
+                                     columnar=True)
+        store = output_parser.survey_output_data
+        self.assertIsInstance(store, SurveyOutputStore)
+        self.assertEqual(set(output_parser.get_survey_measures()), ({(3, 2), (3, 1), (14, 1), (14, 2)}))
+        self.assertEqual(store.records.dtype.itemsize, 20)
+        self.assertEqual(len(store.value), 24)
+        self.assertEqual(store.get_values((3, 2)).tolist(), [16.0, 17.0, 16.0, 14.0, 12.0, 10.0])
+        self.assertEqual(store.get_times((3, 2)).tolist(), [730, 803, 876, 949, 1022, 1095])
+        # Records are views of the store, not copies
+        self.assertTrue(numpy.shares_memory(store[(3, 2)], store.records))
+        self.assertEqual(store.to_dict()[(14, 1)],
+                         [[730, 1116.0], [803, 99.0], [876, 82.0], [949, 100.0], [1022, 102.0], [1095, 92.0]])
+
+    def test_columnar_vector_measures(self):
+        expected = OutputParser(open(os.path.join(base_dir, "test1.xml")),
+                                survey_output_file=open(os.path.join(base_dir, "test1_output.txt")))
+        output_parser = OutputParser(open(os.path.join(base_dir, "test1.xml")),
+                                     survey_output_file=open(os.path.join(base_dir, "test1_output.txt")),
+                                     columnar=True)
+        store = output_parser.survey_output_data
+        self.assertEqual(len(store[(34, "funestus")]), 241)
+        self.assertEqual(store.to_dict(), expected.survey_output_data)
+
+    def test_iter_survey_records(self):
+        with open(os.path.join(base_dir, "test1_output.txt")) as fp:
+            records = list(iter_survey_records(fp, measures={34}))
+        self.assertEqual(len(records), 241 * 4)
+        self.assertEqual(records[0], SurveyRecord(survey=1, third_dimension="arabiensis", measure=34, value=2.5887))
+        records = list(iter_survey_records("1\t2\t3\t16\n2\t2\t3\t17\n"))
+        self.assertEqual(records, [(1, 2, 3, 16.0), (2, 2, 3, 17.0)])
+        self.assertRaises(ValueError, list, iter_survey_records("1\tgambiae\t3\t16\n"))
+
+    def test_iter_cts_rows(self):
+        with open(os.path.join(base_dir, "ctsout.txt")) as fp:
+            self.assertEqual(read_cts_header(fp), ["simulated EIR"])
+            rows = iter_cts_rows(fp, ["simulated EIR"])
+            self.assertEqual(next(rows), CtsRow(timestep=0, values=(0.273542,)))
+            self.assertEqual(next(rows), CtsRow(timestep=1, values=(0.251751,)))
+        rows = list(iter_cts_rows("##\t##\ntimestep\tinput EIR\tsimulated EIR\n0\t1.5\t2\n"))
+        self.assertEqual(rows, [(0, (1.5, 2.0))])
+        self.assertRaises(TypeError, list, iter_cts_rows("##\t##\nsimulated EIR\n0.1\n"))
+
+    def test_load_survey_records(self):
+        with open(os.path.join(base_dir, "test1_output.txt")) as fp:
+            records, labels = load_survey_records(fp)
+        self.assertEqual(len(records), 9641)
+        self.assertEqual(labels, ["arabiensis", "funestus", "gambiae", "minor"])
+        self.assertEqual(records[0].tolist(), (1, 1, 0, 100.0))
+        # Species' names are replaced with negative codes
+        self.assertEqual(set(records["third_dimension"][records["measure"] == 34]), {-1, -2, -3, -4})
+        # Reading content of a file (StringIO) gives the same result
+        with open(os.path.join(base_dir, "test1_output.txt")) as fp:
+            self.assertTrue(numpy.array_equal(load_survey_records(fp.read())[0], records))
+        self.assertRaises(ValueError, load_survey_records, "1\tgambiae\t3\t16\n")
+
+        with open(os.path.join(base_dir, "output_nan.txt")) as fp:
+            records, labels = load_survey_records(fp)
+        self.assertTrue(math.isnan(records[(records["measure"] == 21)]["value"][0]))
+
+    def test_load_cts_columns(self):
+        with open(os.path.join(base_dir, "test1_ctsout.txt")) as fp:
+            columns = load_cts_columns(fp)
+        expected = OutputParser(open(os.path.join(base_dir, "test1.xml")),
+                                cts_output_file=open(os.path.join(base_dir, "test1_ctsout.txt")))
+        self.assertEqual(list(columns.keys()), expected.get_cts_measures())
+        for measure in columns:
+            self.assertEqual(columns[measure].tolist(), expected.cts_output_data[measure])
+        self.assertTrue(columns["N_v0(gambiae)"].flags["C_CONTIGUOUS"])
+
+    def test_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            def parse(survey_output_file="test1_output.txt"):
+                return OutputParser(open(os.path.join(base_dir, "test1.xml")),
+                                    survey_output_file=open(os.path.join(base_dir, survey_output_file)),
+                                    cts_output_file=open(os.path.join(base_dir, "test1_ctsout.txt")),
+                                    cache_dir=cache_dir)
+            output_parser = parse()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached = parse()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            # Cache is used instead of parsing files, the scenario is not parsed at all
+            self.assertIs(cached._scenario, _NOT_PARSED)
+            # Memory-mapped, read-only
+            self.assertFalse(cached.survey_output_data.records.flags.writeable)
+            self.assertEqual(cached.survey_time_list, output_parser.survey_time_list)
+            self.assertEqual(cached.get_cts_measures(), output_parser.get_cts_measures())
+            self.assertEqual(cached.cts_output_data["N_v0(arabiensis)"].tolist(),
+                             output_parser.cts_output_data["N_v0(arabiensis)"].tolist())
+            self.assertEqual(cached.survey_output_data.to_dict(), output_parser.survey_output_data.to_dict())
+            # Different input - new cache file
+            parse("output_nan.txt")
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_lazy(self):
+        output_parser = OutputParser(open(os.path.join(base_dir, "scenario.xml")),
+                                     survey_output_file=open(os.path.join(base_dir, "output.txt")),
+                                     cts_output_file=open(os.path.join(base_dir, "ctsout.txt")),
+                                     lazy=True)
+        self.assertEqual(output_parser.get_cts_measures(), ["simulated EIR"])
+        self.assertEqual(set(output_parser.get_survey_measures()), ({(3, 2), (3, 1), (14, 1), (14, 2)}))
+        # Listing measures doesn't parse anything else
+        self.assertIs(output_parser._scenario, _NOT_PARSED)
+        self.assertIs(output_parser._cts_output_data, _NOT_PARSED)
+        self.assertEqual(output_parser.survey_output_data[(3, 2)],
+                         [[730, 16.0], [803, 17.0], [876, 16.0], [949, 14.0], [1022, 12.0], [1095, 10.0]])
+        self.assertEqual(len(output_parser.cts_output_data["simulated EIR"]), 1096)
+        self.assertEqual(output_parser.get_cts_measures(), ["simulated EIR"])
+
+        output_parser = OutputParser(open(os.path.join(base_dir, "scenario.xml")), lazy=True)
+        self.assertEqual(output_parser.survey_time_list, [730, 803, 876, 949, 1022, 1095])
+        self.assertRaises(AttributeError, getattr, output_parser, "survey_output_data")
+
+    def test_measure_catalog(self):
+        output_parser = OutputParser(open(os.path.join(base_dir, "scenario.xml")))
+        catalog = output_parser.measure_catalog
+        self.assertIs(output_parser.measure_catalog, catalog)
+        self.assertEqual(catalog.age_groups, ["0.0 - 18", "18 - 90"])
+        info = catalog.survey(3, 2)
+        self.assertEqual((info.name, info.measure, info.kind), ("nPatent(18 - 90)", "nPatent", "age group"))
+        self.assertIs(catalog.survey(3, 2), info)
+        self.assertEqual(catalog.survey(34, "funestus").name, "Vector_Sv(funestus)")
+        self.assertEqual(catalog.survey(7, 0).name, "nTransmit")
+        self.assertRaises(IndexError, catalog.survey, 3, 3)
+        self.assertRaises(KeyError, catalog.survey, 37, 0)
+        self.assertRaises(KeyError, catalog.survey, 1000, 0)
+
+        info = catalog.cts("N_v0(gambiae)")
+        self.assertEqual(info[:4], (continuous_measure_index["N_v0"], "gambiae", "N_v0(gambiae)", "N_v0"))
+        self.assertEqual(info.kind, "vector species")
+        info = catalog.cts("simulated EIR")
+        self.assertEqual((info.third_dimension, info.kind, info.unit),
+                         (None, None, "inoculations per adult per timestep"))
+        self.assertEqual(catalog.cts("P_C*P_D(minor)").measure, "P_C*P_D")
+        self.assertIsNone(catalog.cts("unknown(x)").measure_id)
+        self.assertEqual(survey_measure_index["nPatent"], 3)
+
     def setUp(self):
         pass
 
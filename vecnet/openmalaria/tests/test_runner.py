@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.runner import run_experiment, run_simulation, RunState, STATE_FILENAME, format_command
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(base_dir, "files", "test_output_parser")
+stub = os.path.join(base_dir, "files", "test_runner", "openmalaria_stub.py")
+command = [sys.executable, stub, "--scenario", "{scenario}", "--data", data_dir]
+
+
+def runs(result):
+    with open(os.path.join(result.directory, "runs.txt")) as fp:
+        return len(fp.readlines())
+
+
+class TestRunner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(data_dir, "test1.xml")) as fp:
+            base = fp.read() + "<!-- @mode@ -->\n"
+        self.experiment = {
+            "name": "Runner",
+            "base": base,
+            "sweeps": {
+                "mode": {
+                    "ok": {"@mode@": "mode:ok"},
+                    "fail": {"@mode@": "mode:fail"},
+                    "flaky": {"@mode@": "mode:flaky"},
+                    "slow": {"@mode@": "mode:slow"},
+                }
+            },
+            "combinations": [["mode"], ["ok"], ["fail"], ["flaky"], ["slow"]]
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run_experiment(self):
+        progress = []
+        results = run_experiment(ExperimentSpecification(self.experiment), self.directory, command, workers=2,
+                                 timeout=1, retries=1, parse_workers=1,
+                                 progress=lambda done, total, result: progress.append((done, total)))
+        self.assertEqual([result.name for result in results], ["scenario1", "scenario2", "scenario3", "scenario4"])
+        self.assertEqual([result.parameters["mode"] for result in results], ["ok", "fail", "flaky", "slow"])
+        self.assertEqual(progress, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        ok, fail, flaky, slow = results
+
+        self.assertTrue(ok.ok)
+        self.assertEqual((ok.returncode, ok.attempts, ok.error), (0, 1, None))
+        self.assertEqual(len(ok.output.survey[(34, "funestus")]), 241)
+        self.assertEqual(len(ok.output.cts["N_v0(arabiensis)"]), 1461)
+        with open(os.path.join(ok.directory, "stdout.txt")) as fp:
+            self.assertIn("scenario.xml", fp.read())
+
+        self.assertFalse(fail.ok)
+        self.assertEqual((fail.returncode, fail.attempts, fail.error), (1, 2, "Exit code 1"))
+        self.assertIsNone(fail.output)
+        with open(os.path.join(fail.directory, "stderr.txt")) as fp:
+            self.assertEqual(fp.read().strip(), "Failed")
+
+        self.assertTrue(flaky.ok)
+        self.assertEqual(flaky.attempts, 2)
+        self.assertTrue(flaky.output.ok)
+
+        self.assertFalse(slow.ok)
+        self.assertEqual(slow.error, "Timeout after 1 seconds")
+        self.assertIsNone(slow.returncode)
+        self.assertFalse(os.path.exists(os.path.join(slow.directory, "output.txt")))
+
+        state = RunState(os.path.join(self.directory, STATE_FILENAME))
+        self.assertEqual(state.get("scenario1")["status"], "done")
+        self.assertEqual(state.get("scenario1")["parameters"], {"mode": "ok"})
+        self.assertEqual(state.get("scenario2")["status"], "failed")
+
+    def test_resume(self):
+        del self.experiment["sweeps"]["mode"]["slow"]
+        self.experiment["combinations"] = [["mode"], ["ok"], ["fail"], ["flaky"]]
+        results = run_experiment(ExperimentSpecification(self.experiment), self.directory, command, parse=False)
+        self.assertEqual([result.status for result in results], ["done", "failed", "failed"])
+        self.assertTrue(all(result.output is None for result in results))
+
+        # A crash while saving the state leaves an incomplete record
+        with open(os.path.join(self.directory, STATE_FILENAME), "a") as fp:
+            fp.write('{"name": "scenario1", "sta')
+        # Finished simulations are not run again, failed ones are
+        results = run_experiment(ExperimentSpecification(self.experiment), self.directory, command, parse_workers=1)
+        self.assertEqual([result.status for result in results], ["done", "failed", "done"])
+        self.assertEqual([result.resumed for result in results], [True, False, False])
+        self.assertEqual([runs(result) for result in results], [1, 2, 2])
+        self.assertTrue(results[0].output.ok)
+
+        # Changed scenario is run again
+        self.experiment["sweeps"]["mode"]["ok"]["@mode@"] = "mode:ok changed"
+        results = run_experiment(ExperimentSpecification(self.experiment), self.directory, command, parse=False)
+        self.assertEqual([result.resumed for result in results], [False, False, True])
+        self.assertEqual(runs(results[0]), 2)
+
+        # resume=False runs everything
+        results = run_experiment(ExperimentSpecification(self.experiment), self.directory, command, parse=False,
+                                 resume=False)
+        self.assertEqual([runs(result) for result in results], [3, 4, 3])
+
+    def test_run_simulation(self):
+        directory = os.path.join(self.directory, "simulation")
+        os.mkdir(directory)
+        shutil.copy(os.path.join(data_dir, "test1.xml"), os.path.join(directory, "scenario.xml"))
+        self.assertEqual(run_simulation(directory, " ".join(command)), (0, 1, None))
+        self.assertTrue(os.path.exists(os.path.join(directory, "ctsout.txt")))
+        returncode, attempts, error = run_simulation(directory, ["missing-openmalaria-executable"], retries=3)
+        self.assertEqual((returncode, attempts), (None, 1))
+        self.assertIn("Can't start missing-openmalaria-executable", error)
+
+    def test_format_command(self):
+        values = dict(scenario="/tmp/{name}/scenario.xml", directory="/tmp/{name}", name="scenario1")
+        self.assertEqual(format_command(["sh", "-c", "echo ${HOME} {0} {seed}", "{scenario}", "{name}"], **values),
+                         ["sh", "-c", "echo ${HOME} {0} {seed}", "/tmp/{name}/scenario.xml", "scenario1"])
+        self.assertEqual(format_command("awk '{print $1}' {directory}/output.txt", **values),
+                         ["awk", "{print $1}", "/tmp/{name}/output.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import random
+
+from vecnet.openmalaria.template import Template
+
+
+def replace_all(text, substitutions):
+    for placeholder, value in substitutions:
+        text = text.replace(placeholder, value)
+    return text
+
+
+class TestTemplate(unittest.TestCase):
+    def test_render(self):
+        template = Template("<xml> @itn@ @irs@ @itn@ </xml>", ["@itn@", "@irs@", "@seed@"])
+        self.assertEqual(template.slots, ["@itn@", "@irs@", "@itn@"])
+        self.assertEqual(template.render([("@itn@", "80"), ("@irs@", "66")]), "<xml> 80 66 80 </xml>")
+        # Placeholders without substitution are left as is
+        self.assertEqual(template.render([("@irs@", "66")]), "<xml> @itn@ 66 @itn@ </xml>")
+        self.assertEqual(Template("<xml/>", []).render([("@a@", "1")]), "<xml/>")
+
+    def test_nested(self):
+        template = Template("<xml> @itn@ @irs@ </xml>", ["@itn@", "@irs@"])
+        # Values are affected by later substitutions only
+        self.assertEqual(template.render([("@itn@", "80 @irs@"), ("@irs@", "66")]), "<xml> 80 66 66 </xml>")
+        self.assertEqual(template.render([("@irs@", "66"), ("@itn@", "80 @irs@")]), "<xml> 80 @irs@ 66 </xml>")
+        # The same placeholder substituted twice
+        self.assertEqual(template.render([("@itn@", "@irs@"), ("@irs@", "@itn@"), ("@itn@", "1")]),
+                         "<xml> 1 1 </xml>")
+
+    def test_sequential_replace(self):
+        rng = random.Random(1)
+        placeholders = ["@a@", "@b@", "@param@", "@seed@"]
+        for i in range(200):
+            text = "".join(rng.choice(placeholders + ["x", " ", "<y>"]) for j in range(30))
+            substitutions = [(rng.choice(placeholders),
+                              "".join(rng.choice(placeholders + ["1", "2"]) for j in range(rng.randint(0, 3))))
+                             for k in range(rng.randint(0, 5))]
+            self.assertEqual(Template(text, placeholders).render(substitutions), replace_all(text, substitutions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections import OrderedDict
+
+from vecnet.openmalaria.batch import ParsedOutput, parse_many
+from vecnet.openmalaria.output_parser import OutputParser
+from vecnet.openmalaria.warehouse import ResultWarehouse
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+base_dir = os.path.join(base_dir, "files", "test_output_parser")
+
+
+class TestResultWarehouse(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "results.sqlite")
+        self.simulation = os.path.join(self.directory, "scenario1")
+        os.mkdir(self.simulation)
+        shutil.copy(os.path.join(base_dir, "test1.xml"), os.path.join(self.simulation, "scenario.xml"))
+        shutil.copy(os.path.join(base_dir, "test1_output.txt"), os.path.join(self.simulation, "output.txt"))
+        shutil.copy(os.path.join(base_dir, "test1_ctsout.txt"), os.path.join(self.simulation, "ctsout.txt"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_warehouse(self):
+        columnar = parse_many([self.simulation], workers=1)[0]
+        expected = OutputParser(open(os.path.join(base_dir, "test1.xml")),
+                                survey_output_file=open(os.path.join(base_dir, "test1_output.txt")),
+                                cts_output_file=open(os.path.join(base_dir, "test1_ctsout.txt")))
+        other = OutputParser(open(os.path.join(base_dir, "scenario.xml")),
+                             survey_output_file=open(os.path.join(base_dir, "output.txt")))
+
+        with ResultWarehouse(self.filename) as warehouse:
+            first = warehouse.add(columnar, {"itn": "on", "irs": "off"}, name="scenario1")
+            second = warehouse.add(other, {"itn": "off", "irs": "off"}, name="scenario2")
+            # The same scenario with other arms is not loaded again
+            self.assertEqual(warehouse.add(expected, {"itn": "on", "irs": "on"}), first)
+            self.assertEqual(warehouse.connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+        with ResultWarehouse(self.filename) as warehouse:
+            with open(os.path.join(base_dir, "test1.xml"), "rb") as fp:
+                self.assertEqual(warehouse.scenario_id(hashlib.sha256(fp.read()).hexdigest()), first)
+            scenarios = warehouse.scenarios()
+            self.assertEqual(list(scenarios), [first, second])
+            self.assertEqual(scenarios[second][1:], ("scenario2", {"itn": "off", "irs": "off"}))
+            self.assertEqual(list(warehouse.scenarios({"irs": "on"})), [first])
+            self.assertEqual(list(warehouse.scenarios({"irs": "off", "itn": "off"})), [second])
+
+            # Age group
+            rows = warehouse.survey(3, 1)
+            self.assertEqual(set(row[0] for row in rows), set([first, second]))
+            self.assertEqual([row[2:] for row in rows if row[0] == first], [tuple(item) for item in
+                                                                            expected.survey_output_data[(3, 1)]])
+            self.assertEqual([row[2:] for row in rows if row[0] == second], [tuple(item) for item in
+                                                                             other.survey_output_data[(3, 1)]])
+            self.assertEqual(warehouse.survey(3, 1, {"itn": "off"}), [row for row in rows if row[0] == second])
+            # Vector species
+            rows = warehouse.survey(34, "funestus", {"itn": "on"})
+            self.assertEqual([row[2:] for row in rows], [tuple(item) for item in
+                                                         expected.survey_output_data[(34, "funestus")]])
+            self.assertEqual(len(warehouse.survey(34, parameters={"itn": "on"})), 4 * 241)
+            self.assertEqual(warehouse.survey(3, 1, {"itn": "missing"}), [])
+
+            rows = warehouse.cts("N_v0(arabiensis)")
+            self.assertEqual([row[2] for row in rows], expected.cts_output_data["N_v0(arabiensis)"])
+            self.assertEqual(rows[1][:2], (first, 1))
+            self.assertEqual(warehouse.cts("missing"), [])
+
+            # Queries are answered from covering indexes
+            for query, arguments in (("SELECT scenario_id, time, value FROM survey WHERE measure = ? AND "
+                                      "third_dimension = ?", (3, 2)),
+                                     ("SELECT scenario_id, line, value FROM cts WHERE measure_id = ?", (1,))):
+                plan = " ".join(str(row) for row in warehouse.connection.execute("EXPLAIN QUERY PLAN " + query,
+                                                                                 arguments))
+                self.assertIn("COVERING INDEX", plan)
+
+    def test_rollback(self):
+        with ResultWarehouse(self.filename) as warehouse:
+            # Second measure fails after the first one was inserted into cts_measures
+            broken = ParsedOutput("broken", cts=OrderedDict([("new measure", [1.0, 2.0]), ("broken", ["x"])]))
+            self.assertRaises(ValueError, warehouse.add, broken, scenario_hash="1")
+            self.assertEqual(warehouse.scenarios(), {})
+            self.assertEqual(warehouse.cts("new measure"), [])
+            first = warehouse.add(ParsedOutput("first", cts=OrderedDict([("other", [3.0])])), scenario_hash="2")
+            second = warehouse.add(ParsedOutput("second", cts=OrderedDict([("new measure", [4.0])])),
+                                   scenario_hash="3")
+            self.assertEqual(warehouse.cts("new measure"), [(second, 0, 4.0)])
+            self.assertEqual(warehouse.cts("other"), [(first, 0, 3.0)])
+        with ResultWarehouse(self.filename) as warehouse:
+            self.assertEqual(warehouse.cts("new measure"), [(second, 0, 4.0)])
+
+    def test_failed_output(self):
+        failed = parse_many([os.path.join(self.directory, "missing")], workers=1)[0]
+        with ResultWarehouse(":memory:") as warehouse:
+            self.assertRaises(ValueError, warehouse.add, failed)
+            self.assertRaises(TypeError, warehouse.add, "output.txt")
+            self.assertEqual(warehouse.scenarios(), {})
+        self.assertRaises(sqlite3.ProgrammingError, warehouse.scenarios)
+
+
+if __name__ == "__main__":
+    unittest.main()
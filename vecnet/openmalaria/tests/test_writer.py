@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from vecnet.openmalaria import writer
+from vecnet.openmalaria.writer import open_writer, write_manifest, archive_format
+
+
+class TestWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.files = [("scenario%s.xml" % i, u"<xml> %s </xml>" % i) for i in range(1, 101)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, archive=None):
+        with open_writer(self.directory, archive, workers=4) as scenario_writer:
+            for name, data in self.files:
+                scenario_writer.write(name, data)
+        self.assertEqual(list(scenario_writer.files.keys()), [name for name, data in self.files])
+        self.assertEqual(scenario_writer.files["scenario2.xml"],
+                         (hashlib.sha256(b"<xml> 2 </xml>").hexdigest(), 14))
+        return scenario_writer
+
+    def test_directory(self):
+        self.write()
+        self.assertEqual(len(os.listdir(self.directory)), 100)
+        with open(os.path.join(self.directory, "scenario100.xml")) as fp:
+            self.assertEqual(fp.read(), "<xml> 100 </xml>")
+
+    def test_tar(self):
+        self.write("scenarios.tar.gz")
+        with tarfile.open(os.path.join(self.directory, "scenarios.tar.gz")) as tar:
+            self.assertEqual(tar.getnames(), [name for name, data in self.files])
+            self.assertEqual(tar.extractfile("scenario7.xml").read(), b"<xml> 7 </xml>")
+
+    @unittest.skipIf(writer.zstandard is None, "zstandard is not installed")
+    def test_tar_zstd(self):
+        self.write("scenarios.tar.zst")
+        with open(os.path.join(self.directory, "scenarios.tar.zst"), "rb") as fp:
+            reader = writer.zstandard.ZstdDecompressor().stream_reader(fp)
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                self.assertEqual([member.name for member in tar], [name for name, data in self.files])
+
+    def test_zip(self):
+        self.write("scenarios.zip")
+        with zipfile.ZipFile(os.path.join(self.directory, "scenarios.zip")) as archive:
+            self.assertEqual(archive.namelist(), [name for name, data in self.files])
+            self.assertEqual(archive.read("scenario7.xml"), b"<xml> 7 </xml>")
+
+    def test_archive_format(self):
+        self.assertEqual(archive_format("a.tgz"), ("tar", "gz"))
+        self.assertEqual(archive_format("a.tar"), ("tar", None))
+        self.assertEqual(archive_format("a.tar.zst"), ("tar", "zst"))
+        self.assertRaises(ValueError, archive_format, "a.rar")
+
+    def test_abstract_writer(self):
+        self.assertRaises(TypeError, writer.ScenarioWriter)
+
+    def test_manifest(self):
+        rows = [{"filename": "scenario1.xml", "sha256": "00", "itn": "80"}]
+        write_manifest(os.path.join(self.directory, "manifest.csv"), rows, ["filename", "sha256", "itn"])
+        write_manifest(os.path.join(self.directory, "manifest.json"), rows, ["filename", "sha256", "itn"])
+        with open(os.path.join(self.directory, "manifest.csv")) as fp:
+            self.assertEqual(list(csv.DictReader(fp)), rows)
+        with open(os.path.join(self.directory, "manifest.json")) as fp:
+            self.assertEqual(json.load(fp), rows)
+        self.assertRaises(ValueError, write_manifest, "manifest.txt", rows, ["filename"])
+
+
+if __name__ == "__main__":
+    unittest.main()
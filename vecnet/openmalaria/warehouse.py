@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+SQLite database of simulation results of experiments.
+
+Survey and continuous output of every scenario is loaded once, together with the arms of the scenario, and can
+then be queried by measure, third dimension (age group or vector species) and arm without parsing output files.
+
+Tables:
+  scenarios (scenario_id, hash, name) - hash is sha256 of the scenario file
+  parameters (sweep, arm, scenario_id) - arms of scenarios, Scenario.parameters
+  survey (scenario_id, measure, third_dimension, survey, time, value) - survey output (output.txt).
+    third_dimension is an integer (age group, cohort) or the name of a vector species
+  cts_measures (measure_id, name) - columns of continuous output
+  cts (scenario_id, measure_id, line, value) - continuous output (ctsout.txt), line is the number of the line of
+    the value in ctsout.txt, from 0 (not counting the header)
+Indexes cover (measure, third dimension, scenario) queries of survey output and (measure, scenario) queries of
+continuous output, so they never read the tables themselves.
+"""
+import hashlib
+import sqlite3
+from collections import OrderedDict
+
+import numpy
+import six
+
+from .batch import ParsedOutput, _input_files
+from .output_parser import OutputParser, SurveyOutputStore
+
+# Number of rows inserted with a single executemany call
+BATCH_SIZE = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    scenario_id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    sweep TEXT NOT NULL,
+    arm TEXT NOT NULL,
+    scenario_id INTEGER NOT NULL REFERENCES scenarios (scenario_id),
+    PRIMARY KEY (sweep, arm, scenario_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS survey (
+    scenario_id INTEGER NOT NULL REFERENCES scenarios (scenario_id),
+    measure INTEGER NOT NULL,
+    third_dimension NOT NULL,
+    survey INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS survey_measure ON survey (measure, third_dimension, scenario_id, time, value);
+CREATE TABLE IF NOT EXISTS cts_measures (
+    measure_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS cts (
+    scenario_id INTEGER NOT NULL REFERENCES scenarios (scenario_id),
+    measure_id INTEGER NOT NULL REFERENCES cts_measures (measure_id),
+    line INTEGER NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS cts_measure ON cts (measure_id, scenario_id, line, value);
+"""
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _survey_rows(scenario_id, survey, survey_times):
+    """
+    Rows of survey table
+    :param survey: SurveyOutputStore or OutputParser.survey_output_data dict
+    """
+    if isinstance(survey, SurveyOutputStore):
+        records = survey.records
+        third_dimension = records["third_dimension"].tolist()
+        if survey.third_dimension_labels:
+            labels = survey.third_dimension_labels
+            third_dimension = [labels[-1 - value] if value < 0 else value for value in third_dimension]
+        surveys = records["survey"]
+        times = survey.survey_times[surveys - 1] if len(surveys) else surveys
+        return six.moves.zip([scenario_id] * len(records), records["measure"].tolist(), third_dimension,
+                             surveys.tolist(), times.tolist(), records["value"].tolist())
+    survey_numbers = dict((time, number) for number, time in enumerate(survey_times, 1))
+    return ((scenario_id, measure, third_dimension, survey_numbers[time], time, value)
+            for (measure, third_dimension), values in survey.items() for time, value in values)
+
+
+class ResultWarehouse(object):
+    """
+    SQLite database of simulation results. Use as a context manager, or call close() when done.
+
+        with ResultWarehouse("results.sqlite") as warehouse:
+            for parameters, output_parser in outputs:
+                warehouse.add(output_parser, parameters)
+            rows = warehouse.survey(3, 2, parameters={"itn": "itn80"})
+
+    Database is in WAL mode, so it can be read by other connections while results are loaded.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        if filename != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, NORMAL is safe against corruption; a power loss may only lose the last transactions
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._cts_measures = dict(self.connection.execute("SELECT name, measure_id FROM cts_measures"))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def scenario_id(self, scenario_hash):
+        """
+        :returns: id of the scenario with sha256 hash, None if it is not in the database
+        """
+        row = self.connection.execute("SELECT scenario_id FROM scenarios WHERE hash = ?", (scenario_hash,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _cts_measure_id(self, name, new_measures):
+        """
+        Id of a continuous measure, inserted into cts_measures if it's not there yet.
+        Ids of inserted measures are kept in new_measures until the transaction is committed
+        """
+        measure_id = self._cts_measures.get(name, new_measures.get(name))
+        if measure_id is None:
+            measure_id = self.connection.execute("INSERT INTO cts_measures (name) VALUES (?)", (name,)).lastrowid
+            new_measures[name] = measure_id
+        return measure_id
+
+    def add(self, output, parameters=None, name=None, scenario_hash=None):
+        """
+        Load results of a scenario, in a single transaction.
+        Results of a scenario that is already in the database (the same hash) are not loaded again, only arms in
+        parameters are added to it (identical scenarios of different combinations of arms)
+        :param output: OutputParser or batch.ParsedOutput (of a simulation directory)
+        :param parameters: dict {sweep name: arm name}, e.g. Scenario.parameters
+        :param name: name of the scenario, e.g. scenario file name
+        :param scenario_hash: sha256 of the scenario file. Computed from the scenario file if not specified
+        :returns: scenario id
+        """
+        if isinstance(output, OutputParser):
+            survey_times = output.survey_time_list
+            # Both raise AttributeError if there is no such output file
+            survey = getattr(output, "survey_output_data", None)
+            cts = getattr(output, "cts_output_data", None)
+            if scenario_hash is None:
+                xml = output.xml
+                scenario_hash = hashlib.sha256(xml.encode("utf-8") if isinstance(xml, six.text_type)
+                                               else xml).hexdigest()
+        elif isinstance(output, ParsedOutput):
+            if not output.ok:
+                raise ValueError("Output of %s was not parsed: %s" % (output.path, output.error))
+            survey_times, survey, cts = output.survey_time_list, output.survey, output.cts
+            if scenario_hash is None:
+                with open(_input_files(output.path)[0], "rb") as fp:
+                    scenario_hash = hashlib.sha256(fp.read()).hexdigest()
+        else:
+            raise TypeError("output should be OutputParser or ParsedOutput")
+
+        new_measures = {}
+        with self.connection:
+            scenario_id = self.scenario_id(scenario_hash)
+            new = scenario_id is None
+            if new:
+                scenario_id = self.connection.execute("INSERT INTO scenarios (hash, name) VALUES (?, ?)",
+                                                      (scenario_hash, name)).lastrowid
+            if parameters:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO parameters (sweep, arm, scenario_id) VALUES (?, ?, ?)",
+                    [(sweep, arm, scenario_id) for sweep, arm in sorted(parameters.items())])
+            if not new:
+                return scenario_id
+            if survey is not None:
+                for batch in _batches(_survey_rows(scenario_id, survey, survey_times)):
+                    self.connection.executemany("INSERT INTO survey VALUES (?, ?, ?, ?, ?, ?)", batch)
+            if cts is not None:
+                for measure, values in cts.items():
+                    measure_id = self._cts_measure_id(measure, new_measures)
+                    values = numpy.asarray(values, dtype=numpy.float64).tolist()
+                    for batch in _batches(six.moves.zip([scenario_id] * len(values), [measure_id] * len(values),
+                                                        six.moves.range(len(values)), values)):
+                        self.connection.executemany("INSERT INTO cts VALUES (?, ?, ?, ?)", batch)
+        # Measures inserted by a transaction that was rolled back don't exist
+        self._cts_measures.update(new_measures)
+        return scenario_id
+
+    def add_many(self, outputs):
+        """
+        Load results of many scenarios, e.g. batch.parse_many() results zipped with parameters
+        :param outputs: iterable of (parameters, output) pairs, see add()
+        :returns: list of scenario ids
+        """
+        return [self.add(output, parameters) for parameters, output in outputs]
+
+    def _scenario_filter(self, parameters):
+        """ SQL condition on scenario_id and its arguments, selecting scenarios with all arms in parameters """
+        if not parameters:
+            return "1", []
+        conditions = ["scenario_id IN (SELECT scenario_id FROM parameters WHERE sweep = ? AND arm = ?)"] * \
+            len(parameters)
+        arguments = []
+        for sweep, arm in sorted(parameters.items()):
+            arguments.extend((sweep, arm))
+        return " AND ".join(conditions), arguments
+
+    def scenarios(self, parameters=None):
+        """
+        :param parameters: dict {sweep name: arm name}, selects scenarios with all these arms
+        :returns: OrderedDict {scenario id: (hash, name, {sweep name: arm name})}, ordered by id
+        """
+        condition, arguments = self._scenario_filter(parameters)
+        scenarios = OrderedDict()
+        for scenario_id, scenario_hash, name in self.connection.execute(
+                "SELECT scenario_id, hash, name FROM scenarios WHERE %s ORDER BY scenario_id" % condition,
+                arguments):
+            scenarios[scenario_id] = (scenario_hash, name, {})
+        condition = "scenario_id IN (%s)" % ", ".join("?" * len(scenarios))
+        for sweep, arm, scenario_id in self.connection.execute(
+                "SELECT sweep, arm, scenario_id FROM parameters WHERE %s" % condition, list(scenarios)):
+            scenarios[scenario_id][2][sweep] = arm
+        return scenarios
+
+    def survey(self, measure, third_dimension=None, parameters=None):
+        """
+        Survey output of a measure across scenarios
+        :param third_dimension: age group, cohort or vector species. All of them if None
+        :param parameters: dict {sweep name: arm name}, selects scenarios with all these arms
+        :returns: list of (scenario id, third dimension, time, value) tuples, ordered by third dimension,
+        scenario id and time
+        """
+        condition, arguments = self._scenario_filter(parameters)
+        if third_dimension is not None:
+            condition += " AND third_dimension = ?"
+            arguments.append(third_dimension)
+        return self.connection.execute(
+            "SELECT scenario_id, third_dimension, time, value FROM survey WHERE measure = ? AND %s "
+            "ORDER BY measure, third_dimension, scenario_id, time" % condition, [measure] + arguments).fetchall()
+
+    def cts(self, measure, parameters=None):
+        """
+        Continuous output of a measure across scenarios
+        :param measure: name of the measure (column of ctsout.txt)
+        :param parameters: dict {sweep name: arm name}, selects scenarios with all these arms
+        :returns: list of (scenario id, line, value) tuples, ordered by scenario id and line
+        """
+        measure_id = self._cts_measures.get(measure)
+        if measure_id is None:
+            return []
+        condition, arguments = self._scenario_filter(parameters)
+        return self.connection.execute(
+            "SELECT scenario_id, line, value FROM cts WHERE measure_id = ? AND %s "
+            "ORDER BY measure_id, scenario_id, line" % condition, [measure_id] + arguments).fetchall()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Writers for generated scenario files: a directory (files are written by a pool of threads), a tar archive
+(optionally gzip, bzip2, xz or zstd compressed) or a zip archive, and manifests of written files.
+"""
+import abc
+import csv
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import six
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Archive file extensions: (archive format, compression)
+ARCHIVE_EXTENSIONS = OrderedDict([
+    (".tar.gz", ("tar", "gz")),
+    (".tgz", ("tar", "gz")),
+    (".tar.bz2", ("tar", "bz2")),
+    (".tar.xz", ("tar", "xz")),
+    (".tar.zst", ("tar", "zst")),
+    (".tar", ("tar", None)),
+    (".zip", ("zip", "gz")),
+])
+
+
+def archive_format(filename):
+    """
+    Archive format and compression for filename, based on its extension
+    :returns: (archive format, compression) tuple, for example ("tar", "gz") for scenarios.tar.gz
+    """
+    for extension, (format_, compression) in ARCHIVE_EXTENSIONS.items():
+        if filename.endswith(extension):
+            return format_, compression
+    raise ValueError("Unknown archive format of %s, supported extensions are %s" %
+                     (filename, ", ".join(ARCHIVE_EXTENSIONS)))
+
+
+def _encode(data):
+    if isinstance(data, six.text_type):
+        return data.encode("utf-8")
+    return data
+
+
+@six.add_metaclass(abc.ABCMeta)
+class ScenarioWriter(object):
+    """
+    Base class for scenario writers. Use as a context manager, or call close() when all files are written.
+    Subclasses implement write()
+    """
+    def __init__(self):
+        self.files = OrderedDict()
+
+    @abc.abstractmethod
+    def write(self, name, data):
+        """
+        Write file name with data (str or bytes, str is saved in utf-8)
+        """
+
+    def _add(self, name, data):
+        self.files[name] = (hashlib.sha256(data).hexdigest(), len(data))
+
+    def close(self):
+        """
+        :returns: OrderedDict {name: (sha256 hex digest, size in bytes)} of written files, in order of write() calls
+        """
+        return self.files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DirectoryWriter(ScenarioWriter):
+    """
+    Writes files to a directory using a pool of threads, so latency of a network filesystem is hidden.
+    Number of files waiting to be written is limited, so memory usage doesn't depend on the number of files.
+    """
+    def __init__(self, directory, workers=8, backlog=None):
+        super(DirectoryWriter, self).__init__()
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._pool = ThreadPool(workers)
+        self._pending = threading.BoundedSemaphore(backlog or workers * 4)
+        self._results = []
+        self._closed = False
+
+    def _write_file(self, name, data):
+        try:
+            with open(os.path.join(self.directory, name), "wb") as fp:
+                fp.write(data)
+            return hashlib.sha256(data).hexdigest(), len(data)
+        finally:
+            self._pending.release()
+
+    def write(self, name, data):
+        data = _encode(data)
+        self._pending.acquire()
+        self.files[name] = None
+        self._results.append((name, self._pool.apply_async(self._write_file, (name, data))))
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._pool.close()
+            self._pool.join()
+            # Raise the first error, if any
+            for name, result in self._results:
+                self.files[name] = result.get()
+            self._results = []
+        return self.files
+
+
+class TarWriter(ScenarioWriter):
+    """
+    Writes files to a single tar archive.
+    compression - None, "gz", "bz2", "xz" or "zst" (requires zstandard package)
+    """
+    def __init__(self, filename, compression=None):
+        super(TarWriter, self).__init__()
+        self._fp = None
+        self._stream = None
+        if compression == "zst":
+            if zstandard is None:
+                raise RuntimeError("zstandard package is required for zstd compression")
+            self._fp = open(filename, "wb")
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._fp)
+            self._tar = tarfile.open(fileobj=self._stream, mode="w|")
+        elif compression in (None, "gz", "bz2", "xz"):
+            self._tar = tarfile.open(filename, "w:%s" % (compression or ""))
+        else:
+            raise ValueError("Unsupported tar compression %s" % compression)
+        self._closed = False
+
+    def write(self, name, data):
+        data = _encode(data)
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self._tar.addfile(info, io.BytesIO(data))
+        self._add(name, data)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._tar.close()
+            if self._stream is not None:
+                self._stream.flush(zstandard.FLUSH_FRAME)
+                self._fp.close()
+        return self.files
+
+
+class ZipWriter(ScenarioWriter):
+    """
+    Writes files to a single zip archive.
+    compression - None (stored) or "gz" (deflated)
+    """
+    def __init__(self, filename, compression="gz"):
+        super(ZipWriter, self).__init__()
+        if compression not in (None, "gz"):
+            raise ValueError("Unsupported zip compression %s" % compression)
+        self._zip = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED if compression else zipfile.ZIP_STORED)
+        self._closed = False
+
+    def write(self, name, data):
+        data = _encode(data)
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = self._zip.compression
+        info.external_attr = 0o644 << 16
+        self._zip.writestr(info, data)
+        self._add(name, data)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._zip.close()
+        return self.files
+
+
+def open_writer(directory, archive=None, workers=8):
+    """
+    Create a scenario writer.
+    :param directory: output directory
+    :param archive: archive filename (relative to directory), format is chosen by extension, see ARCHIVE_EXTENSIONS.
+    Files are written to the directory if archive is not specified
+    :param workers: number of threads writing files to the directory
+    :rtype: ScenarioWriter
+    """
+    if archive is None:
+        return DirectoryWriter(directory, workers)
+    format_, compression = archive_format(archive)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    filename = os.path.join(directory, archive)
+    if format_ == "tar":
+        return TarWriter(filename, compression)
+    return ZipWriter(filename, compression)
+
+
+def write_manifest(filename, rows, fieldnames):
+    """
+    Save manifest of generated scenarios as csv or json, depending on extension of filename
+    :param rows: list of dicts, one per file
+    :param fieldnames: keys of rows, in order of csv columns
+    """
+    if filename.endswith(".json"):
+        with open(filename, "w") as fp:
+            json.dump([OrderedDict((key, row[key]) for key in fieldnames) for row in rows], fp, indent=1)
+    elif filename.endswith(".csv"):
+        with open(filename, "w") as fp:
+            writer = csv.DictWriter(fp, fieldnames=fieldnames, lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        raise ValueError("Manifest should be a .csv or .json file")
+
+
+def read_manifest(filename):
+    """
+    Load manifest saved by write_manifest
+    :returns: list of dicts, one per file. Values of csv manifest are strings, except for size
+    """
+    if filename.endswith(".json"):
+        with open(filename) as fp:
+            return json.load(fp)
+    elif filename.endswith(".csv"):
+        with open(filename) as fp:
+            rows = list(csv.DictReader(fp))
+        for row in rows:
+            if "size" in row:
+                row["size"] = int(row["size"])
+        return rows
+    raise ValueError("Manifest should be a .csv or .json file")